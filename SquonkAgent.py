@@ -0,0 +1,264 @@
+"""The SquonkAgent class is a long running process that runs jobs for thin
+   command line clients, so the cost of starting the interpreter, importing,
+   authenticating and fetching service definitions is paid once rather than
+   by every invocation.
+
+   The agent holds one authenticated Squonk object (with its pooled server
+   connection and a cache of service definitions) and listens on a Unix
+   domain socket. A client sends a request as one line of json and reads
+   one line of json back. A single poller thread checks the status of all
+   the agent's jobs and fetches their results into the directory each
+   client asked for.
+
+   Start an agent with:  pysquonk --agent
+   then run jobs with:   pysquonk --via-agent -r job.yaml
+
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+try:
+    from .utils import load_yaml
+except:
+    from utils import load_yaml
+
+# default socket the agent listens on
+DEFAULT_SOCKET = os.path.join('~', '.pysquonk', 'agent.sock')
+
+# job statuses that mean the job is still going
+active_statuses = ['PENDING', 'SUBMITTING', 'RUNNING']
+
+# failed checks of a job's status in a row before the job is given up on
+STATUS_RETRIES = 5
+
+class SquonkAgent:
+
+    def __init__(self, squonk, socket_path=DEFAULT_SOCKET, poll_interval=10, service_info_ttl=3600):
+        """
+        Create an agent.
+
+        Parameters
+        ----------
+        squonk : Squonk
+            The (authenticated) Squonk object jobs are run with
+        socket_path : str
+            The Unix domain socket to listen on
+        poll_interval : int
+            Seconds between checks of the status of running jobs
+        service_info_ttl : int
+            Seconds service definitions are cached for
+
+        """
+        self.squonk = squonk
+        self.squonk.service_info_ttl = service_info_ttl
+        self._socket_path = os.path.expanduser(socket_path)
+        self._poll_interval = poll_interval
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._server = None
+
+    def serve_forever(self):
+        """
+        Listens for requests until stopped.
+        """
+        directory = os.path.dirname(self._socket_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, mode=0o700)
+        if os.path.exists(self._socket_path):
+            # a socket left by an agent that didn't shut down cleanly
+            if agent_running(self._socket_path):
+                raise Exception('an agent is already listening on ' + self._socket_path)
+            os.remove(self._socket_path)
+
+        agent = self
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                try:
+                    response = agent.handle(json.loads(line.decode()))
+                except Exception as e:
+                    logging.exception('agent request failed')
+                    response = { 'error': str(e) }
+                self.wfile.write((json.dumps(response) + '\n').encode())
+
+        # only the user can connect, from when the socket is created
+        umask = os.umask(0o077)
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(self._socket_path, Handler)
+        finally:
+            os.umask(umask)
+        self._server.daemon_threads = True
+        poller = threading.Thread(target=self._poll, name='squonk-poller', daemon=True)
+        poller.start()
+        logging.info('Agent listening on ' + self._socket_path)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._stopping = True
+            self._wake.set()
+            self._server.server_close()
+            if os.path.exists(self._socket_path):
+                os.remove(self._socket_path)
+            self.squonk.server.close()
+
+    def stop(self):
+        """
+        Stops the agent (from another thread)
+        """
+        if self._server:
+            threading.Thread(target=self._server.shutdown).start()
+
+    def handle(self, request):
+        """
+        Handles one request, returning the response.
+
+        Requests are dicts with a command:
+          ping   - check the agent is running
+          run    - run the job defined by yaml (see _run)
+          status - the status of the agent's job job_id
+          wait   - wait for the agent's job job_id to finish
+          stop   - stop the agent
+        """
+        command = request.get('command')
+        if command == 'ping':
+            return { 'status': 'OK', 'jobs': len(self._jobs) }
+        if command == 'run':
+            return self._run(request)
+        if command == 'status':
+            job = self._jobs.get(request.get('job_id'))
+            if job is None:
+                return { 'error': 'unknown job ' + str(request.get('job_id')) }
+            return { 'job_id': request['job_id'], 'status': job['status'] }
+        if command == 'wait':
+            return self._wait(request.get('job_id'))
+        if command == 'stop':
+            self.stop()
+            return { 'status': 'STOPPING' }
+        return { 'error': 'unknown command ' + str(command) }
+
+    # run a job. The request has the yaml file name, the client's cwd
+    # (input files in the yaml are relative to it), the output dir and
+    # optionally convert ('server', 'client' or 'auto'), compress, local,
+    # delete and wait.
+    def _run(self, request):
+        cwd = request.get('cwd', os.getcwd())
+        yaml_name = os.path.join(cwd, request['yaml'])
+        job_yaml = load_yaml(yaml_name)
+        for section in ['service_name', 'options', 'inputs']:
+            if not section in job_yaml:
+                return { 'error': yaml_name + ' missing section: ' + section }
+        inputs = {}
+        for name, input_files in (job_yaml['inputs'] or {}).items():
+            inputs[name] = { key: os.path.join(cwd, file_name) for key, file_name in input_files.items() }
+
+        convert = request.get('convert', 'server')
+        compress = request.get('compress')
+        if compress is None:
+            compress = job_yaml.get('compress')
+        job_id = self.squonk.run_job(job_yaml['service_name'], job_yaml['options'] or {}, inputs,
+                                     convert_onserver='auto' if convert == 'auto' else convert == 'server',
+                                     compress=compress, local=request.get('local', False))
+        if not job_id:
+            return { 'error': 'failed to start job ' + yaml_name }
+
+        with self._lock:
+            self._jobs[job_id] = { 'status': 'SUBMITTED',
+                                   'dir': os.path.join(cwd, request.get('dir') or ''),
+                                   'delete': request.get('delete', True),
+                                   'failed_checks': 0,
+                                   'done': threading.Event() }
+        self._wake.set()
+        if request.get('wait'):
+            return self._wait(job_id)
+        return { 'job_id': job_id, 'status': 'SUBMITTED' }
+
+    def _wait(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return { 'error': 'unknown job ' + str(job_id) }
+        job['done'].wait()
+        return { 'job_id': job_id, 'status': job['status'], 'dir': job['dir'] }
+
+    # the shared poller: check every unfinished job each poll_interval,
+    # fetching the results of those that are ready. A job whose status
+    # can't be got STATUS_RETRIES times in a row finishes with the status
+    # SQUOANK_API_ERROR.
+    def _poll(self):
+        while not self._stopping:
+            self._wake.clear()
+            with self._lock:
+                jobs = [ (job_id, job) for job_id, job in self._jobs.items() if not job['done'].is_set() ]
+            for job_id, job in jobs:
+                try:
+                    status = self.squonk.job_status(job_id)
+                    if status is None:
+                        raise Exception('no status from the server')
+                    self.squonk.observe_status(job_id, status)
+                    if status == 'RESULTS_READY':
+                        self.squonk.job_results(job_id, job['dir'])
+                        if job['delete']:
+                            self.squonk.job_delete(job_id)
+                except Exception as e:
+                    job['failed_checks'] += 1
+                    logging.warning('checking job {} failed: {}'.format(job_id, e))
+                    if job['failed_checks'] < STATUS_RETRIES:
+                        continue
+                    status = 'SQUOANK_API_ERROR'
+                else:
+                    job['failed_checks'] = 0
+                job['status'] = status
+                if not status in active_statuses:
+                    logging.info('Job {} finished: {}'.format(job_id, status))
+                    self.squonk.finish_timeline(job_id, status)
+                    job['done'].set()
+            self._forget_finished()
+            self._wake.wait(self._poll_interval)
+
+    # drop finished jobs after an hour
+    def _forget_finished(self):
+        now = time.time()
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job['done'].is_set():
+                    finished = job.setdefault('finished', now)
+                    if now - finished > 3600:
+                        del self._jobs[job_id]
+
+def agent_request(request, socket_path=DEFAULT_SOCKET):
+    """
+    Sends a request to an agent, returning its response.
+
+    Parameters
+    ----------
+    request : dict
+        The request, see SquonkAgent.handle
+    socket_path : str
+        The socket the agent is listening on
+
+    Returns
+    -------
+    dict
+        The response
+
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(os.path.expanduser(socket_path))
+        s.sendall((json.dumps(request) + '\n').encode())
+        with s.makefile('rb') as f:
+            return json.loads(f.readline().decode())
+
+def agent_running(socket_path=DEFAULT_SOCKET):
+    """
+    Returns True if an agent is listening on socket_path
+    """
+    try:
+        return agent_request({ 'command': 'ping' }, socket_path).get('status') == 'OK'
+    except OSError:
+        return False
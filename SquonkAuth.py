@@ -8,13 +8,12 @@ processing you should only need to authenticate once.
 """
 
 import datetime
-import os
-import pprint
-import sys
-import urllib
-
-import requests
 import logging
+import time
+try:
+    from .SquonkTiming import AuthTiming, notify
+except:
+    from SquonkTiming import AuthTiming, notify
 
 # The version of this module.
 # Modify with every change, complying with
@@ -71,6 +70,9 @@ class SquonkAuth:
         self._refresh_token = None
         self._refresh_token_expiry = None
 
+        # called with an AuthTiming each time a token is got
+        self._observers = []
+
         logging.debug('auth_uri={} username={}'.format(self._auth_uri,
                                               self._username))
 
@@ -121,6 +123,8 @@ class SquonkAuth:
         """Gets a (new) API access token.
         """
         logging.debug('Getting a new access token...')
+        # requests is only loaded when it is needed, to keep startup fast
+        import requests
 
         headers = {'Content-Type': 'application/x-www-form-urlencoded'}
         if self._username:
@@ -155,6 +159,7 @@ class SquonkAuth:
         """Refreshes an (existing) API access token.
         """
         logging.debug('Refreshing the existing access token...')
+        import requests
 
         headers = {'Content-Type': 'application/x-www-form-urlencoded'}
         payload = {'grant_type': 'refresh_token',
@@ -209,12 +214,12 @@ class SquonkAuth:
         if remaining_refresh_time >= SquonkAuth.TOKEN_REFRESH_DEADLINE_S:
             # We should be able to refresh the existing token...
             logging.debug('Token too old, refreshing...')
-            status = self._refresh_existing_token()
+            status = self._timed('refresh', self._refresh_existing_token)
         else:
             # The refresh token is too old,
             # we need to get a new token...
             logging.debug('Refresh token too old, getting a new token...')
-            status = self._get_new_token()
+            status = self._timed('new', self._get_new_token)
 
         # Raise exception if failure
         if status:
@@ -232,7 +237,7 @@ class SquonkAuth:
         """
         logging.debug('Authenticating...')
 
-        status = self._get_new_token()
+        status = self._timed('new', self._get_new_token)
         if not status:
             raise SquonkAuthException('Unsuccessful Authentication')
 
@@ -240,3 +245,23 @@ class SquonkAuth:
 
     def get_token(self):
         return self._access_token
+
+    def add_observer(self, observer):
+        """Adds a callable to be called with an AuthTiming each time
+        a token is got or refreshed.
+        """
+        self._observers.append(observer)
+
+    def remove_observer(self, observer):
+        self._observers.remove(observer)
+
+    def _timed(self, grant, get_token):
+        """Calls get_token, telling the observers how long it took.
+        """
+        start = time.perf_counter()
+        status = False
+        try:
+            status = get_token()
+        finally:
+            notify(self._observers, AuthTiming(grant, time.perf_counter() - start, bool(status)))
+        return status
@@ -0,0 +1,193 @@
+"""The SquonkCache class memoizes the payloads produced by converting an
+   input file (mol2sdf, tosquonk) so that submitting several jobs against
+   the same input only pays the conversion cost once.
+
+   Entries are keyed on the absolute path, size and modification time of
+   the source file together with the target format, so editing or
+   replacing the file invalidates them. Payloads are held in memory,
+   evicting the least recently used entries once a byte budget is
+   exceeded, and can optionally also be written to a cache directory so
+   they survive between runs.
+
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# default in-memory budget (bytes) for converted payloads
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+class SquonkCache:
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, cache_dir=None):
+        """
+        Create a conversion cache.
+
+        Parameters
+        ----------
+        max_bytes : int
+            Maximum number of payload bytes held in memory. Least recently
+            used entries are evicted beyond this. 0 disables the memory tier.
+        cache_dir : str
+            Optional directory to also store payloads on disk.
+
+        """
+        if cache_dir:
+            cache_dir = os.path.expanduser(cache_dir)
+        self._max_bytes = max_bytes
+        self._cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    # build the cache key for a file and target format
+    def key(self, file_name, format):
+        path = os.path.abspath(file_name)
+        st = os.stat(path)
+        return (path, st.st_size, st.st_mtime_ns, format)
+
+    # name of the on disk file for a key
+    def _disk_name(self, key):
+        digest = hashlib.sha1(json.dumps(key).encode()).hexdigest()
+        return os.path.join(self._cache_dir, digest + '.cache')
+
+    def get(self, file_name, format):
+        """
+        Look up the converted payload for a file.
+
+        Parameters
+        ----------
+        file_name : str
+            Name of the source file
+        format : str
+            Target format the payload was converted to eg sdf or squonk
+
+        Returns
+        -------
+        tuple
+            The cached payload parts (bytes), or None if not cached.
+
+        """
+        key = self.key(file_name, format)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                logging.debug('cache hit: {} {}'.format(file_name, format))
+                return self._entries[key]
+
+        parts = self._read_disk(key)
+        with self._lock:
+            if parts is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._add(key, parts)
+        logging.debug('disk cache hit: {} {}'.format(file_name, format))
+        return parts
+
+    def put(self, file_name, format, parts):
+        """
+        Store the converted payload for a file.
+
+        Parameters
+        ----------
+        file_name : str
+            Name of the source file
+        format : str
+            Target format the payload was converted to eg sdf or squonk
+        parts : tuple
+            The payload parts (bytes) eg (data, meta_data)
+
+        """
+        key = self.key(file_name, format)
+        parts = tuple(parts)
+        with self._lock:
+            self._add(key, parts)
+        self._write_disk(key, parts)
+
+    def has(self, file_name, format):
+        """
+        Returns True if there is a payload for the file, without loading it
+        or counting a hit or miss.
+        """
+        key = self.key(file_name, format)
+        with self._lock:
+            if key in self._entries:
+                return True
+        return bool(self._cache_dir) and os.path.isfile(self._disk_name(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # add to the memory tier, evicting the oldest entries to fit the budget.
+    # must be called with the lock held.
+    def _add(self, key, parts):
+        size = sum(len(part) for part in parts)
+        if size > self._max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= sum(len(part) for part in self._entries.pop(key))
+        self._entries[key] = parts
+        self._bytes += size
+        while self._bytes > self._max_bytes:
+            old_key, old_parts = self._entries.popitem(last=False)
+            self._bytes -= sum(len(part) for part in old_parts)
+            logging.debug('cache evicted: ' + str(old_key))
+
+    # on disk the parts are stored as a count, then length prefixed blobs.
+    # The disk tier only saves time, so failing to write or read it is
+    # logged and otherwise ignored.
+    def _write_disk(self, key, parts):
+        if not self._cache_dir:
+            return
+        disk_name = self._disk_name(key)
+        tmp_name = None
+        try:
+            fd, tmp_name = tempfile.mkstemp(dir=self._cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(len(parts).to_bytes(4, 'big'))
+                for part in parts:
+                    f.write(len(part).to_bytes(8, 'big'))
+                    f.write(part)
+            os.replace(tmp_name, disk_name)
+        except OSError as e:
+            logging.warning('Failed to write cache file {}: {}'.format(disk_name, e))
+            if tmp_name and os.path.exists(tmp_name):
+                try:
+                    os.remove(tmp_name)
+                except OSError:
+                    pass
+
+    def _read_disk(self, key):
+        if not self._cache_dir:
+            return None
+        disk_name = self._disk_name(key)
+        if not os.path.isfile(disk_name):
+            return None
+        parts = []
+        try:
+            with open(disk_name, 'rb') as f:
+                count = int.from_bytes(f.read(4), 'big')
+                for i in range(count):
+                    size = int.from_bytes(f.read(8), 'big')
+                    part = f.read(size)
+                    if len(part) != size:
+                        logging.warning('Ignoring truncated cache file ' + disk_name)
+                        return None
+                    parts.append(part)
+        except OSError as e:
+            logging.warning('Failed to read cache file {}: {}'.format(disk_name, e))
+            return None
+        return tuple(parts)
@@ -0,0 +1,184 @@
+"""The SquonkCostModel class decides, for each mol or sdf input file, whether
+   it is quicker to upload it for conversion on the server or to convert
+   it to squonk format locally and upload the result.
+
+   The decision uses the size of the file and estimates of the upload
+   bandwidth, the local conversion throughput, the size of the converted
+   data and the gzip compression ratio. The estimates are learnt from the
+   timings of earlier uploads and conversions, which are saved to a
+   timings file (by default ~/.pysquonk/timings.json) so they carry over
+   between runs on the same machine. Jobs only record their timings when
+   they convert in auto mode, unless always_record is set. Every decision
+   is recorded along with the estimates it was based on.
+
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+# default timings file
+DEFAULT_TIMINGS_FILE = os.path.join('~', '.pysquonk', 'timings.json')
+
+# estimates used until there are measurements
+default_estimates = {
+    # upload bandwidth, bytes per second
+    'upload_bps': 1.0e6,
+    # local sdf to squonk conversion, uncompressed input bytes per second
+    'convert_bps': 10.0e6,
+    # server conversion, input bytes per second (not measurable
+    # separately from the client, so only ever the default)
+    'server_convert_bps': 20.0e6,
+    # converted squonk data size / uncompressed input size
+    'expansion': 1.3,
+    # gzipped size / uncompressed size
+    'gzip_ratio': 0.25 }
+
+# weight of a new measurement in the running averages
+SMOOTHING = 0.3
+
+class SquonkCostModel:
+
+    def __init__(self, timings_file=DEFAULT_TIMINGS_FILE, always_record=False):
+        """
+        Create a cost model, loading the timings saved by earlier runs.
+
+        Parameters
+        ----------
+        timings_file : str
+            Name of the json file the timings are kept in. None to not
+            keep them between runs.
+        always_record : bool
+            If True jobs record their timings whatever their convert mode,
+            otherwise only jobs converting in auto mode do.
+
+        """
+        self._timings_file = os.path.expanduser(timings_file) if timings_file else None
+        self.always_record = always_record
+        self._lock = threading.Lock()
+        self.estimates = dict(default_estimates)
+        self.samples = { name: 0 for name in default_estimates }
+        self.decisions = []
+        if self._timings_file and os.path.isfile(self._timings_file):
+            try:
+                with open(self._timings_file) as f:
+                    saved = json.load(f)
+                self.estimates.update(saved.get('estimates', {}))
+                self.samples.update(saved.get('samples', {}))
+            except (OSError, ValueError):
+                logging.warning('ignoring unreadable timings file: ' + self._timings_file)
+
+    def _update(self, name, value):
+        with self._lock:
+            if self.samples[name] == 0:
+                self.estimates[name] = value
+            else:
+                self.estimates[name] += SMOOTHING * (value - self.estimates[name])
+            self.samples[name] += 1
+
+    def record_upload(self, nbytes, seconds):
+        """
+        Record the time taken to upload nbytes.
+        """
+        # tiny uploads are dominated by latency, not bandwidth
+        if nbytes >= 64 * 1024 and seconds > 0:
+            self._update('upload_bps', nbytes / seconds)
+
+    def raw_size(self, file_name):
+        """
+        Returns the uncompressed size of a file, estimated from the gzip
+        ratio if it is gzipped.
+        """
+        size = os.path.getsize(file_name)
+        if file_name.endswith('.gz'):
+            return size / self.estimates['gzip_ratio']
+        return size
+
+    def record_conversion(self, bytes_in, bytes_out, seconds):
+        """
+        Record a local conversion of bytes_in of (uncompressed, see
+        raw_size) input to bytes_out of squonk data.
+        """
+        if bytes_in > 0:
+            if seconds > 0:
+                self._update('convert_bps', bytes_in / seconds)
+            self._update('expansion', bytes_out / bytes_in)
+
+    def record_compression(self, bytes_in, bytes_out):
+        """
+        Record the gzip compression of bytes_in to bytes_out.
+        """
+        if bytes_in > 0:
+            self._update('gzip_ratio', bytes_out / bytes_in)
+
+    def decide(self, file_name, compress=False, cached=False):
+        """
+        Decide where to convert a mol or sdf file.
+
+        Parameters
+        ----------
+        file_name : str
+            The input file
+        compress : bool
+            True if uncompressed uploads will be gzipped
+        cached : bool
+            True if the local conversion is already cached
+
+        Returns
+        -------
+        bool
+            True to convert on the server, False to convert locally.
+
+        """
+        est = self.estimates
+        size = os.path.getsize(file_name)
+        gzipped = file_name.endswith('.gz')
+        # work in uncompressed bytes
+        raw = self.raw_size(file_name)
+        ratio = est['gzip_ratio'] if compress else 1.0
+
+        server_upload = size if gzipped else raw * ratio
+        server_cost = server_upload / est['upload_bps'] + raw / est['server_convert_bps']
+        client_upload = raw * est['expansion'] * ratio
+        client_cost = client_upload / est['upload_bps']
+        if not cached:
+            client_cost += raw / est['convert_bps']
+
+        on_server = server_cost <= client_cost
+        decision = { 'file': file_name,
+                     'size': size,
+                     'server_seconds': server_cost,
+                     'client_seconds': client_cost,
+                     'convert': 'server' if on_server else 'client',
+                     'estimates': dict(est),
+                     'time': time.time() }
+        with self._lock:
+            self.decisions.append(decision)
+        logging.info('convert {} on {} (estimated server {:.2f}s, client {:.2f}s)'.format(
+                     file_name, decision['convert'], server_cost, client_cost))
+        return on_server
+
+    def save(self):
+        """
+        Save the timings for later runs.
+        """
+        if not self._timings_file:
+            return
+        with self._lock:
+            data = { 'estimates': self.estimates, 'samples': self.samples }
+        tmp_name = None
+        try:
+            directory = os.path.dirname(self._timings_file)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            fd, tmp_name = tempfile.mkstemp(dir=directory or '.', suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_name, self._timings_file)
+        except OSError as e:
+            logging.warning('could not save timings file: ' + str(e))
+            if tmp_name and os.path.exists(tmp_name):
+                os.remove(tmp_name)
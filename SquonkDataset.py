@@ -0,0 +1,357 @@
+"""The SquonkDataset class loads a squonk dataset (and its meta data) into
+   column oriented storage for post-processing results, eg filtering and
+   sorting on screening scores.
+
+   Each value field is held in one typed column: an array.array of ints,
+   floats or booleans with a mask of missing values, or a list of interned
+   strings (None when missing) for text and anything else. Columns are
+   returned as NumPy arrays when NumPy is installed. Only the requested
+   fields are loaded, and the molblock source of the records is only read
+   back from the file when it is asked for.
+
+"""
+
+import json
+import logging
+import math
+import sys
+from array import array
+try:
+    from .utils import sniff, open_sniffed, iter_dataset
+except:
+    from utils import sniff, open_sniffed, iter_dataset
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# column kinds for the java classes in the meta data valueClassMappings
+column_kinds = { 'java.lang.Integer': 'int',
+                 'java.lang.Long': 'int',
+                 'java.lang.Short': 'int',
+                 'java.lang.Float': 'float',
+                 'java.lang.Double': 'float',
+                 'java.lang.Boolean': 'bool' }
+
+# array.array typecodes of the column kinds, and their missing value
+typecodes = { 'int': 'q', 'float': 'd', 'bool': 'b' }
+missing_values = { 'int': 0, 'float': math.nan, 'bool': 0 }
+
+# top level keys of a record held in their own columns
+record_keys = ('uuid', 'source', 'format', 'values')
+
+class SquonkDataset:
+
+    def __init__(self, data_file, meta_file=None, fields=None, load_source=False):
+        """
+        Load a squonk dataset.
+
+        Parameters
+        ----------
+        data_file : str
+            Name of the dataset file (may be gzipped).
+        meta_file : str
+            Optional name of the meta data file. The valueClassMappings
+            are used for the column types, otherwise they are worked out
+            from the values.
+        fields : list
+            Names of the fields to load. None for all fields.
+        load_source : bool
+            If True keep the source of every record in memory, otherwise
+            it is read back from the file on request.
+
+        """
+        self._data_file = data_file
+        self._compression = sniff(data_file)[1]
+        self._fields = fields
+        self.meta_data = {}
+        if meta_file:
+            with open(meta_file) as f:
+                self.meta_data = json.load(f)
+        self.kinds = {}
+        for name, value_class in self.meta_data.get('valueClassMappings', {}).items():
+            if fields is None or name in fields:
+                self.kinds[name] = column_kinds.get(value_class, 'str')
+
+        self.uuids = []
+        # the format of each record, the order of its top level keys and
+        # of its values (shared between records with the same order) and
+        # any keys other than uuid, source, format and values, by record
+        self._formats = []
+        self._layouts = []
+        self._layout_cache = {}
+        self._extras = {}
+        self._columns = {}
+        self._missing = {}
+        self._sources = [] if load_source else None
+        # record numbers in the file, for reading back the source
+        self._rows = None
+        self._load()
+
+    def _load(self):
+        with open_sniffed(self._data_file, self._compression) as f:
+            for record in iter_dataset(f):
+                self._append(record)
+        logging.debug('loaded {} records'.format(len(self.uuids)))
+
+    def _append(self, record):
+        row = len(self.uuids)
+        self.uuids.append(record.get('uuid'))
+        format = record.get('format')
+        self._formats.append(sys.intern(format) if isinstance(format, str) else format)
+        extras = { key: value for key, value in record.items() if not key in record_keys }
+        if extras:
+            self._extras[row] = extras
+        values = record.get('values', {})
+        layout = (tuple(record), tuple(values))
+        self._layouts.append(self._layout_cache.setdefault(layout, layout))
+        if self._sources is not None:
+            self._sources.append(record.get('source'))
+        for name, value in values.items():
+            if self._fields is not None and not name in self._fields:
+                continue
+            if not name in self._columns:
+                self._new_column(name, value, row)
+            self._set(name, row, value)
+        # pad the columns this record has no value for
+        for name in self._columns:
+            if len(self._missing[name]) <= row:
+                self._set(name, row, None)
+
+    def _new_column(self, name, value, rows):
+        kind = self.kinds.get(name)
+        if kind is None:
+            kind = _kind_of(value)
+            self.kinds[name] = kind
+        if kind == 'str':
+            self._columns[name] = [None] * rows
+        else:
+            self._columns[name] = array(typecodes[kind], [missing_values[kind]]) * rows
+        self._missing[name] = bytearray(b'\x01') * rows
+
+    # append the value for row to a column, changing the column type if
+    # the value doesn't fit. Ints fit in float columns.
+    def _set(self, name, row, value):
+        kind = self.kinds[name]
+        if value is not None and kind != 'str' and _kind_of(value) != kind:
+            value_kind = _kind_of(value)
+            if kind == 'float' and value_kind == 'int':
+                value = float(value)
+            elif kind == 'int' and value_kind == 'float':
+                self._convert(name, 'float')
+            else:
+                self._convert(name, 'str')
+            kind = self.kinds[name]
+        if value is None:
+            self._columns[name].append(None if kind == 'str' else missing_values[kind])
+            self._missing[name].append(1)
+            return
+        if kind == 'str':
+            if not isinstance(value, str):
+                value = json.dumps(value)
+            value = sys.intern(value)
+        self._columns[name].append(value)
+        self._missing[name].append(0)
+
+    def _convert(self, name, kind):
+        old = self._columns[name]
+        missing = self._missing[name]
+        if kind == 'str':
+            self._columns[name] = [ None if missing[i] else sys.intern(str(value))
+                                    for i, value in enumerate(old) ]
+        else:
+            self._columns[name] = array(typecodes[kind], old)
+        self.kinds[name] = kind
+
+    def __len__(self):
+        return len(self.uuids)
+
+    @property
+    def names(self):
+        """
+        Names of the loaded fields
+        """
+        return list(self._columns.keys())
+
+    def column(self, name):
+        """
+        Returns the values of a field. A NumPy array if NumPy is installed
+        (a masked array for numeric fields with missing values), otherwise
+        an array.array for numeric fields or a list of strings.
+        """
+        values = self._columns[name]
+        if numpy is None:
+            return values
+        if self.kinds[name] == 'str':
+            return numpy.array(values, dtype=object)
+        values = numpy.frombuffer(values, dtype=numpy.dtype(typecodes[self.kinds[name]]))
+        if self.kinds[name] == 'bool':
+            values = values.astype(bool)
+        if any(self._missing[name]):
+            return numpy.ma.masked_array(values, mask=numpy.frombuffer(self._missing[name], dtype=bool))
+        return values
+
+    def missing(self, name):
+        """
+        Returns a bytearray with 1 for each record with no value for name
+        """
+        return self._missing[name]
+
+    def value(self, name, i):
+        """
+        Returns the value of field name for record i, or None if missing
+        """
+        if self._missing[name][i]:
+            return None
+        return self._columns[name][i]
+
+    def source(self, i):
+        """
+        Returns the source (eg molblock) of record i, reading it from the
+        file if the sources were not loaded.
+        """
+        if self._sources is not None:
+            return self._sources[i]
+        row = self._rows[i] if self._rows is not None else i
+        with open_sniffed(self._data_file, self._compression) as f:
+            for record in iter_dataset(f, skip=row, limit=1):
+                return record.get('source')
+
+    def sources(self):
+        """
+        Generator yielding the source of every record, in a single pass
+        over the file if they were not loaded.
+        """
+        if self._sources is not None:
+            yield from self._sources
+            return
+        wanted = self._rows if self._rows is not None else range(len(self))
+        by_row = {}
+        for i, row in enumerate(wanted):
+            by_row.setdefault(row, []).append(i)
+        found = [None] * len(self)
+        with open_sniffed(self._data_file, self._compression) as f:
+            for row, record in enumerate(iter_dataset(f, limit=max(wanted, default=-1) + 1)):
+                for i in by_row.get(row, ()):
+                    found[i] = record.get('source')
+        yield from found
+
+    def take(self, indices):
+        """
+        Returns a new SquonkDataset of the records at indices, in order.
+        """
+        indices = list(indices)
+        subset = SquonkDataset.__new__(SquonkDataset)
+        subset.__dict__.update(self.__dict__)
+        subset.kinds = dict(self.kinds)
+        subset.uuids = [self.uuids[i] for i in indices]
+        subset._formats = [self._formats[i] for i in indices]
+        subset._layouts = [self._layouts[i] for i in indices]
+        subset._extras = { n: self._extras[i] for n, i in enumerate(indices) if i in self._extras }
+        subset._columns = {}
+        subset._missing = {}
+        for name, values in self._columns.items():
+            taken = [values[i] for i in indices]
+            if self.kinds[name] != 'str':
+                taken = array(typecodes[self.kinds[name]], taken)
+            subset._columns[name] = taken
+            subset._missing[name] = bytearray(self._missing[name][i] for i in indices)
+        if self._sources is not None:
+            subset._sources = [self._sources[i] for i in indices]
+        rows = self._rows if self._rows is not None else range(len(self))
+        subset._rows = [rows[i] for i in indices]
+        return subset
+
+    def filter(self, mask):
+        """
+        Returns a new SquonkDataset of the records where mask is true.
+        mask can be a sequence of booleans or a NumPy boolean array, eg
+        dataset.filter(dataset.column('SuCOS_Score') > 0.5)
+        """
+        if numpy is not None and isinstance(mask, numpy.ndarray):
+            if isinstance(mask, numpy.ma.MaskedArray):
+                mask = mask.filled(False)
+            return self.take(numpy.flatnonzero(mask).tolist())
+        return self.take(i for i, keep in enumerate(mask) if keep)
+
+    def argsort(self, name, reverse=False):
+        """
+        Returns the record indices ordered by field name. Records missing
+        the field come last.
+        """
+        missing = self._missing[name]
+        values = self._columns[name]
+        present = [i for i in range(len(self)) if not missing[i]]
+        if numpy is not None and self.kinds[name] != 'str':
+            column = numpy.frombuffer(values, dtype=numpy.dtype(typecodes[self.kinds[name]]))
+            present = numpy.array(present, dtype=numpy.int64)
+            order = present[numpy.argsort(column[present], kind='stable')]
+            if reverse:
+                order = order[::-1]
+            order = order.tolist()
+        else:
+            order = sorted(present, key=values.__getitem__, reverse=reverse)
+        return order + [i for i in range(len(self)) if missing[i]]
+
+    def sort(self, name, reverse=False):
+        """
+        Returns a new SquonkDataset sorted by field name
+        """
+        return self.take(self.argsort(name, reverse))
+
+    def aggregate(self, name):
+        """
+        Returns a dict of the count, min, max, sum and mean of the values
+        of a numeric field, ignoring missing values.
+        """
+        if self.kinds[name] == 'str':
+            raise Exception('field {} is not numeric'.format(name))
+        missing = self._missing[name]
+        if numpy is not None:
+            values = numpy.frombuffer(self._columns[name], dtype=numpy.dtype(typecodes[self.kinds[name]]))
+            values = values[numpy.frombuffer(missing, dtype=bool) == False]
+            if len(values) == 0:
+                return { 'count': 0, 'min': None, 'max': None, 'sum': 0, 'mean': None }
+            count, low, high, total = len(values), values.min().item(), values.max().item(), values.sum().item()
+        else:
+            values = [value for i, value in enumerate(self._columns[name]) if not missing[i]]
+            if len(values) == 0:
+                return { 'count': 0, 'min': None, 'max': None, 'sum': 0, 'mean': None }
+            count, low, high, total = len(values), min(values), max(values), sum(values)
+        return { 'count': count, 'min': low, 'max': high, 'sum': total, 'mean': total / count }
+
+    def records(self):
+        """
+        Generator yielding the records as squonk record dicts, with their
+        keys (uuid, source, format, values and any others) in the order
+        they were read, eg for writing with SquonkDatasetWriter. Only the
+        loaded fields are in the values.
+        """
+        for i, source in enumerate(self.sources()):
+            keys, names = self._layouts[i]
+            values = {}
+            for name in names:
+                if name in self._columns and not self._missing[name][i]:
+                    value = self._columns[name][i]
+                    if self.kinds[name] == 'bool':
+                        value = bool(value)
+                    values[name] = value
+            parts = { 'uuid': self.uuids[i], 'source': source, 'format': self._formats[i], 'values': values }
+            parts.update(self._extras.get(i, {}))
+            record = {}
+            for key in keys:
+                # the source is left out if it wasn't loaded and can't be read
+                if key != 'source' or source is not None:
+                    record[key] = parts[key]
+            yield record
+
+# the column kind for a python value
+def _kind_of(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    return 'str'
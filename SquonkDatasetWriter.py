@@ -0,0 +1,312 @@
+"""The SquonkDatasetWriter class writes a squonk dataset (a json array of
+   records) incrementally, one record at a time, to a plain or gzipped
+   file or to any open stream such as an upload buffer.
+
+   The meta data (size, valueClassMappings, fieldMetaProps) is accumulated
+   as records are written and is produced when the writer is closed, so
+   together with utils.read_molecules a file of any size can be converted
+   in bounded memory.
+
+"""
+
+import gzip
+import io
+import json
+import logging
+import os
+from uuid import uuid1
+try:
+    from .utils import sdf_metadata, file_type, open_file
+    from .SquonkRecord import MoleculeRecord, KeyTable, iter_records
+except:
+    from utils import sdf_metadata, file_type, open_file
+    from SquonkRecord import MoleculeRecord, KeyTable, iter_records
+
+# default size (bytes) of the sdf chunks converted by each parallel task
+DEFAULT_CHUNK_BYTES = 16 * 1024 * 1024
+
+# java classes used in the valueClassMappings for python value types
+value_classes = { str: 'java.lang.String',
+                  bool: 'java.lang.Boolean',
+                  int: 'java.lang.Integer',
+                  float: 'java.lang.Float' }
+
+class SquonkDatasetWriter:
+
+    def __init__(self, out, meta_out=None, source_name=''):
+        """
+        Create a dataset writer.
+
+        Parameters
+        ----------
+        out : str or file object
+            Name of the data file to write (gzipped if it ends in .gz) or
+            an open text or binary stream.
+        meta_out : str or file object
+            Optional name of a file or stream to write the meta data to
+            when the writer is closed.
+        source_name : str
+            Name of the file the records were read from, used in the
+            meta data history.
+
+        """
+        self._own_out = isinstance(out, str)
+        if self._own_out:
+            if out.endswith('.gz'):
+                out = gzip.open(out, 'wt')
+            else:
+                out = open(out, 'w')
+        self._out = out
+        self._binary = not isinstance(out, io.TextIOBase)
+        self._meta_out = meta_out
+        self._source_name = source_name
+        self._names = {}
+        self._last_keys = None
+        self.size = 0
+        self.meta_data = None
+        self._write('[')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write(self, text):
+        if self._binary:
+            text = text.encode()
+        self._out.write(text)
+
+    def write(self, record):
+        """
+        Write one record.
+
+        Parameters
+        ----------
+        record : dict or MoleculeRecord
+            The squonk record eg with uuid, source, format and values keys
+
+        """
+        if self.size:
+            self._write(', ')
+        self.size += 1
+        if isinstance(record, MoleculeRecord):
+            self._write(record.to_json())
+            # records from one file share their KeyOrder
+            if record.keys is not self._last_keys:
+                self._last_keys = record.keys
+                for name, value in zip(record.keys.names, record.values):
+                    if not name in self._names:
+                        self._names[name] = value_classes.get(type(value), 'java.lang.String')
+            return
+        self._write(json.dumps(record))
+
+        # accumulate the value types for the meta data
+        if 'values' in record:
+            for name, value in record['values'].items():
+                if not name in self._names:
+                    self._names[name] = value_classes.get(type(value), 'java.lang.String')
+
+    def write_fragment(self, fragment, count, names):
+        """
+        Write a block of already serialized records.
+
+        Parameters
+        ----------
+        fragment : str
+            The json records separated by ', ' (no enclosing brackets)
+        count : int
+            Number of records in the fragment
+        names : dict
+            Value names in the fragment mapped to their java classes
+
+        """
+        if not count:
+            return
+        if self.size:
+            self._write(', ')
+        self._write(fragment)
+        self.size += count
+        for name, value_class in names.items():
+            if not name in self._names:
+                self._names[name] = value_class
+
+    def write_molecule(self, molblock, values):
+        """
+        Write a molecule record, as produced by utils.iter_molecules.
+        """
+        self.write({ 'uuid': str(uuid1()),
+                     'source': molblock,
+                     'format': 'mol',
+                     'values': values })
+
+    def close(self):
+        """
+        Finish the dataset, writing the meta data if a meta data
+        output was given.
+
+        Returns
+        -------
+        dict
+            The meta data
+
+        """
+        if self.meta_data is not None:
+            return self.meta_data
+        self._write(']')
+        if self._own_out:
+            self._out.close()
+        else:
+            self._out.flush()
+
+        self.meta_data = sdf_metadata(self._names.keys(), self.size, self._source_name)
+        self.meta_data['valueClassMappings'] = dict(self._names)
+        logging.debug('wrote {} records'.format(self.size))
+
+        if self._meta_out is not None:
+            meta_str = json.dumps(self.meta_data)
+            if isinstance(self._meta_out, str):
+                with open(self._meta_out, 'w') as f:
+                    f.write(meta_str)
+            elif isinstance(self._meta_out, io.TextIOBase):
+                self._meta_out.write(meta_str)
+            else:
+                self._meta_out.write(meta_str.encode())
+        return self.meta_data
+
+def write_squonk(file_name, out, meta_out=None, type=None):
+    """
+    Converts a mol or sdf file to squonk data and meta data, streaming
+    one molecule at a time.
+
+    Parameters
+    ----------
+    file_name : str
+        name of the file. if it ends in gz is assumed to be gzipped
+    out : str or file object
+        data file name or stream to write to (see SquonkDatasetWriter)
+    meta_out : str or file object
+        optional meta data file name or stream to write to
+    type : str
+        type of file 'mol' or 'sdf'. If not specified determines it from
+        the file name.
+
+    Returns
+    -------
+    dict
+        The meta data, or None if the file is of the wrong type.
+
+    """
+    if not type:
+        type = file_type(file_name)
+    if type != 'mol' and type != 'sdf':
+        logging.error('File: ' + file_name + ' is of wrong type ' + type)
+        return None
+
+    with SquonkDatasetWriter(out, meta_out, file_name) as writer:
+        with open_file(file_name) as f:
+            for record in iter_records(f, type):
+                writer.write(record)
+    return writer.meta_data
+
+def write_squonk_parallel(file_name, out, meta_out=None, workers=None, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Converts an sdf file to squonk data and meta data using a pool of
+    worker processes.
+
+    The file is split into chunks at $$$$ record boundaries, each chunk is
+    converted in a separate process and the results are written out in
+    the original order with the meta data (property names and size)
+    combined across the chunks. Uncompressed files are split into byte
+    ranges that the workers read themselves, gzipped files are split into
+    text chunks as they are decompressed.
+
+    Parameters
+    ----------
+    file_name : str
+        name of the sdf file. if it ends in gz is assumed to be gzipped
+    out : str or file object
+        data file name or stream to write to (see SquonkDatasetWriter)
+    meta_out : str or file object
+        optional meta data file name or stream to write to
+    workers : int
+        number of worker processes. Defaults to the number of cpus.
+    chunk_bytes : int
+        approximate size of the chunk converted by each task
+
+    Returns
+    -------
+    dict
+        The meta data
+
+    """
+    # multiprocessing is only loaded when it is needed, to keep startup fast
+    from concurrent.futures import ProcessPoolExecutor
+    if not workers:
+        workers = os.cpu_count()
+    if file_name.endswith('.gz'):
+        tasks = _text_chunks(file_name, chunk_bytes)
+    else:
+        tasks = _range_chunks(file_name, chunk_bytes)
+
+    # keep a bounded window of chunks in flight, writing them in order
+    window = []
+    with SquonkDatasetWriter(out, meta_out, file_name) as writer:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for task in tasks:
+                window.append(executor.submit(_convert_chunk, task))
+                if len(window) >= workers * 2:
+                    writer.write_fragment(*window.pop(0).result())
+            for future in window:
+                writer.write_fragment(*future.result())
+    return writer.meta_data
+
+# split an uncompressed sdf file into (file_name, start, end) byte ranges
+# ending just after a $$$$ line
+def _range_chunks(file_name, chunk_bytes):
+    size = os.path.getsize(file_name)
+    with open(file_name, 'rb') as f:
+        start = 0
+        while start < size:
+            # skip the rest of any partial line
+            f.seek(start + chunk_bytes - 1)
+            if f.read(1) != b'\n':
+                f.readline()
+            end = size
+            for line in f:
+                if line.startswith(b'$$$$'):
+                    end = f.tell()
+                    break
+            yield (file_name, start, end)
+            start = end
+
+# split a (gzipped) sdf file into text chunks ending with a $$$$ line
+def _text_chunks(file_name, chunk_bytes):
+    lines = []
+    length = 0
+    with open_file(file_name) as f:
+        for line in f:
+            lines.append(line)
+            length += len(line)
+            if length >= chunk_bytes and line.startswith('$$$$'):
+                yield ''.join(lines)
+                lines = []
+                length = 0
+    if lines:
+        yield ''.join(lines)
+
+# convert one chunk in a worker process, returning the serialized records,
+# the number of records and the value names
+def _convert_chunk(task):
+    if isinstance(task, tuple):
+        file_name, start, end = task
+        with open(file_name, 'rb') as f:
+            f.seek(start)
+            task = f.read(end - start).decode()
+    table = KeyTable()
+    # split into lines as iterating over the file does in write_squonk
+    # (splitlines would also split at eg \x1c or \u2028 in a value)
+    lines = io.StringIO(task, newline=None)
+    records = [record.to_json() for record in iter_records(lines, 'sdf', table)]
+    names = { name: 'java.lang.String' for name in table.names }
+    return (', '.join(records), len(records), names)
@@ -0,0 +1,490 @@
+"""A local stand-in for the Squonk job executor and its authentication
+   server, so the client can be tested and benchmarked offline (eg in CI)
+   without credentials.
+
+   SquonkFakeServer implements the token endpoint and the services,
+   jobs, job status, results and delete endpoints the client uses. The
+   service catalog is generated from the job yaml files (yaml/), with an
+   input descriptor for each input and an option descriptor, typed from
+   its value, for each option. Jobs of the services SquonkLocal can run
+   produce the same output as the real services. Other jobs return the
+   records of their first input (or a png if they have none). The latency
+   of requests, how long jobs are queued and run for, job and request
+   failures and the number of records returned are configurable.
+
+   Run it with eg:
+
+     python SquonkFakeServer.py --port 8080 --job-seconds 2 --config fake.ini
+     pysquonk -r yaml/core.dataset.filter.slice.v1.yaml   (with fake.ini as config.ini)
+
+   or in process:
+
+     server = SquonkFakeServer(job_seconds=0.1)
+     server.start()
+     squonk = Squonk(config=server.config())
+     ...
+     server.stop()
+
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from uuid import uuid4
+try:
+    from .SquonkLocal import local_service, run_local, DATA_FILE, META_FILE
+    from .utils import load_yaml, iter_dataset, open_file
+except:
+    from SquonkLocal import local_service, run_local, DATA_FILE, META_FILE
+    from utils import load_yaml, iter_dataset, open_file
+
+# paths of the token endpoint and of the REST API
+AUTH_PATH = '/auth/token'
+BASE_PATH = '/rest/v1'
+
+# the service the results of other services are made with
+ECHO_SERVICE = 'core.dataset.filter.slice.v1'
+
+# option types, by the python type of the value in the job yaml
+option_types = { bool: 'java.lang.Boolean',
+                 int: 'java.lang.Integer',
+                 float: 'java.lang.Float',
+                 str: 'java.lang.String',
+                 dict: 'org.squonk.types.NumberRange$Float' }
+
+# media types of the inputs, by the type in their metadata
+dataset_media_types = { 'org.squonk.types.MoleculeObject': 'application/x-squonk-dataset-molecule+json',
+                        'org.squonk.types.BasicObject': 'application/x-squonk-dataset-basic+json' }
+
+# a 1x1 png, the result of jobs without inputs
+PNG = bytes.fromhex('89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489'
+                    '0000000b49444154789c6360000200000500017a5eab3f0000000049454e44ae426082')
+
+def catalog_from_yaml(yaml_dir='yaml'):
+    """
+    Generates service definitions from the job yaml files in yaml_dir.
+
+    Parameters
+    ----------
+    yaml_dir : str
+        Directory of job yaml files
+
+    Returns
+    -------
+    list
+        A service definition (dict) for each service, as returned by the
+        server's services endpoint.
+
+    """
+    catalog = []
+    for yaml_name in sorted(glob.glob(os.path.join(yaml_dir, '*.yaml'))):
+        job = load_yaml(yaml_name)
+        service = job['service_name']
+        inputs = []
+        for name, input_files in (job.get('inputs') or {}).items():
+            media_type = dataset_media_types['org.squonk.types.MoleculeObject']
+            if 'meta' in input_files:
+                meta_file = os.path.join(os.path.dirname(yaml_dir) or '.', input_files['meta'])
+                if os.path.isfile(meta_file):
+                    with open(meta_file) as f:
+                        media_type = dataset_media_types.get(json.load(f).get('type'), media_type)
+            inputs.append({ 'name': name, 'label': name, 'mediaType': media_type })
+        options = []
+        for key, value in (job.get('options') or {}).items():
+            options.append({ 'key': key, 'label': key, 'minValues': 0, 'maxValues': 1,
+                             'typeDescriptor': { 'type': option_types.get(type(value), 'java.lang.String') } })
+        catalog.append({ 'id': service,
+                         'name': service,
+                         'description': 'Fake of ' + service,
+                         'inputDescriptors': inputs,
+                         'optionDescriptors': options,
+                         'outputDescriptors': [{ 'name': 'output',
+                                                 'mediaType': 'application/x-squonk-dataset-molecule+json' }] })
+    return catalog
+
+class SquonkFakeServer:
+
+    def __init__(self, catalog=None, yaml_dir='yaml', host='127.0.0.1', port=0, latency=0,
+                 queue_seconds=0, job_seconds=1, fail_rate=0, error_rate=0, result_records=None,
+                 token_seconds=300, username=None, password=None, seed=None):
+        """
+        Create a fake server (start it with start).
+
+        Parameters
+        ----------
+        catalog : list
+            Service definitions, by default generated from yaml_dir
+        yaml_dir : str
+            Directory of job yaml files the catalog is generated from
+        host : str
+            Address to listen on
+        port : int
+            Port to listen on (0 for any free port)
+        latency : float
+            Seconds added to every request
+        queue_seconds : float
+            Seconds jobs are PENDING for
+        job_seconds : float
+            Seconds jobs are RUNNING for
+        fail_rate : float
+            Fraction of jobs that finish with ERROR
+        error_rate : float
+            Fraction of REST requests answered with a 503
+        result_records : int
+            Number of records returned by the services that aren't run for
+            real, repeating the input records if there are fewer (default
+            the records of the first input)
+        token_seconds : int
+            Lifetime of access tokens
+        username, password : str
+            Credentials accepted by the token endpoint (default any)
+        seed : int
+            Seed of the failure injection
+
+        """
+        self.catalog = catalog if catalog is not None else catalog_from_yaml(yaml_dir)
+        self.latency = latency
+        self.queue_seconds = queue_seconds
+        self.job_seconds = job_seconds
+        self.fail_rate = fail_rate
+        self.error_rate = error_rate
+        self.result_records = result_records
+        self.token_seconds = token_seconds
+        self._username = username
+        self._password = password
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._jobs = {}
+        self._dir = None
+        self.requests = 0
+
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written separately, which with Nagle's
+            # algorithm delays every response by the client's delayed ack
+            disable_nagle_algorithm = True
+            def do_GET(self):
+                server._handle(self, 'get')
+            def do_POST(self):
+                server._handle(self, 'post')
+            def do_DELETE(self):
+                server._handle(self, 'delete')
+            def log_message(self, format, *args):
+                logging.debug('fake server: ' + format % args)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self.host, self.port = self._httpd.server_address[:2]
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    def start(self):
+        """
+        Serves requests from a daemon thread until stop is called.
+        """
+        self._dir = tempfile.mkdtemp(prefix='squonk-fake-')
+        threading.Thread(target=self._httpd.serve_forever, name='squonk-fake-server', daemon=True).start()
+        logging.info('Fake squonk server on ' + self.url)
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._dir:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+
+    def config(self, username='fake', password='fake'):
+        """
+        Returns the config (dict) for a Squonk object using this server.
+        """
+        return { 'base_url': self.url + BASE_PATH,
+                 'auth_url': self.url + AUTH_PATH,
+                 'username': username,
+                 'password': password,
+                 'services_endpoint': 'services/',
+                 'jobs_endpoint': 'jobs/' }
+
+    def write_config(self, file_name, username='fake', password='fake'):
+        """
+        Writes a config.ini for pysquonk using this server.
+        """
+        with open(file_name, 'w') as f:
+            f.write('[general]\nbase_url = {}\n\n'.format(self.url + BASE_PATH))
+            f.write('[token]\nclient_id = squonk-jobexecutor\nusername = {}\npassword = {}\nurl = {}\n\n'.format(
+                    username, password, self.url + AUTH_PATH))
+            f.write('[ids]\nendpoint = services/\n\n[job]\nendpoint = jobs/\n')
+
+    def _handle(self, request, method):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        body = b''
+        length = int(request.headers.get('Content-Length') or 0)
+        if length:
+            body = request.rfile.read(length)
+        path = request.path.split('?')[0]
+        try:
+            if path == AUTH_PATH and method == 'post':
+                status, content_type, content = self._token(parse_qs(body.decode()))
+            elif path.startswith(BASE_PATH + '/'):
+                status, content_type, content = self._rest(request, method, path[len(BASE_PATH) + 1:], body)
+            else:
+                status, content_type, content = _json(404, { 'error': 'not found: ' + path })
+        except Exception as e:
+            logging.exception('fake server request failed')
+            status, content_type, content = _json(500, { 'error': str(e) })
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(content)))
+        request.end_headers()
+        request.wfile.write(content)
+
+    def _token(self, form):
+        grant = form.get('grant_type', [''])[0]
+        if grant == 'password':
+            if self._username and (form.get('username', [''])[0] != self._username or
+                                   form.get('password', [''])[0] != self._password):
+                return _json(401, { 'error': 'invalid_grant' })
+        elif grant == 'refresh_token':
+            if not form.get('refresh_token', [''])[0] in self._tokens:
+                return _json(400, { 'error': 'invalid_grant' })
+        elif grant != 'client_credentials':
+            return _json(400, { 'error': 'unsupported_grant_type' })
+        access_token = 'fake-' + uuid4().hex
+        refresh_token = 'fake-refresh-' + uuid4().hex
+        expires = time.time() + self.token_seconds
+        with self._lock:
+            self._tokens[access_token] = expires
+            self._tokens[refresh_token] = expires + self.token_seconds
+        return _json(200, { 'access_token': access_token,
+                            'expires_in': self.token_seconds,
+                            'refresh_token': refresh_token,
+                            'refresh_expires_in': self.token_seconds * 2,
+                            'token_type': 'bearer' })
+
+    def _rest(self, request, method, path, body):
+        token = request.headers.get('Authorization', '').split(' ')[-1]
+        if self._tokens.get(token, 0) < time.time():
+            return _json(401, { 'error': 'invalid token' })
+        if self.error_rate and self._random.random() < self.error_rate:
+            return _json(503, { 'error': 'injected failure' })
+        segments = [segment for segment in path.split('/') if segment]
+        if segments == ['ping']:
+            return _json(200, { 'status': 'OK' })
+        if segments == ['services'] and method == 'get':
+            return _json(200, [ { key: service[key] for key in ['id', 'name', 'description'] }
+                                for service in self.catalog ])
+        if len(segments) == 2 and segments[0] == 'services' and method == 'get':
+            for service in self.catalog:
+                if service['id'] == segments[1]:
+                    return _json(200, service)
+            return _json(404, { 'error': 'unknown service ' + segments[1] })
+        if segments == ['jobs'] and method == 'get':
+            return _json(200, [ { 'jobId': job_id, 'status': self._status(job) }
+                                for job_id, job in list(self._jobs.items()) ])
+        if len(segments) == 2 and segments[0] == 'jobs':
+            if method == 'post':
+                return self._submit(segments[1], request.headers.get('Content-Type', ''), body)
+            if method == 'delete':
+                job = self._jobs.pop(segments[1], None)
+                if job is None:
+                    return _json(404, { 'error': 'unknown job ' + segments[1] })
+                shutil.rmtree(job['dir'], ignore_errors=True)
+                return _json(200, { 'jobId': segments[1], 'status': 'DELETED' })
+        if len(segments) == 3 and segments[0] == 'jobs' and method == 'get':
+            job = self._jobs.get(segments[1])
+            if job is None:
+                return _json(404, { 'error': 'unknown job ' + segments[1] })
+            if segments[2] == 'status':
+                status = self._status(job)
+                response = { 'jobId': segments[1], 'status': status }
+                if status == 'ERROR':
+                    response['events'] = [ { 'level': 'ERROR', 'message': 'injected job failure' } ]
+                return _json(200, response)
+            if segments[2] == 'results':
+                if self._status(job) != 'RESULTS_READY':
+                    return _json(409, { 'error': 'results not ready' })
+                return (200,) + job['results']
+        return _json(404, { 'error': 'not found: ' + path })
+
+    # a job's status from the time since it was submitted. It runs for at
+    # least job_seconds and until its results are made.
+    def _status(self, job):
+        elapsed = time.time() - job['submitted']
+        if elapsed < self.queue_seconds:
+            return 'PENDING'
+        if elapsed < self.queue_seconds + self.job_seconds or not job['made'].is_set():
+            return 'RUNNING'
+        return 'ERROR' if job['fail'] else 'RESULTS_READY'
+
+    # save the inputs of a job, start it and remember it. The client sends
+    # form data with its own content type, without the boundary, so the
+    # boundary is taken from the body.
+    def _submit(self, service, content_type, body):
+        if not any(definition['id'] == service for definition in self.catalog):
+            return _json(404, { 'error': 'unknown service ' + service })
+        parts = _parse_form(body)
+        options = json.loads(parts.pop('options', b'{}').decode() or '{}')
+        job_id = uuid4().hex
+        dir = os.path.join(self._dir, job_id)
+        os.makedirs(os.path.join(dir, 'inputs'))
+        inputs = {}
+        for name, content in parts.items():
+            if name.endswith('_metadata'):
+                input_name, key, suffix = name[:-len('_metadata')], 'meta', '.metadata'
+            elif name.endswith('_data'):
+                input_name, key, suffix = name[:-len('_data')], 'data', '.data'
+            else:
+                input_name, key, suffix = name, 'sdf', '.sdf'
+            file_name = os.path.join(dir, 'inputs', name + suffix)
+            with open(file_name, 'wb') as f:
+                f.write(content)
+            inputs.setdefault(input_name, {})[key] = file_name
+        job = { 'service': service,
+                'submitted': time.time(),
+                'fail': bool(self.fail_rate) and self._random.random() < self.fail_rate,
+                'dir': dir,
+                'made': threading.Event() }
+        with self._lock:
+            self._jobs[job_id] = job
+        threading.Thread(target=self._run, args=(job, options, inputs), daemon=True).start()
+        return _json(200, { 'jobId': job_id, 'status': 'PENDING' })
+
+    # make the results of a job in its dir, and the response they are sent
+    # in, so that isn't timed as part of downloading them
+    def _run(self, job, options, inputs):
+        try:
+            self._make_results(job['service'], options, inputs, job['dir'])
+            job['results'] = _multipart(job['dir'])
+        except Exception:
+            logging.exception('fake job failed')
+            job['fail'] = True
+        job['made'].set()
+
+    def _make_results(self, service, options, inputs, dir):
+        if local_service(service) and run_local(service, options, inputs, dir) is not None:
+            return
+        if not inputs:
+            with open(os.path.join(dir, 'output_output.png'), 'wb') as f:
+                f.write(PNG)
+            return
+        first = inputs[sorted(inputs)[0]]
+        meta = run_local(ECHO_SERVICE, { 'count': self.result_records }, { 'input': first }, dir)
+        if self.result_records and meta and meta['size'] < self.result_records:
+            _repeat(dir, meta, self.result_records)
+
+# a json response
+def _json(status, value):
+    return status, 'application/json', json.dumps(value).encode()
+
+# the content type and body of the multipart results in dir
+def _multipart(dir):
+    parts = []
+    for name in sorted(os.listdir(dir)):
+        file_name = os.path.join(dir, name)
+        if not os.path.isfile(file_name):
+            continue
+        with open(file_name, 'rb') as f:
+            content = f.read()
+        if name == DATA_FILE:
+            content_type = 'application/x-squonk-dataset-molecule+json'
+            content = gzip.compress(content, 1)
+        elif name == META_FILE:
+            content_type = 'application/x-squonk-dataset-metadata+json'
+        else:
+            content_type = 'image/png'
+        parts.append((name, content_type, content))
+    boundary = uuid4().hex
+    body = b''
+    for name, content_type, content in parts:
+        body += ('--{}\r\nContent-Type: {}\r\nContent-Disposition: attachment; filename={}\r\n\r\n'.format(
+                 boundary, content_type, name)).encode() + content + b'\r\n'
+    body += ('--' + boundary + '--\r\n').encode()
+    return 'multipart/mixed; boundary=' + boundary, body
+
+# the parts of multipart form data, by name
+def _parse_form(body):
+    parts = {}
+    if not body.startswith(b'--'):
+        return parts
+    boundary = body[:body.index(b'\r\n')]
+    for part in body.split(boundary)[1:]:
+        if part.startswith(b'--'):
+            break
+        headers, _, content = part[2:].partition(b'\r\n\r\n')
+        name = None
+        for header in headers.decode('latin-1').split('\r\n'):
+            if header.lower().startswith('content-disposition'):
+                for field in header.split(';'):
+                    field = field.strip()
+                    if field.startswith('name='):
+                        name = field[len('name='):].strip('"')
+        if name is not None:
+            parts[name] = content[:-2] if content.endswith(b'\r\n') else content
+    return parts
+
+# repeat the records of a dataset output to count records, with new uuids
+def _repeat(dir, meta, count):
+    data_file = os.path.join(dir, DATA_FILE)
+    with open_file(data_file) as f:
+        records = list(iter_dataset(f))
+    with open(data_file, 'w') as f:
+        f.write('[')
+        for i in range(count):
+            record = dict(records[i % len(records)])
+            record['uuid'] = str(uuid4())
+            if i:
+                f.write(',')
+            f.write(json.dumps(record, separators=(',', ':')))
+        f.write(']')
+    meta['size'] = count
+    with open(os.path.join(dir, META_FILE), 'w') as f:
+        f.write(json.dumps(meta, separators=(',', ':')))
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake Squonk job executor for offline testing')
+    parser.add_argument("--host", type=str, action="store", dest="host", help="address to listen on", default='127.0.0.1')
+    parser.add_argument("--port", type=int, action="store", dest="port", help="port to listen on", default=8080)
+    parser.add_argument("--yaml-dir", type=str, action="store", dest="yaml_dir", help="directory of job yaml files the services are made from", default='yaml')
+    parser.add_argument("--latency", type=float, action="store", dest="latency", help="seconds added to every request", default=0)
+    parser.add_argument("--queue-seconds", type=float, action="store", dest="queue_seconds", help="seconds jobs are pending for", default=0)
+    parser.add_argument("--job-seconds", type=float, action="store", dest="job_seconds", help="seconds jobs run for", default=1)
+    parser.add_argument("--fail-rate", type=float, action="store", dest="fail_rate", help="fraction of jobs that fail", default=0)
+    parser.add_argument("--error-rate", type=float, action="store", dest="error_rate", help="fraction of requests answered with a 503", default=0)
+    parser.add_argument("--result-records", type=int, action="store", dest="result_records", help="number of records returned by services that aren't run for real", default=None)
+    parser.add_argument("--config", type=str, action="store", dest="config", help="write a config.ini for pysquonk using this server", default=None)
+    parser.add_argument("-d", "--debug", action="store_true", dest="debug", help="output debug messages", default=False)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+
+    server = SquonkFakeServer(yaml_dir=args.yaml_dir, host=args.host, port=args.port, latency=args.latency,
+                              queue_seconds=args.queue_seconds, job_seconds=args.job_seconds,
+                              fail_rate=args.fail_rate, error_rate=args.error_rate,
+                              result_records=args.result_records)
+    if args.config:
+        server.write_config(args.config)
+    server.start()
+    print('{} services on {}'.format(len(server.catalog), server.url + BASE_PATH))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
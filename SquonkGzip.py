@@ -0,0 +1,150 @@
+"""The ParallelGzipWriter class gzips data written to it using a pool of
+   threads, so compressing large uploads and outputs can use all the cores
+   of the machine.
+
+   The data is cut into blocks which are compressed independently (zlib
+   releases the GIL while it works) and written out in order, each block
+   as a complete gzip member. The result is a standard multi-member gzip
+   stream that gzip, zcat, pigz and Python's gzip module read as one file.
+
+"""
+
+import io
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# default size of the independently compressed blocks
+DEFAULT_BLOCK_BYTES = 1024 * 1024
+
+# default compression level (as gzip)
+DEFAULT_LEVEL = 6
+
+class ParallelGzipWriter(io.BufferedIOBase):
+
+    def __init__(self, out, level=DEFAULT_LEVEL, threads=None, block_bytes=DEFAULT_BLOCK_BYTES):
+        """
+        Create a parallel gzip writer.
+
+        Parameters
+        ----------
+        out : str or file object
+            Name of the file to write, or an open binary stream.
+        level : int
+            Compression level 1 (fastest) to 9 (smallest).
+        threads : int
+            Number of compression threads. Defaults to the number of cpus.
+        block_bytes : int
+            Size of the blocks compressed independently.
+
+        """
+        self._own_out = isinstance(out, str)
+        if self._own_out:
+            out = open(out, 'wb')
+        self._out = out
+        self._level = level
+        self._threads = threads or os.cpu_count()
+        self._block_bytes = block_bytes
+        self._buffer = bytearray()
+        self._pending = []
+        self._executor = ThreadPoolExecutor(max_workers=self._threads)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._finished = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('write to closed ParallelGzipWriter')
+        self._buffer += data
+        while len(self._buffer) >= self._block_bytes:
+            block = bytes(self._buffer[:self._block_bytes])
+            del self._buffer[:self._block_bytes]
+            self._submit(block)
+        return len(data)
+
+    def _submit(self, block):
+        self.bytes_in += len(block)
+        self._pending.append(self._executor.submit(_compress_block, block, self._level))
+        # keep a bounded number of blocks in flight
+        while len(self._pending) > self._threads * 2:
+            self._write_block(self._pending.pop(0).result())
+
+    def _write_block(self, data):
+        self._out.write(data)
+        self.bytes_out += len(data)
+
+    def flush(self):
+        """
+        Compresses and writes out everything written so far.
+        """
+        if self._finished:
+            return
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        for future in self._pending:
+            self._write_block(future.result())
+        self._pending = []
+        self._out.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.flush()
+            # an empty input still needs a (empty) gzip member
+            if self.bytes_out == 0:
+                self._write_block(_compress_block(b'', self._level))
+        finally:
+            self._finished = True
+            self._executor.shutdown()
+            if self._own_out:
+                self._out.close()
+            super().close()
+
+# compress one block as a complete gzip member
+def _compress_block(block, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(block) + compressor.flush()
+
+def gzip_file(in_name, out, level=DEFAULT_LEVEL, threads=None, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Gzips a file using ParallelGzipWriter.
+
+    Parameters
+    ----------
+    in_name : str
+        name of the file to compress
+    out : str or file object
+        name of the file or binary stream to write the gzip data to
+    level : int
+        compression level 1 to 9
+    threads : int
+        number of compression threads, defaults to the number of cpus
+
+    Returns
+    -------
+    tuple
+        (bytes read, bytes written)
+
+    """
+    with ParallelGzipWriter(out, level, threads, block_bytes) as writer:
+        with open(in_name, 'rb') as f:
+            while True:
+                block = f.read(block_bytes)
+                if not block:
+                    break
+                writer.write(block)
+    return (writer.bytes_in, writer.bytes_out)
+
+def compress(data, level=DEFAULT_LEVEL, threads=None, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Returns data (bytes) gzipped using ParallelGzipWriter.
+    """
+    out = io.BytesIO()
+    with ParallelGzipWriter(out, level, threads, block_bytes) as writer:
+        writer.write(data)
+    return out.getvalue()
@@ -6,40 +6,59 @@
    parameters or input yaml file. 
 
 """
-import configparser
-import shutil, os
-import requests
+import os
 import json
-import yaml
 import io
+import time
 import logging as log
-from requests_toolbelt.multipart import decoder
-from email.parser import BytesParser, Parser
-from email.policy import default
-from tempfile import mkstemp
+from tempfile import SpooledTemporaryFile
 try:
     from .SquonkJobDefinition import SquonkJobDefinition
-    from .utils import tosquonk, mol2sdf
+    from .SquonkDatasetWriter import write_squonk
+    from .SquonkGzip import compress, gzip_file, DEFAULT_LEVEL
+    from .utils import mol2sdf, is_gzip, load_yaml
+    from .SquonkTiming import JobTimeline
 except:
     from SquonkJobDefinition import SquonkJobDefinition
-    from utils import tosquonk, mol2sdf
+    from SquonkDatasetWriter import write_squonk
+    from SquonkGzip import compress, gzip_file, DEFAULT_LEVEL
+    from utils import mol2sdf, is_gzip, load_yaml
+    from SquonkTiming import JobTimeline
+
+# uploads compressed on the fly are spooled in memory up to this size
+# before overflowing to a temporary file
+SPOOL_BYTES = 64 * 1024 * 1024
 
 class SquonkJob:
 
-    def __init__(self, server, service=None, options={}, inputs={}, yaml=None, end_point='jobs/'):
+    def __init__(self, server, service=None, options={}, inputs={}, yaml=None, end_point='jobs/', cache=None,
+                 gzip_level=None, gzip_threads=None, cost_model=None):
         self._server = server
+        self._cache = cache
+        # chooses where to convert inputs when convert_on_server is 'auto'
+        self._cost_model = cost_model
+        # whether the timings of this job are recorded in the cost model,
+        # set when it is started
+        self._record_timings = False
+        # compression of uploads (level None for no compression)
+        self._gzip_level = gzip_level
+        self._gzip_threads = gzip_threads
         self._service = service
         self._inputs = inputs
         self._options = options
         self._yaml = yaml
         self._end_point = end_point
         self._job_id = None
+        # bytes in/out and time for each input compressed during upload
+        self.upload_stats = []
+        # where the time of the job goes, set when it is started
+        self.timeline = None
 
     # check the inputs to the SquonkJob after instantiation
     def check_input(self):
         # if there is yaml read it, loading in:
         if self._yaml:
-            job_yaml = yaml.full_load(open(self._yaml))
+            job_yaml = load_yaml(self._yaml)
 
             # check the yaml file contains the sections we expect
             for section in ['service_name','options','inputs']:
@@ -51,6 +70,9 @@ class SquonkJob:
             if not self._options:
                 self._options = {}
             self._inputs = job_yaml['inputs']
+            # optional compression of the uploads: true or a gzip level
+            if 'compress' in job_yaml:
+                self.set_compression(job_yaml['compress'])
    
         # check we have some files or options
         if len(self._inputs)==0 and len(self._options)==0:
@@ -74,9 +96,23 @@ class SquonkJob:
         log.debug('SquonkJob: options:' + str(self._options))
         return True
 
+    # set the compression of uploads: True, False or a gzip level 1-9
+    def set_compression(self, compress, threads=None):
+        if compress is True:
+            compress = DEFAULT_LEVEL
+        self._gzip_level = compress or None
+        if threads:
+            self._gzip_threads = threads
+
     def get_service(self):
         return self._service
 
+    def get_options(self):
+        return self._options
+
+    def get_inputs(self):
+        return self._inputs
+
     def initialise(self,service_info):
         # get the service definition
         self.job_def = SquonkJobDefinition(self._service)
@@ -88,6 +124,7 @@ class SquonkJob:
         data = { 'service_name' : self._service,
                  'input_data' : self._inputs,
                  'options' : self._options }
+        import yaml
         with open(yaml_name, 'w') as outfile:
             yaml.dump(data, outfile, default_flow_style=False)
 
@@ -102,8 +139,10 @@ class SquonkJob:
 
         Parameters
         ----------
-        boolean (default - True)
-            convert_on_server
+        convert_on_server : boolean or str (default - True)
+            True to convert mol and sdf inputs on the server, False to
+            convert them on the client or 'auto' to choose for each file
+            using the cost model.
 
         Returns
         -------
@@ -112,6 +151,13 @@ class SquonkJob:
 
         """
 
+        self.timeline = JobTimeline(self._service)
+        prepare_start = time.time()
+        # the timings are only learnt from (and saved by) jobs that use
+        # them, unless the cost model always records them
+        self._record_timings = bool(self._cost_model) and \
+            (convert_on_server == 'auto' or self._cost_model.always_record)
+
         # validate the job input options against the service definition
         if not self.validate():
             log.error('Job validation failed')
@@ -146,7 +192,7 @@ class SquonkJob:
 
            if format == 'data':
                log.debug('Adding key:' + key + ' type:' + file['type'])
-               form_data[key] = ( key, open(file['data'], 'rb'), file['type'])
+               form_data[key] = ( key, self._upload_file(file['data']), file['type'])
                if 'meta_data' in file:
                    key = file['name'] + '_metadata'
                    form_data[key] = ( key, open(file['meta_data'], 'rb'), file['meta_type'])
@@ -154,37 +200,55 @@ class SquonkJob:
            # otherwise we have mol or sdf
 
            else:
+               on_server = convert_on_server
+               if on_server == 'auto':
+                   on_server = self._choose_server(file['data'], format)
+
                # conversion can be done on the server
-               if convert_on_server:
+               if on_server:
                    key = file['name']
                    file_type = 'chemical/x-mdl-sdfile'
                    log.debug('Adding key:' + key + ' type:' + file_type)
                    # mol can be converted to sdf first
                    if format == 'mol':
-                       file_data = mol2sdf(file['data'])
-                       form_data[key] = ( key, file_data, file_type)
+                       file_data, = self._convert(file['data'], format, 'sdf')
+                       form_data[key] = ( key, self._upload_bytes(file['data'], file_data), file_type)
                    # sdf can be processed directly
                    else:
-                       form_data[key] = ( key, open(file['data'], 'rb'), file_type)
+                       form_data[key] = ( key, self._upload_file(file['data']), file_type)
                else:
                    # note: client conversion not fully tested.
                    log.debug('Converting format on client:'+format)
-                   file_data, file_meta, rcode = tosquonk(file['data'], format)
-                   if rcode == 0:
-                       json_str = json.dumps(file_data)
+                   converted = self._convert(file['data'], format, 'squonk')
+                   if converted:
+                       file_data, file_meta = converted
+                       file_data = self._upload_bytes(file['data'], file_data)
                        log.debug('Adding key:' + key + ' type:' + file['type'])
-                       form_data[key] = ( key, json.dumps(file_data), file['type'])
+                       form_data[key] = ( key, file_data, file['type'])
                        if 'meta_type' in file:
                            key = file['name'] + '_metadata'
                            log.debug('Adding key:' + key + ' type:' + file['type'])
-                           json_str = json.dumps(file_meta)
-                           form_data[key] = ( key, json.dumps(file_meta), file['meta_type'])
+                           form_data[key] = ( key, file_meta, file['meta_type'])
                    else:
                        return False
 
+        if self.upload_stats:
+            bytes_in = sum(stat['bytes_in'] for stat in self.upload_stats)
+            bytes_out = sum(stat['bytes_out'] for stat in self.upload_stats)
+            seconds = sum(stat['seconds'] for stat in self.upload_stats)
+            log.info('Compressed uploads: {} bytes to {}, saved {} bytes in {:.2f}s'.format(
+                     bytes_in, bytes_out, bytes_in - bytes_out, seconds))
+
         # send the request
 #       log.debug(form_data)
+        start = time.time()
+        self.timeline.prepare_seconds = start - prepare_start
         response = self._server.send('post', self._end_point + self._service, form_data)
+        self.timeline.upload_seconds = time.time() - start
+        self.timeline.upload_bytes = _form_bytes(form_data)
+        if response and self._record_timings:
+            self._cost_model.record_upload(self.timeline.upload_bytes, self.timeline.upload_seconds)
+            self._cost_model.save()
 
         # if it worked, then get the job id
 
@@ -192,7 +256,89 @@ class SquonkJob:
             job_status = response.json()
             self._job_id = job_status['jobId']
             status = job_status['status']
+            self.timeline.job_id = self._job_id
+            self.timeline.submitted = time.time()
             log.debug("Job Status: " + str(status) + " JobID: " + self._job_id)
             return self._job_id
         else:
             return response
+
+    # convert a mol or sdf input file to sdf or squonk format, returning
+    # a tuple of the converted payload parts as bytes, or None on failure.
+    # Results are memoized in the conversion cache if there is one.
+    def _convert(self, file_name, format, target):
+        cache_format = format + '>' + target
+        if self._cache:
+            parts = self._cache.get(file_name, cache_format)
+            if parts is not None:
+                return parts
+
+        if target == 'sdf':
+            parts = ( mol2sdf(file_name).encode(), )
+        else:
+            # stream the records straight into the upload buffers
+            start = time.time()
+            data_buffer = io.BytesIO()
+            meta_buffer = io.BytesIO()
+            if write_squonk(file_name, data_buffer, meta_buffer, format) is None:
+                return None
+            parts = ( data_buffer.getvalue(), meta_buffer.getvalue() )
+            if self._record_timings:
+                # in the uncompressed units the decisions are made in
+                self._cost_model.record_conversion(self._cost_model.raw_size(file_name), len(parts[0]),
+                                                   time.time() - start)
+
+        if self._cache:
+            self._cache.put(file_name, cache_format, parts)
+        return parts
+
+    # ask the cost model whether to convert a mol or sdf file on the server
+    def _choose_server(self, file_name, format):
+        if not self._cost_model:
+            return True
+        cached = bool(self._cache) and self._cache.has(file_name, format + '>squonk')
+        return self._cost_model.decide(file_name, compress=bool(self._gzip_level), cached=cached)
+
+    # open an input file for upload, gzipping it on the fly if compression
+    # is on and the file is not already compressed.
+    def _upload_file(self, file_name):
+        f = open(file_name, 'rb')
+        if not self._gzip_level or is_gzip(f.read(2)):
+            f.seek(0)
+            return f
+        f.close()
+        start = time.time()
+        spool = SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        bytes_in, bytes_out = gzip_file(file_name, spool, self._gzip_level, self._gzip_threads)
+        spool.seek(0)
+        self._add_upload_stat(file_name, bytes_in, bytes_out, time.time() - start)
+        return spool
+
+    # gzip converted data for upload if compression is on
+    def _upload_bytes(self, file_name, data):
+        if not self._gzip_level or is_gzip(data):
+            return data
+        start = time.time()
+        compressed = compress(data, self._gzip_level, self._gzip_threads)
+        self._add_upload_stat(file_name, len(data), len(compressed), time.time() - start)
+        return compressed
+
+    def _add_upload_stat(self, file_name, bytes_in, bytes_out, seconds):
+        log.debug('compressed {} from {} to {} bytes in {:.3f}s'.format(file_name, bytes_in, bytes_out, seconds))
+        if self._record_timings:
+            self._cost_model.record_compression(bytes_in, bytes_out)
+        self.upload_stats.append({ 'file': file_name,
+                                   'bytes_in': bytes_in,
+                                   'bytes_out': bytes_out,
+                                   'seconds': seconds })
+
+# total size of the payloads of a request's form data
+def _form_bytes(form_data):
+    total = 0
+    for value in form_data.values():
+        data = value[1] if isinstance(value, tuple) else value
+        if isinstance(data, (bytes, str)):
+            total += len(data)
+        else:
+            total += data.seek(0, io.SEEK_END)
+    return total
@@ -8,15 +8,9 @@
 
 """
 
-import configparser
 import logging
-import shutil, os
-import requests
+import os
 import json
-import yaml
-from requests_toolbelt.multipart import decoder
-from email.parser import BytesParser, Parser
-from email.policy import default
 
 # Mappings from the input descriptions to what the type passed to the job
 # service should be.
@@ -55,6 +49,8 @@ class SquonkJobDefinition:
     def template(self, yaml_name, format='squonk'):
         inputs = {'inputs' : self.default_inputs(format) }
         options = self.default_options()
+        # yaml is only loaded when it is needed, to keep startup fast
+        import yaml
         with open(yaml_name, 'w') as outfile:
             outfile.write("service_name: " + self._service + "\n")
             yaml.dump(inputs, outfile, default_flow_style=False)
@@ -0,0 +1,228 @@
+"""Local execution of the simple core.dataset services, which only stream
+   records and so can be run on the client rather than making a round
+   trip (upload, queueing, polling and download) to the server.
+
+   core.dataset.filter.slice.v1 skips and counts records and
+   core.dataset.merger.v1 concatenates datasets, or merges records with the
+   same value of a field. Both write the output_output.data and
+   output_metadata files the server returns, in the same compact json.
+   Inputs can be squonk datasets (with meta data) or mol or sdf files.
+
+"""
+
+import json
+import logging
+import os
+import re
+from uuid import uuid1
+try:
+    from .utils import sniff, open_sniffed, iter_dataset, iter_molecules, sdf_metadata
+except:
+    from utils import sniff, open_sniffed, iter_dataset, iter_molecules, sdf_metadata
+
+# names of the output files, as returned by the server
+DATA_FILE = 'output_output.data'
+META_FILE = 'output_metadata'
+
+def local_service(service):
+    """
+    Returns True if service can be run locally
+    """
+    return service in local_services
+
+def run_local(service, options, inputs, dir):
+    """
+    Runs a service locally, writing its output files to dir.
+
+    Parameters
+    ----------
+    service : str
+        The service id eg core.dataset.filter.slice.v1
+    options : dict
+        The job options
+    inputs : dict
+        The job inputs, as in a job yaml file
+    dir : str
+        Directory to write the output files to.
+
+    Returns
+    -------
+    dict
+        The output meta data, or None if the service or its inputs can
+        not be handled locally (so the job should go to the server).
+
+    """
+    run = local_services.get(service)
+    if run is None:
+        return None
+    for name, input_files in inputs.items():
+        if not ('data' in input_files or 'sdf' in input_files or 'mol' in input_files):
+            logging.info('input {} can not be read locally'.format(name))
+            return None
+    return run(options or {}, inputs, dir)
+
+# the slice service: skip then count records of input
+def _slice(options, inputs, dir):
+    if not 'input' in inputs:
+        return None
+    skip = int(options.get('skip', 0) or 0)
+    count = options.get('count')
+    count = None if count is None else int(count)
+    meta, records = _read_input(inputs['input'], skip, count)
+    with _DatasetOutput(dir) as out:
+        for record in records:
+            out.write(record)
+    if meta is None:
+        meta = sdf_metadata(out.names, out.size, _input_file(inputs['input']))
+    meta['size'] = out.size
+    _write_meta(meta, dir)
+    return meta
+
+# the merger service: concatenate the inputs in order or, given a merge
+# field, merge the values of records with the same value of the field
+# (records without it are dropped), keeping the first or the last value
+# of any other field present in both.
+def _merger(options, inputs, dir):
+    merge_field = options.get('mergeFieldName')
+    keep_first = options.get('keepFirst', True)
+    if isinstance(keep_first, str):
+        keep_first = keep_first.lower() == 'true'
+
+    metas = []
+    merged = {}
+    with _DatasetOutput(dir) as out:
+        for name in sorted(inputs, key=_input_order):
+            meta, records = _read_input(inputs[name])
+            for record in records:
+                if not merge_field:
+                    out.write(record)
+                    continue
+                key = record.get('values', {}).get(merge_field)
+                if key is None:
+                    continue
+                existing = merged.get(key)
+                if existing is None:
+                    merged[key] = record
+                elif keep_first:
+                    for field, value in record.get('values', {}).items():
+                        existing['values'].setdefault(field, value)
+                else:
+                    existing['values'].update(record.get('values', {}))
+            if meta is None:
+                meta = sdf_metadata(_record_names(records), 0, _input_file(inputs[name]))
+            metas.append(meta)
+        for record in merged.values():
+            out.write(record)
+
+    meta = _merge_meta(metas)
+    meta['size'] = out.size
+    _write_meta(meta, dir)
+    return meta
+
+# inputs in the order of the number in their name eg input1, input2, ...
+def _input_order(name):
+    number = re.search(r'\d+$', name)
+    return (int(number.group()) if number else 0, name)
+
+def _input_file(input_files):
+    for key in ['data', 'sdf', 'mol']:
+        if key in input_files:
+            return input_files[key]
+
+# returns (meta data or None, iterable of records) for an input
+def _read_input(input_files, skip=0, count=None):
+    if 'data' in input_files:
+        meta = None
+        if 'meta' in input_files:
+            with open(input_files['meta']) as f:
+                meta = json.load(f)
+        return (meta, _dataset_records(input_files['data'], skip, count))
+    file_type = 'sdf' if 'sdf' in input_files else 'mol'
+    return (None, _MoleculeRecords(_input_file(input_files), file_type, skip, count))
+
+def _dataset_records(file_name, skip, count):
+    compression = sniff(file_name)[1]
+    with open_sniffed(file_name, compression) as f:
+        yield from iter_dataset(f, skip, count)
+
+# records of a mol or sdf file, noting the property names as they go
+class _MoleculeRecords:
+
+    def __init__(self, file_name, type, skip=0, count=None):
+        self.file_name = file_name
+        self.type = type
+        self.skip = skip
+        self.count = count
+        self.names = {}
+
+    def __iter__(self):
+        compression = sniff(self.file_name)[1]
+        with open_sniffed(self.file_name, compression) as f:
+            n = 0
+            for molblock, values in iter_molecules(f, self.type):
+                n += 1
+                if n <= self.skip:
+                    continue
+                if self.count is not None and n > self.skip + self.count:
+                    break
+                for name in values:
+                    self.names[name] = 1
+                yield { 'uuid': str(uuid1()),
+                        'source': molblock,
+                        'format': 'mol',
+                        'values': values }
+
+def _record_names(records):
+    return getattr(records, 'names', {}).keys()
+
+# combine the meta data of the inputs, in order
+def _merge_meta(metas):
+    meta = dict(metas[0])
+    mappings = {}
+    props = []
+    seen = set()
+    for one in metas:
+        for name, value_class in one.get('valueClassMappings', {}).items():
+            mappings.setdefault(name, value_class)
+        for prop in one.get('fieldMetaProps', []):
+            if not prop.get('fieldName') in seen:
+                seen.add(prop.get('fieldName'))
+                props.append(prop)
+    meta['valueClassMappings'] = mappings
+    meta['fieldMetaProps'] = props
+    return meta
+
+def _write_meta(meta, dir):
+    with open(os.path.join(dir, META_FILE), 'w') as f:
+        f.write(_compact(meta))
+
+def _compact(value):
+    return json.dumps(value, separators=(',', ':'))
+
+# writes the dataset output file in the server's compact json
+class _DatasetOutput:
+
+    def __init__(self, dir):
+        self._file = open(os.path.join(dir, DATA_FILE), 'w')
+        self._file.write('[')
+        self.size = 0
+        self.names = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._file.write(']')
+        self._file.close()
+
+    def write(self, record):
+        if self.size:
+            self._file.write(',')
+        self._file.write(_compact(record))
+        self.size += 1
+        for name in record.get('values', {}):
+            self.names[name] = 1
+
+# the services that can be run locally
+local_services = { 'core.dataset.filter.slice.v1': _slice,
+                   'core.dataset.merger.v1': _merger }
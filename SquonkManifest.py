@@ -0,0 +1,164 @@
+"""A manifest runs a batch of jobs from one yaml file, in one process.
+
+   A manifest is a multi-document yaml file. Each document is one of:
+   - a job, as in a job yaml file (service_name, options and inputs)
+   - a list of jobs
+   - defaults, with an optional list of jobs:
+
+       defaults:
+         service_name: core.dataset.filter.slice.v1
+         options:
+           skip: 0
+       jobs:
+         - name: first10
+           options:
+             count: 10
+           inputs:
+             input:
+               data: data/Kinase_inhibs.json.gz
+               meta: data/Kinase_inhibs.metadata
+
+   Defaults apply to the jobs after them (a later defaults document
+   replaces them) and are merged with each job, the job's values winning,
+   so eg a job only needs the options that differ. A job can also have a
+   name (used for its output directory, so it can't be a path, default
+   the service name and number of the job) and compress. Relative input
+   file names are of files in the manifest's directory if they are there,
+   or else in the current directory, as for a watched job yaml.
+
+   The jobs are run with a limit on how many run at once, and a summary of
+   how each went is reported.
+
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from .utils import load_yaml_all, resolve_input
+except:
+    from utils import load_yaml_all, resolve_input
+
+def load_manifest(file_name):
+    """
+    Reads a manifest, returning the list of jobs with the defaults merged
+    in.
+    """
+    jobs = []
+    defaults = {}
+    manifest_dir = os.path.dirname(os.path.abspath(file_name))
+    for document in load_yaml_all(file_name):
+        if document is None:
+            continue
+        if isinstance(document, list):
+            batch = document
+        elif 'defaults' in document:
+            defaults = document['defaults'] or {}
+            batch = document.get('jobs') or []
+        else:
+            batch = [document]
+        for job in batch:
+            jobs.append(_merge(defaults, job))
+
+    for number, job in enumerate(jobs, 1):
+        for section in ['service_name', 'inputs']:
+            if not section in job:
+                raise Exception('{} job {} missing section: {}'.format(file_name, number, section))
+        job.setdefault('options', {})
+        job['name'] = str(job.get('name', '{}-{}'.format(job['service_name'], number)))
+        _check_name(job['name'])
+        job['inputs'] = { name: { key: resolve_input(input_file, manifest_dir)
+                                  for key, input_file in (input_files or {}).items() }
+                          for name, input_files in (job['inputs'] or {}).items() }
+    names = [job['name'] for job in jobs]
+    if len(set(names)) != len(names):
+        raise Exception(file_name + ' has jobs with the same name')
+    return jobs
+
+# a job's name is the name of its output directory under out_dir, so it
+# can't be a path
+def _check_name(name):
+    if name in ['', '.', '..'] or '/' in name or os.sep in name or (os.altsep and os.altsep in name):
+        raise Exception('job name is not a directory name: ' + name)
+
+# merge job values over the defaults, recursively for dicts
+def _merge(defaults, job):
+    merged = dict(defaults)
+    for key, value in job.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def run_manifest(squonk, jobs, out_dir='.', concurrency=4, convert_onserver=True, local=False, wait=10):
+    """
+    Runs the jobs of a manifest, waiting for them all to finish.
+
+    Parameters
+    ----------
+    squonk : Squonk
+        The Squonk object the jobs are run with
+    jobs : list
+        The jobs, from load_manifest
+    out_dir : str
+        Directory the results of each job are written under, in a
+        directory named after the job
+    concurrency : int
+        Maximum number of jobs running at once
+    convert_onserver : boolean or str
+        Where to convert mol and sdf files (see Squonk.run_job)
+    local : boolean
+        Run simple services locally (see Squonk.run_job)
+    wait : int
+        Seconds between checks of each job's status
+
+    Returns
+    -------
+    list
+        A dict for each job of its name, service, job_id, status,
+        seconds and dir, in the order of the manifest.
+
+    """
+    for job in jobs:
+        _check_name(job['name'])
+
+    def run(job):
+        start = time.time()
+        result = { 'name': job['name'], 'service': job['service_name'], 'job_id': None,
+                   'status': 'SUBMIT_FAILED', 'dir': os.path.join(out_dir, job['name']) }
+        try:
+            if not os.path.isdir(result['dir']):
+                os.makedirs(result['dir'])
+            job_id = squonk.run_job(job['service_name'], job['options'] or {}, job['inputs'],
+                                    convert_onserver=convert_onserver, compress=job.get('compress'),
+                                    local=local)
+            if job_id:
+                result['job_id'] = job_id
+                logging.info('{} submitted as job {}'.format(job['name'], job_id))
+                result['status'] = squonk.job_wait(job_id, dir=result['dir'], sleep=wait)
+        except Exception as e:
+            logging.exception('job {} failed'.format(job['name']))
+            result['status'] = 'ERROR: ' + str(e)
+        result['seconds'] = time.time() - start
+        return result
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(run, jobs))
+
+def summary(results):
+    """
+    Returns the results of run_manifest formatted as a text table.
+    """
+    rows = [['name', 'service', 'status', 'seconds', 'job id']]
+    for result in results:
+        rows.append([result['name'], result['service'], str(result['status']),
+                     '{:.1f}'.format(result['seconds']), result['job_id'] or ''])
+    widths = [ max(len(row[i]) for row in rows) for i in range(len(rows[0])) ]
+    lines = [ '  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+              for row in rows ]
+    lines.insert(1, '  '.join('-' * width for width in widths))
+    ok = len([result for result in results if result['status'] == 'RESULTS_READY'])
+    lines.append('{} jobs: {} ok, {} failed'.format(len(results), ok, len(results) - ok))
+    return "\n".join(lines)
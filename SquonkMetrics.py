@@ -0,0 +1,242 @@
+"""Metrics of a long running client in the Prometheus text format, so its
+   throughput and saturation can be graphed.
+
+   SquonkMetrics is an observer (see SquonkTiming) counting the requests
+   to the server by endpoint and status, token refreshes, jobs by service
+   and final status, the bytes uploaded and downloaded, the jobs in flight
+   and status polls, with histograms of request, token and job times.
+   Add it to Squonk with add_observer (or the observers parameter), then
+   either serve the metrics over http for Prometheus to scrape:
+
+       metrics = SquonkMetrics()
+       squonk.add_observer(metrics)
+       metrics.serve(9464)
+
+   or write them to a file every interval, for node_exporter's textfile
+   collector:
+
+       metrics.start_textfile('/var/lib/node_exporter/textfile/squonk.prom')
+
+"""
+
+import logging
+import os
+import threading
+try:
+    from .SquonkTiming import AuthTiming, JobEvent, RequestTiming
+except:
+    from SquonkTiming import AuthTiming, JobEvent, RequestTiming
+
+# default port the metrics are served on
+DEFAULT_PORT = 9464
+
+# histogram buckets (seconds) of requests and token refreshes
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# histogram buckets (seconds) of jobs
+JOB_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600)
+
+class SquonkMetrics:
+
+    def __init__(self, prefix='squonk'):
+        """
+        Create a metrics registry.
+
+        Parameters
+        ----------
+        prefix : str
+            Prefix of the metric names
+
+        """
+        self._lock = threading.Lock()
+        self._metrics = []
+        def metric(kind, name, help, labels, buckets=None):
+            m = _Metric(kind, prefix + '_' + name, help, labels, buckets)
+            self._metrics.append(m)
+            return m
+        self.requests = metric('counter', 'requests_total', 'Requests to the server', ('method', 'endpoint', 'status'))
+        self.request_seconds = metric('histogram', 'request_seconds', 'Time taken by requests to the server',
+                                      ('method', 'endpoint'), REQUEST_BUCKETS)
+        self.request_retries = metric('counter', 'request_retries_total', 'Retries of requests to the server',
+                                      ('method', 'endpoint'))
+        self.sent_bytes = metric('counter', 'request_sent_bytes_total', 'Bytes sent to the server',
+                                 ('method', 'endpoint'))
+        self.received_bytes = metric('counter', 'request_received_bytes_total', 'Bytes received from the server',
+                                     ('method', 'endpoint'))
+        self.auth = metric('counter', 'auth_total', 'Access tokens got or refreshed', ('grant', 'ok'))
+        self.auth_seconds = metric('histogram', 'auth_seconds', 'Time taken getting access tokens',
+                                   ('grant',), REQUEST_BUCKETS)
+        self.jobs_started = metric('counter', 'jobs_started_total', 'Jobs started', ('service',))
+        self.jobs_finished = metric('counter', 'jobs_finished_total', 'Jobs finished, by final status',
+                                    ('service', 'status'))
+        self.jobs_in_flight = metric('gauge', 'jobs_in_flight', 'Jobs started and not yet finished', ('service',))
+        self.job_polls = metric('counter', 'job_polls_total', 'Job status checks', ('service',))
+        self.job_seconds = metric('histogram', 'job_seconds', 'Time from starting a job to its results being written',
+                                  ('service',), JOB_BUCKETS)
+        self.job_queue_seconds = metric('histogram', 'job_queue_seconds', 'Time jobs waited before running',
+                                        ('service',), JOB_BUCKETS)
+        self.upload_bytes = metric('counter', 'upload_bytes_total', 'Bytes of job inputs uploaded', ('service',))
+        self.download_bytes = metric('counter', 'download_bytes_total', 'Bytes of job results downloaded',
+                                     ('service',))
+        # services of the jobs in flight, by job id
+        self._in_flight = {}
+        self._server = None
+        self._stopping = threading.Event()
+
+    def __call__(self, timing):
+        with self._lock:
+            if isinstance(timing, RequestTiming):
+                key = (timing.method, timing.endpoint)
+                self.requests.inc(key + (str(timing.status),))
+                self.request_seconds.observe(key, timing.latency)
+                self.request_retries.inc(key, timing.retries)
+                self.sent_bytes.inc(key, timing.bytes_sent)
+                self.received_bytes.inc(key, timing.bytes_received)
+            elif isinstance(timing, AuthTiming):
+                self.auth.inc((timing.grant, str(timing.ok).lower()))
+                self.auth_seconds.observe((timing.grant,), timing.seconds)
+            elif isinstance(timing, JobEvent):
+                self._job_event(timing.event, timing.timeline)
+
+    def _job_event(self, event, timeline):
+        service = (timeline.service or 'unknown',)
+        if event == 'started':
+            self.jobs_started.inc(service)
+            self.upload_bytes.inc(service, timeline.upload_bytes)
+            self._in_flight[timeline.job_id] = service
+            self.jobs_in_flight.inc(service)
+        elif event == 'polled':
+            self.job_polls.inc(service)
+        elif event == 'finished':
+            self.jobs_finished.inc(service + (str(timeline.status),))
+            self.download_bytes.inc(service, timeline.download_bytes)
+            self.job_seconds.observe(service, timeline.finished - timeline.created)
+            if timeline.queue_seconds is not None:
+                self.job_queue_seconds.observe(service, timeline.queue_seconds)
+            started = self._in_flight.pop(timeline.job_id, None)
+            if started is not None:
+                self.jobs_in_flight.inc(started, -1)
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            lines = []
+            for metric in self._metrics:
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, file_name):
+        """
+        Writes the metrics to file_name, replacing it atomically so a
+        collector never reads a partly written file.
+        """
+        tmp_name = file_name + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_name, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_name, file_name)
+
+    def start_textfile(self, file_name, interval=15):
+        """
+        Rewrites the metrics file every interval seconds, from a daemon
+        thread, until stop is called.
+        """
+        def write():
+            while True:
+                try:
+                    self.write_textfile(file_name)
+                except OSError as e:
+                    logging.warning('Failed to write metrics to {}: {}'.format(file_name, e))
+                if self._stopping.wait(interval):
+                    return
+        thread = threading.Thread(target=write, name='squonk-metrics-file', daemon=True)
+        thread.start()
+        return thread
+
+    def serve(self, port=DEFAULT_PORT, host='127.0.0.1'):
+        """
+        Serves the metrics over http (any path) on host and port, from a
+        daemon thread, until stop is called.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, format, *args):
+                logging.debug('metrics: ' + format % args)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='squonk-metrics', daemon=True).start()
+        logging.info('Serving metrics on http://{}:{}/metrics'.format(host, self._server.server_address[1]))
+        return self._server.server_address[1]
+
+    def stop(self):
+        """
+        Stops serving and writing the metrics
+        """
+        self._stopping.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+# a counter, gauge or histogram with values by label values
+class _Metric:
+
+    def __init__(self, kind, name, help, labels, buckets=None):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+
+    def inc(self, label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def observe(self, label_values, value):
+        counts = self.values.get(label_values)
+        if counts is None:
+            # a count per bucket, then the +Inf count and the sum
+            counts = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        counts[-2] += 1
+        counts[-1] += value
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+        for label_values, value in sorted(self.values.items()):
+            labels = list(zip(self.labels, label_values))
+            if self.kind != 'histogram':
+                lines.append(self.name + _labels(labels) + ' ' + _number(value))
+                continue
+            for bound, count in zip(self.buckets, value):
+                lines.append(self.name + '_bucket' + _labels(labels + [('le', _number(bound))]) + ' ' + str(count))
+            lines.append(self.name + '_bucket' + _labels(labels + [('le', '+Inf')]) + ' ' + str(value[-2]))
+            lines.append(self.name + '_count' + _labels(labels) + ' ' + str(value[-2]))
+            lines.append(self.name + '_sum' + _labels(labels) + ' ' + _number(value[-1]))
+        return lines
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in labels) + '}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
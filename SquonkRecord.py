@@ -0,0 +1,144 @@
+"""The MoleculeRecord class is a compact representation of a squonk
+   molecule record, for holding large numbers of records in memory.
+
+   Instead of a dict per record plus a dict of its values, a record has
+   fixed __slots__ and keeps its values in a tuple. The property names are
+   held once, in a KeyOrder shared by every record with the same names in
+   the same order (normally every record of an sd file). The record uuid
+   is only generated when it is first used. Records serialize to exactly
+   the same squonk json as the equivalent dicts.
+
+"""
+
+import json
+import sys
+from uuid import uuid1
+try:
+    from .utils import iter_molecules
+except:
+    from utils import iter_molecules
+
+class KeyOrder:
+    """The property names of a record, in order, shared between records.
+    """
+
+    __slots__ = ('names', 'index')
+
+    def __init__(self, names):
+        self.names = tuple(sys.intern(name) for name in names)
+        self.index = { name: i for i, name in enumerate(self.names) }
+
+class KeyTable:
+    """Hands out one shared KeyOrder for each distinct order of names
+    (eg one table per file).
+    """
+
+    def __init__(self):
+        self._orders = {}
+        self.names = {}
+
+    def get(self, names):
+        names = tuple(names)
+        order = self._orders.get(names)
+        if order is None:
+            order = self._orders[names] = KeyOrder(names)
+            for name in order.names:
+                self.names[name] = 1
+        return order
+
+class MoleculeRecord:
+
+    __slots__ = ('_uuid', 'source', 'keys', 'values')
+
+    def __init__(self, source, keys, values, uuid=None):
+        """
+        Create a record.
+
+        Parameters
+        ----------
+        source : str
+            The molblock
+        keys : KeyOrder
+            The shared names of the values
+        values : tuple
+            The values, in the order of keys
+        uuid : str
+            Optional uuid, one is generated when first used otherwise.
+
+        """
+        self._uuid = uuid
+        self.source = source
+        self.keys = keys
+        self.values = values
+
+    @property
+    def uuid(self):
+        if self._uuid is None:
+            self._uuid = str(uuid1())
+        return self._uuid
+
+    def get(self, name, default=None):
+        """
+        Returns the value of property name
+        """
+        i = self.keys.index.get(name)
+        if i is None:
+            return default
+        return self.values[i]
+
+    def to_dict(self):
+        """
+        Returns the record as a squonk record dict
+        """
+        return { 'uuid': self.uuid,
+                 'source': self.source,
+                 'format': 'mol',
+                 'values': dict(zip(self.keys.names, self.values)) }
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_dict(cls, record, table=None):
+        """
+        Create a record from a squonk record dict, eg one read from a
+        squonk json data file.
+
+        Parameters
+        ----------
+        record : dict
+            The squonk record with uuid, source and values keys
+        table : KeyTable
+            table the property names are shared through. A new one is used
+            if not given.
+
+        """
+        if table is None:
+            table = KeyTable()
+        values = record.get('values', {})
+        return cls(record['source'], table.get(values.keys()), tuple(values.values()),
+                   record.get('uuid'))
+
+def iter_records(lines, type='sdf', table=None):
+    """
+    Splits mol or sdf format lines into MoleculeRecords, see
+    utils.iter_molecules.
+
+    Parameters
+    ----------
+    lines: iterable
+        lines of the file, eg an open file object or a list of strings.
+    type: str
+        type of file 'mol' or 'sdf'.
+    table: KeyTable
+        table the property names are shared through. A new one is used if
+        not given, its names are all the property names seen.
+
+    Returns
+    -------
+    Generator yielding a MoleculeRecord for each molecule.
+    """
+    if table is None:
+        table = KeyTable()
+    for molblock, values in iter_molecules(lines, type):
+        yield MoleculeRecord(molblock, table.get(values.keys()), tuple(values.values()))
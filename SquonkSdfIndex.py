@@ -0,0 +1,188 @@
+"""The SquonkSdfIndex class holds the byte offset of every record in an
+   (uncompressed) sd file, found by memory mapping the file and scanning
+   for the $$$$ record terminators.
+
+   With the index the number of records, random access to record i,
+   slices and shards of the file cost no parsing. The index can be saved
+   next to the file (<file>.idx) and is reused as long as the size and
+   modification time of the file are unchanged.
+
+"""
+
+import logging
+import mmap
+import os
+import sys
+import tempfile
+from array import array
+try:
+    from .utils import iter_molecules
+except:
+    from utils import iter_molecules
+
+# header of a saved index file
+INDEX_MAGIC = b'SQIX0001'
+
+class SquonkSdfIndex:
+
+    def __init__(self, file_name, persist=False):
+        """
+        Create the index for an sd file, loading it from <file_name>.idx
+        if that exists and is up to date.
+
+        Parameters
+        ----------
+        file_name : str
+            Name of the sd file. Gzipped files can't be indexed.
+        persist : bool
+            If True, save a newly built index to <file_name>.idx,
+            replacing a stale or corrupt one
+
+        """
+        if file_name.endswith('.gz'):
+            raise Exception('Can not index gzipped file: ' + file_name)
+        self._file_name = file_name
+        self._index_name = file_name + '.idx'
+        st = os.stat(file_name)
+        self._size = st.st_size
+        self._mtime = st.st_mtime_ns
+
+        # offsets[i] is the start of record i, the last entry is the end
+        # of the last record. A stale or corrupt saved index is rebuilt,
+        # and replaced if persist.
+        if not self._load():
+            self.offsets = self._build()
+            if persist:
+                try:
+                    self.save()
+                except OSError as e:
+                    logging.warning('Failed to save index {}: {}'.format(self._index_name, e))
+
+    # scan the mapped file for lines starting $$$$
+    def _build(self):
+        logging.debug('indexing: ' + self._file_name)
+        offsets = array('Q', [0])
+        if self._size == 0:
+            return offsets
+        with open(self._file_name, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = 0 if mm[:4] == b'$$$$' else mm.find(b'\n$$$$')
+                while pos != -1:
+                    end = mm.find(b'\n', pos + 1)
+                    end = self._size if end == -1 else end + 1
+                    offsets.append(end)
+                    pos = mm.find(b'\n$$$$', end - 1)
+                # trailing record with no terminating $$$$
+                if offsets[-1] < self._size and mm[offsets[-1]:].strip():
+                    offsets.append(self._size)
+        return offsets
+
+    # load the saved index, returning False if there isn't one or it is
+    # stale, short (eg partly written) or otherwise corrupt.
+    def _load(self):
+        if not os.path.isfile(self._index_name):
+            return False
+        try:
+            with open(self._index_name, 'rb') as f:
+                if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                    logging.debug('corrupt index: ' + self._index_name)
+                    return False
+                header = array('Q')
+                header.fromfile(f, 3)
+                if sys.byteorder != 'little':
+                    header.byteswap()
+                size, mtime, count = header
+                if size != self._size or mtime != self._mtime:
+                    logging.debug('stale index: ' + self._index_name)
+                    return False
+                if os.fstat(f.fileno()).st_size != len(INDEX_MAGIC) + header.itemsize * (3 + count):
+                    logging.debug('corrupt index: ' + self._index_name)
+                    return False
+                offsets = array('Q')
+                offsets.fromfile(f, count)
+                if sys.byteorder != 'little':
+                    offsets.byteswap()
+        except (OSError, EOFError, ValueError) as e:
+            logging.debug('corrupt index: {}: {}'.format(self._index_name, e))
+            return False
+        if count < 1 or offsets[0] != 0 or offsets[-1] > self._size:
+            logging.debug('corrupt index: ' + self._index_name)
+            return False
+        self.offsets = offsets
+        return True
+
+    def save(self):
+        """
+        Save the index to <file_name>.idx, replacing it atomically so a
+        reader never sees a partly written index.
+        """
+        header = array('Q', [self._size, self._mtime, len(self.offsets)])
+        offsets = self.offsets
+        if sys.byteorder != 'little':
+            header.byteswap()
+            offsets = array('Q', offsets)
+            offsets.byteswap()
+        fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self._index_name)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(INDEX_MAGIC)
+                header.tofile(f)
+                offsets.tofile(f)
+            os.replace(tmp_name, self._index_name)
+        except Exception:
+            os.remove(tmp_name)
+            raise
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        """
+        Returns the text of record i (including its $$$$ line), or a list
+        of records for a slice.
+        """
+        if isinstance(i, slice):
+            return [self[n] for n in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError('record index out of range')
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.read_bytes(start, end).decode()
+
+    def byte_range(self, start, stop):
+        """
+        Returns the (start, end) byte offsets of records start to stop-1
+        """
+        stop = min(stop, len(self))
+        return (self.offsets[start], self.offsets[stop])
+
+    def read_bytes(self, start, end):
+        with open(self._file_name, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def shards(self, count):
+        """
+        Splits the file into count shards of (nearly) equal numbers of
+        records.
+
+        Returns
+        -------
+        list
+            (start, end) byte offsets of each shard.
+        """
+        nrecs = len(self)
+        bounds = [nrecs * n // count for n in range(count + 1)]
+        return [self.byte_range(bounds[n], bounds[n + 1]) for n in range(count)]
+
+    def molecules(self, start=0, stop=None):
+        """
+        Generator yielding (molblock, values) for records start to stop-1,
+        see utils.iter_molecules.
+        """
+        if stop is None:
+            stop = len(self)
+        begin, end = self.byte_range(start, stop)
+        text = self.read_bytes(begin, end).decode()
+        yield from iter_molecules(text.splitlines(), 'sdf')
@@ -2,18 +2,23 @@
    the squonk base_url using the SquonkAuth class to refresh the      
    authentication token when required.
 
+   Requests go through pooled requests.Sessions, so connections to the
+   server are kept alive and reused between requests. Sessions are not
+   thread-safe, so each request takes an idle session (or a new one if
+   they are all in use) and gives it back when done. Observers are called
+   with the timing of every request (see SquonkTiming).
+
 """
 
-import requests
 import json
 import logging
-from email.policy import default
+import threading
+import time
 from collections import namedtuple
 try:
-    from .SquonkAuth import SquonkAuth
+    from .SquonkTiming import RequestTiming, endpoint_template, notify
 except:
-    from SquonkAuth import SquonkAuth
-from collections import namedtuple
+    from SquonkTiming import RequestTiming, endpoint_template, notify
 
 # The search result.
 # A namedtuple.
@@ -26,36 +31,49 @@ class SquonkException(Exception):
 
 class SquonkServer:
 
-    def __init__(self, auth, base_url):
+    def __init__(self, auth, base_url, observers=None):
 
         # general settings
         self._base_url = base_url
         self._auth = auth
+        # idle sessions
+        self._sessions = []
+        self._lock = threading.Lock()
+        # called with a RequestTiming for each request
+        self._observers = list(observers or [])
         logging.debug('SquonkServer created:'+self._base_url)
 
     # set a request
     def send(self,type,request,form_data=None):
         # Always try to refresh the access token.
         # The token is only refreshed if it is close to expiry.
-        self._auth.check_token()
-
-        token = self._auth.get_token()
+        with self._lock:
+            self._auth.check_token()
+            token = self._auth.get_token()
+            session = self._take_session()
         url = str(self._base_url + '/' + request)
         logging.debug('SEND:' + type + ' ' + url)
         response = None
-        if type == 'get':
-            headers = {'Authorization': str('bearer ' + token) }
-            response = requests.get(url, headers=headers, verify=True, allow_redirects=True)
-        else:
-            if type == 'post':
-                headers = {'Authorization': str('bearer ' + token), 'Content-Type': 'multipart/form'}
-                response = requests.post(url, files=form_data, headers = headers )
+        start = time.perf_counter()
+        try:
+            if type == 'get':
+                headers = {'Authorization': str('bearer ' + token) }
+                response = session.get(url, headers=headers, verify=True, allow_redirects=True)
             else:
-                if type == 'delete':
-                    headers = {'Authorization': str('bearer ' + token) }
-                    response = requests.delete(url, headers=headers, verify=True, allow_redirects=True)
+                if type == 'post':
+                    headers = {'Authorization': str('bearer ' + token), 'Content-Type': 'multipart/form'}
+                    response = session.post(url, files=form_data, headers = headers )
                 else:
-                    raise SquonkException('type must be get, post or delete')
+                    if type == 'delete':
+                        headers = {'Authorization': str('bearer ' + token) }
+                        response = session.delete(url, headers=headers, verify=True, allow_redirects=True)
+                    else:
+                        raise SquonkException('type must be get, post or delete')
+        finally:
+            with self._lock:
+                self._sessions.append(session)
+            if self._observers:
+                self._report(type, request, response, time.perf_counter() - start)
         status_code = response.status_code
         logging.debug('GOT response '+str(status_code))
         if not response.status_code in [200, 201]:
@@ -64,3 +82,50 @@ class SquonkServer:
             else:
                 print(response.content)
         return response
+
+    def add_observer(self, observer):
+        """
+        Adds a callable to be called with a RequestTiming for each request
+        """
+        self._observers.append(observer)
+
+    def remove_observer(self, observer):
+        self._observers.remove(observer)
+
+    # tell the observers the timing of a request (response is None if it
+    # failed)
+    def _report(self, type, request, response, latency):
+        status = bytes_sent = bytes_received = retries = 0
+        ttfb = None
+        if response is None:
+            status = None
+        else:
+            status = response.status_code
+            body = response.request.body
+            if body is not None:
+                bytes_sent = len(body)
+            bytes_received = len(response.content)
+            # requests' elapsed is the time until the headers were parsed
+            ttfb = response.elapsed.total_seconds()
+            retry = getattr(response.raw, 'retries', None)
+            if retry is not None:
+                retries = len(retry.history)
+        notify(self._observers, RequestTiming(type, endpoint_template(request), status, bytes_sent,
+                                              bytes_received, ttfb, latency, retries))
+
+    # an idle session, or a new one if they are all in use. requests is
+    # only loaded when it is needed, to keep startup fast.
+    def _take_session(self):
+        if self._sessions:
+            return self._sessions.pop()
+        import requests
+        return requests.Session()
+
+    def close(self):
+        """
+        Closes the pooled connections
+        """
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
@@ -0,0 +1,217 @@
+"""The SquonkStats class gathers statistics for any number of fields of a
+   squonk dataset or sd file in a single streaming pass over its records.
+
+   For each field it counts the records with and without a value and keeps
+   a histogram of the distinct values (up to a cap). Values that are
+   numbers, or strings that parse as numbers as sd file properties do, also
+   get their min, max and mean and quantiles. Quantiles are exact up to
+   sample_size numeric values and are estimated from a reservoir sample
+   beyond that, so memory use doesn't grow with the size of the dataset.
+
+"""
+
+import json
+import math
+import random
+try:
+    from .utils import sniff, open_sniffed, iter_dataset, iter_molecules
+except:
+    from utils import sniff, open_sniffed, iter_dataset, iter_molecules
+
+# default quantiles reported for numeric fields
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+class SquonkStats:
+
+    def __init__(self, fields=None, max_distinct=100, sample_size=10000,
+                 quantiles=DEFAULT_QUANTILES):
+        """
+        Create a statistics accumulator.
+
+        Parameters
+        ----------
+        fields : list
+            Names of the fields to gather statistics for. None for all
+            the fields found in the records.
+        max_distinct : int
+            Maximum number of distinct values kept in each histogram.
+        sample_size : int
+            Number of numeric values sampled per field for the quantiles.
+        quantiles : tuple
+            The quantiles to report (fractions between 0 and 1).
+
+        """
+        self._fields = fields
+        self._max_distinct = max_distinct
+        self._sample_size = sample_size
+        self._quantiles = quantiles
+        self._random = random.Random(0)
+        self._stats = {}
+        self.nrecs = 0
+        if fields:
+            for field in fields:
+                self._stats[field] = _FieldStats()
+
+    def add(self, values):
+        """
+        Add the values of one record.
+
+        Parameters
+        ----------
+        values : dict
+            The record values eg record['values'] of a squonk record.
+
+        """
+        self.nrecs += 1
+        if self._fields:
+            names = [field for field in self._fields if field in values]
+        else:
+            names = values.keys()
+        for name in names:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = _FieldStats()
+            self._add_value(stats, values[name])
+
+    def _add_value(self, stats, value):
+        stats.count += 1
+
+        # histogram of distinct values
+        key = value if isinstance(value, (str, int, float, bool)) else json.dumps(value)
+        if key in stats.histogram:
+            stats.histogram[key] += 1
+        elif len(stats.histogram) < self._max_distinct:
+            stats.histogram[key] = 1
+        else:
+            stats.truncated = True
+
+        # numeric summary
+        if isinstance(value, bool):
+            return
+        if isinstance(value, str):
+            try:
+                value = float(value)
+            except ValueError:
+                return
+        if not isinstance(value, (int, float)) or math.isnan(value):
+            return
+        stats.numeric += 1
+        stats.total += value
+        if stats.min is None or value < stats.min:
+            stats.min = value
+        if stats.max is None or value > stats.max:
+            stats.max = value
+        if len(stats.sample) < self._sample_size:
+            stats.sample.append(value)
+        else:
+            slot = self._random.randrange(stats.numeric)
+            if slot < self._sample_size:
+                stats.sample[slot] = value
+
+    def results(self):
+        """
+        Returns the statistics as a dict of field name to a dict of:
+        count, missing, distinct, truncated, histogram and for numeric
+        values numeric, min, max, mean, quantiles and exact (False if the
+        quantiles are estimated from a sample).
+        """
+        out = {}
+        for name, stats in self._stats.items():
+            result = { 'count': stats.count,
+                       'missing': self.nrecs - stats.count,
+                       'distinct': len(stats.histogram),
+                       'truncated': stats.truncated,
+                       'histogram': stats.histogram }
+            if stats.numeric:
+                sample = sorted(stats.sample)
+                result['numeric'] = stats.numeric
+                result['min'] = stats.min
+                result['max'] = stats.max
+                result['mean'] = stats.total / stats.numeric
+                result['quantiles'] = { str(q): _quantile(sample, q) for q in self._quantiles }
+                result['exact'] = stats.numeric <= self._sample_size
+            out[name] = result
+        return out
+
+    def to_json(self, indent=None):
+        return json.dumps({ 'nrecs': self.nrecs, 'fields': self.results() }, indent=indent)
+
+    def table(self):
+        """
+        Returns the statistics formatted as a text table.
+        """
+        quantiles = [ 'p' + '{:g}'.format(q * 100) for q in self._quantiles ]
+        header = ['field', 'count', 'missing', 'distinct', 'min', 'max', 'mean'] + quantiles
+        rows = [header]
+        for name, result in self.results().items():
+            distinct = str(result['distinct'])
+            if result['truncated']:
+                distinct = '>' + distinct
+            row = [name, str(result['count']), str(result['missing']), distinct]
+            if 'numeric' in result:
+                row += [ '{:.6g}'.format(result[key]) for key in ['min', 'max', 'mean'] ]
+                row += [ '{:.6g}'.format(value) for value in result['quantiles'].values() ]
+            else:
+                row += [''] * (3 + len(quantiles))
+            rows.append(row)
+        widths = [ max(len(row[i]) for row in rows) for i in range(len(header)) ]
+        lines = [ '  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+                  for row in rows ]
+        lines.insert(1, '  '.join('-' * width for width in widths))
+        lines.append('records: ' + str(self.nrecs))
+        return "\n".join(lines)
+
+# the running statistics for one field
+class _FieldStats:
+
+    __slots__ = ('count', 'histogram', 'truncated', 'numeric', 'total', 'min', 'max', 'sample')
+
+    def __init__(self):
+        self.count = 0
+        self.histogram = {}
+        self.truncated = False
+        self.numeric = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.sample = []
+
+# linear interpolation quantile of sorted values
+def _quantile(values, q):
+    pos = (len(values) - 1) * q
+    low = math.floor(pos)
+    high = math.ceil(pos)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+def dataset_stats(file_name, fields=None, **kwargs):
+    """
+    Gathers statistics for a squonk dataset, sdf or mol file in a single
+    pass. The file type (and compression) is worked out from its content.
+
+    Parameters
+    ----------
+    file_name : str
+        name of the file.
+    fields : list
+        names of the fields to gather statistics for, None for all.
+    kwargs :
+        other SquonkStats options
+
+    Returns
+    -------
+    SquonkStats
+        The statistics, or None if the file is not a dataset, sdf or mol.
+
+    """
+    file_type, compression = sniff(file_name)
+    stats = SquonkStats(fields, **kwargs)
+    with open_sniffed(file_name, compression) as f:
+        if file_type == 'data':
+            for record in iter_dataset(f):
+                stats.add(record.get('values', {}))
+        elif file_type == 'sdf' or file_type == 'mol':
+            for molblock, values in iter_molecules(f, file_type):
+                stats.add(values)
+        else:
+            return None
+    return stats
@@ -0,0 +1,305 @@
+"""Timing of the requests made to the squonk server and to the
+   authentication server.
+
+   SquonkServer calls its observers with a RequestTiming for every request
+   it sends and SquonkAuth calls its observers with an AuthTiming for every
+   token it gets or refreshes. An observer is any callable taking one
+   argument. TimingStats is an observer that keeps the timings in memory
+   and summarises them with percentiles, per method and endpoint.
+
+   A JobTimeline records where the time of one job went, from preparing
+   its inputs to writing its results, for Squonk.run_job and job_wait.
+   Squonk calls its observers with a JobEvent when a job is started, each
+   time its status is polled and when it finishes.
+
+"""
+
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+
+# The timing of a request to the squonk server.
+#   method         - get, post or delete
+#   endpoint       - the endpoint requested, with ids replaced by {id}
+#   status         - the http status code (None if the request failed)
+#   bytes_sent     - size of the request body
+#   bytes_received - size of the response body
+#   ttfb           - seconds until the response headers were received
+#   latency        - seconds until the whole response was received
+#   retries        - number of times the request was retried
+RequestTiming = namedtuple('RequestTiming',
+                           'method endpoint status bytes_sent bytes_received ttfb latency retries')
+
+# The timing of getting an access token.
+#   grant   - 'new' for a new token or 'refresh' for refreshing one
+#   seconds - time taken
+#   ok      - True if a token was got
+AuthTiming = namedtuple('AuthTiming', 'grant seconds ok')
+
+# Something that happened to a job.
+#   event    - 'started', 'polled' or 'finished'
+#   timeline - the JobTimeline of the job
+JobEvent = namedtuple('JobEvent', 'event timeline')
+
+# path segments that are ids: uuids or long hex strings
+_id_segment = re.compile(r'^(?:[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|[0-9a-fA-F-]{16,})$')
+
+def endpoint_template(request):
+    """
+    Returns a request path with its ids replaced by {id}, eg
+    jobs/{id}/status, so timings of the same endpoint can be grouped.
+    """
+    path = request.split('?')[0]
+    segments = [segment for segment in path.split('/') if segment]
+    return '/'.join('{id}' if _id_segment.match(segment) else segment for segment in segments)
+
+def notify(observers, timing):
+    """
+    Calls each observer with timing. An observer that fails is logged and
+    doesn't stop the others.
+    """
+    for observer in observers:
+        try:
+            observer(timing)
+        except Exception:
+            logging.exception('timing observer failed')
+
+class TimingStats:
+
+    def __init__(self, sample_size=10000):
+        """
+        Create an in-memory timing aggregator. Add it as an observer of
+        SquonkServer and SquonkAuth (or pass it to Squonk as an observer).
+
+        Parameters
+        ----------
+        sample_size : int
+            Number of latencies kept per endpoint for the percentiles,
+            beyond which they are sampled.
+
+        """
+        self._sample_size = sample_size
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._auth = {}
+
+    def __call__(self, timing):
+        if isinstance(timing, JobEvent):
+            return
+        with self._lock:
+            if isinstance(timing, AuthTiming):
+                stats = self._auth.setdefault(timing.grant, _Stats())
+                stats.count += 1
+                stats.errors += 0 if timing.ok else 1
+                self._sample(stats.latency, stats.count, timing.seconds)
+                return
+            stats = self._requests.setdefault((timing.method, timing.endpoint), _Stats())
+            stats.count += 1
+            if timing.status is None or timing.status >= 400:
+                stats.errors += 1
+            stats.statuses[timing.status] = stats.statuses.get(timing.status, 0) + 1
+            stats.bytes_sent += timing.bytes_sent
+            stats.bytes_received += timing.bytes_received
+            stats.retries += timing.retries
+            self._sample(stats.latency, stats.count, timing.latency)
+            if timing.ttfb is not None:
+                self._sample(stats.ttfb, stats.count, timing.ttfb)
+
+    # reservoir sample of values
+    def _sample(self, values, count, value):
+        if len(values) < self._sample_size:
+            values.append(value)
+        else:
+            slot = self._random.randrange(count)
+            if slot < self._sample_size:
+                values[slot] = value
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """
+        Returns a dict with 'requests', a dict of 'method endpoint' to its
+        count, errors, statuses, bytes sent and received, retries and the
+        latency and ttfb percentiles (seconds), and 'auth', a dict of
+        grant to its count, errors and latency percentiles.
+        """
+        with self._lock:
+            requests = {}
+            for (method, endpoint), stats in self._requests.items():
+                requests[method + ' ' + endpoint] = {
+                    'count': stats.count,
+                    'errors': stats.errors,
+                    'statuses': { str(status): n for status, n in stats.statuses.items() },
+                    'bytes_sent': stats.bytes_sent,
+                    'bytes_received': stats.bytes_received,
+                    'retries': stats.retries,
+                    'latency': _percentiles(stats.latency, percentiles),
+                    'ttfb': _percentiles(stats.ttfb, percentiles) }
+            auth = {}
+            for grant, stats in self._auth.items():
+                auth[grant] = { 'count': stats.count,
+                                'errors': stats.errors,
+                                'latency': _percentiles(stats.latency, percentiles) }
+        return { 'requests': requests, 'auth': auth }
+
+    def table(self, percentiles=(50, 90, 99)):
+        """
+        Returns the summary formatted as a text table, times in ms.
+        """
+        summary = self.summary(percentiles)
+        names = [ 'p' + str(p) for p in percentiles ]
+        rows = [['request', 'count', 'errors'] + names + ['ttfb p50', 'sent', 'received']]
+        for name, stats in sorted(summary['requests'].items()):
+            rows.append([name, str(stats['count']), str(stats['errors'])] +
+                        [ _ms(stats['latency'].get(p)) for p in names ] +
+                        [ _ms(stats['ttfb'].get('p50')), str(stats['bytes_sent']), str(stats['bytes_received']) ])
+        for grant, stats in sorted(summary['auth'].items()):
+            rows.append(['auth ' + grant, str(stats['count']), str(stats['errors'])] +
+                        [ _ms(stats['latency'].get(p)) for p in names ] + ['', '', ''])
+        widths = [ max(len(row[i]) for row in rows) for i in range(len(rows[0])) ]
+        lines = [ '  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+                  for row in rows ]
+        lines.insert(1, '  '.join('-' * width for width in widths))
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._requests = {}
+            self._auth = {}
+
+# the running statistics of one endpoint or grant
+class _Stats:
+
+    __slots__ = ('count', 'errors', 'statuses', 'bytes_sent', 'bytes_received', 'retries', 'latency', 'ttfb')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.statuses = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.latency = []
+        self.ttfb = []
+
+# nearest rank percentiles of values
+def _percentiles(values, percentiles):
+    if not values:
+        return {}
+    values = sorted(values)
+    out = {}
+    for p in percentiles:
+        rank = max(0, min(len(values), math.ceil(p / 100 * len(values))) - 1)
+        out['p' + str(p)] = values[rank]
+    return out
+
+def _ms(seconds):
+    if seconds is None:
+        return ''
+    return '{:.1f}'.format(seconds * 1000)
+
+# job statuses before the job runs
+queued_statuses = ['PENDING', 'SUBMITTING']
+
+class JobTimeline:
+    """The lifecycle of one job:
+       - prepare_seconds: reading, converting and compressing the inputs
+       - upload_bytes, upload_seconds: sending the job to the server
+       - submitted: (epoch) time the server accepted the job
+       - statuses: list of [status, time first seen] seen by polling
+       - queue_seconds: submitted until first seen RUNNING
+       - run_seconds: first seen RUNNING until first seen finished
+       - server_seconds: submitted until first seen finished
+       - download_bytes, download_seconds: fetching the results
+       - write_bytes, write_seconds: writing the results to disk
+       - polls: number of status checks
+       The queue and run times are only as precise as the polling
+       interval, and are None if the job was never seen RUNNING.
+    """
+
+    def __init__(self, service=None, job_id=None):
+        self.service = service
+        self.job_id = job_id
+        self.created = time.time()
+        self.prepare_seconds = 0.0
+        self.upload_bytes = 0
+        self.upload_seconds = 0.0
+        self.submitted = None
+        self.statuses = []
+        self.polls = 0
+        self.download_bytes = 0
+        self.download_seconds = 0.0
+        self.write_bytes = 0
+        self.write_seconds = 0.0
+        self.status = None
+        self.finished = None
+
+    def observe(self, status, when=None):
+        """
+        Record a polled job status
+        """
+        when = when or time.time()
+        self.polls += 1
+        if not self.statuses or self.statuses[-1][0] != status:
+            self.statuses.append([status, when])
+        self.status = status
+
+    def _first_seen(self, test):
+        for status, when in self.statuses:
+            if test(status):
+                return when
+        return None
+
+    @property
+    def queue_seconds(self):
+        running = self._first_seen(lambda status: status == 'RUNNING')
+        if running is None or self.submitted is None:
+            return None
+        return running - self.submitted
+
+    @property
+    def run_seconds(self):
+        running = self._first_seen(lambda status: status == 'RUNNING')
+        done = self._first_seen(lambda status: not status in queued_statuses + ['RUNNING'])
+        if running is None or done is None:
+            return None
+        return done - running
+
+    @property
+    def server_seconds(self):
+        done = self._first_seen(lambda status: not status in queued_statuses + ['RUNNING'])
+        if done is None or self.submitted is None:
+            return None
+        return done - self.submitted
+
+    def finish(self, status):
+        self.status = status
+        self.finished = time.time()
+
+    def to_dict(self):
+        return { 'job_id': self.job_id,
+                 'service': self.service,
+                 'status': self.status,
+                 'created': self.created,
+                 'prepare_seconds': self.prepare_seconds,
+                 'upload_bytes': self.upload_bytes,
+                 'upload_seconds': self.upload_seconds,
+                 'submitted': self.submitted,
+                 'queue_seconds': self.queue_seconds,
+                 'run_seconds': self.run_seconds,
+                 'server_seconds': self.server_seconds,
+                 'polls': self.polls,
+                 'statuses': self.statuses,
+                 'download_bytes': self.download_bytes,
+                 'download_seconds': self.download_seconds,
+                 'write_bytes': self.write_bytes,
+                 'write_seconds': self.write_seconds,
+                 'finished': self.finished,
+                 'total_seconds': (self.finished or time.time()) - self.created }
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
@@ -0,0 +1,383 @@
+"""The SquonkWatch class watches a directory for new input files and runs a
+   job for each one, for instruments and pipelines that drop files
+   continuously.
+
+   Job yaml files dropped in the directory are run as they are. Other
+   files are sniffed and sdf, mol and squonk dataset files (with their
+   .metadata file, which should be written first) are run through the
+   job of a template yaml, as its input. Up to concurrency jobs run at
+   once and the results of each go to a directory mirroring the input's
+   place in the watched tree. Every file processed is recorded in a
+   journal (json lines) in the output directory, so a file is not run
+   again when the watch is restarted.
+
+   New files are found with inotify on Linux and by polling the directory
+   tree elsewhere.
+
+"""
+
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from .utils import sniff, load_yaml, resolve_input
+except:
+    from utils import sniff, load_yaml, resolve_input
+
+# name of the journal in the output directory
+JOURNAL_NAME = '.squonk-watch.jsonl'
+
+# inotify events
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_ISDIR = 0x40000000
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# file types run through the template job
+input_types = ['sdf', 'mol', 'data']
+
+# job statuses that mean the job is still going
+active_statuses = ['PENDING', 'SUBMITTING', 'RUNNING']
+
+# files queued or running at once, per job that can run at once. Beyond
+# this new files wait to be queued, so a burst of files isn't all held in
+# memory.
+PENDING_PER_JOB = 2
+
+class SquonkWatch:
+
+    def __init__(self, squonk, watch_dir, out_dir, template=None, concurrency=4, poll_interval=2,
+                 settle=1, convert_onserver=True, local=False, wait=10, use_inotify=True):
+        """
+        Create a folder watch.
+
+        Parameters
+        ----------
+        squonk : Squonk
+            The Squonk object jobs are run with
+        watch_dir : str
+            The directory to watch (including sub directories)
+        out_dir : str
+            The directory the results are written under
+        template : str
+            Optional job yaml whose service and options are run for each
+            sdf, mol or dataset file, as its (first) input. Without it only
+            job yaml files are run.
+        concurrency : int
+            Maximum number of jobs running at once
+        poll_interval : int
+            Seconds between scans of the directory when polling
+        settle : int
+            Seconds a polled file's size must be unchanged for before it is
+            taken to be complete
+        convert_onserver : boolean or str
+            Where to convert mol and sdf files (see Squonk.run_job)
+        local : boolean
+            Run simple services locally (see Squonk.run_job)
+        wait : int
+            Seconds between checks of each job's status
+        use_inotify : boolean
+            False to always poll
+
+        """
+        self.squonk = squonk
+        self._watch_dir = os.path.abspath(watch_dir)
+        self._out_dir = os.path.abspath(out_dir)
+        self._concurrency = concurrency
+        self._poll_interval = poll_interval
+        self._settle = settle
+        self._convert_onserver = convert_onserver
+        self._local = local
+        self._wait = wait
+        self._use_inotify = use_inotify
+        self._template = load_yaml(template) if template else None
+        self._lock = threading.Lock()
+        self._seen = set()
+        # the result directories of the files run, whose files are not
+        # inputs if they are in the watched tree
+        self._result_dirs = set()
+        self._stopping = threading.Event()
+        self._pending = threading.BoundedSemaphore(concurrency * PENDING_PER_JOB)
+        self.counts = { 'submitted': 0, 'done': 0, 'failed': 0 }
+        if not os.path.isdir(self._out_dir):
+            os.makedirs(self._out_dir)
+        self._journal_name = os.path.join(self._out_dir, JOURNAL_NAME)
+        self._load_journal()
+
+    def _load_journal(self):
+        if not os.path.isfile(self._journal_name):
+            return
+        with open(self._journal_name) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                # files submitted or stopped before they finished are run again
+                if entry.get('status') in ['done', 'failed', 'skipped']:
+                    self._seen.add((entry['file'], entry['size'], entry['mtime_ns']))
+                self._result_dirs.add(self._result_dir(entry['file']))
+        logging.info('{} files already processed'.format(len(self._seen)))
+
+    def _journal(self, key, status, **values):
+        entry = { 'file': key[0], 'size': key[1], 'mtime_ns': key[2],
+                  'status': status, 'time': time.time() }
+        entry.update(values)
+        with self._lock:
+            with open(self._journal_name, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def run(self):
+        """
+        Watches the directory until stop is called (or interrupted).
+        Queued files are dropped and running jobs are left running on the
+        server, to be run again when the watch is restarted.
+        """
+        logging.info('Watching {} writing results to {}'.format(self._watch_dir, self._out_dir))
+        self._executor = ThreadPoolExecutor(max_workers=self._concurrency)
+        inotify = _Inotify.create() if self._use_inotify else None
+        try:
+            if inotify is None:
+                self._poll()
+            else:
+                self._watch(inotify)
+        finally:
+            self._stopping.set()
+            if inotify is not None:
+                inotify.close()
+            try:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            except TypeError:
+                # before python 3.9, the queued files return at once (see _process)
+                self._executor.shutdown(wait=False)
+        logging.info('Watch finished: {submitted} submitted, {done} done, {failed} failed'.format(**self.counts))
+
+    def stop(self):
+        self._stopping.set()
+
+    # the directory the results of a file (relative to the watched
+    # directory) are written to
+    def _result_dir(self, rel_name):
+        return os.path.join(self._out_dir, os.path.splitext(rel_name)[0])
+
+    # True for a directory whose files are not inputs: the output directory
+    # if it is under the watched directory (but not the watched directory
+    # itself, eg watching . with the default output directory .), and the
+    # result directories of the files run.
+    def _skip_dir(self, dir_name):
+        dir_name = os.path.abspath(dir_name)
+        if self._out_dir != self._watch_dir and _inside(self._out_dir, self._watch_dir) and \
+                _inside(dir_name, self._out_dir):
+            return True
+        while dir_name != self._watch_dir and _inside(dir_name, self._watch_dir):
+            if dir_name in self._result_dirs:
+                return True
+            dir_name = os.path.dirname(dir_name)
+        return False
+
+    # queue a file to be run, unless it is already processed or queued
+    def _offer(self, file_name):
+        if not os.path.isfile(file_name) or self._skip_dir(os.path.dirname(file_name)):
+            return
+        rel_name = os.path.relpath(file_name, self._watch_dir)
+        if os.path.basename(rel_name).startswith('.') or rel_name.endswith('.metadata'):
+            return
+        st = os.stat(file_name)
+        key = (rel_name, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if key in self._seen:
+                return
+            self._seen.add(key)
+        while not self._pending.acquire(timeout=1):
+            if self._stopping.is_set():
+                return
+        if self._stopping.is_set():
+            self._pending.release()
+            return
+        self._executor.submit(self._process, file_name, key)
+
+    # all the files in the tree
+    def _scan(self):
+        for dir_name, dirs, files in os.walk(self._watch_dir):
+            if self._skip_dir(dir_name):
+                dirs[:] = []
+                continue
+            for name in files:
+                yield os.path.join(dir_name, name)
+
+    # find new files by scanning the tree, waiting for each to stop
+    # changing size before it is run
+    def _poll(self):
+        sizes = {}
+        while not self._stopping.is_set():
+            now = time.time()
+            for file_name in self._scan():
+                try:
+                    st = os.stat(file_name)
+                except OSError:
+                    continue
+                last = sizes.get(file_name)
+                if last is None or last[0] != (st.st_size, st.st_mtime_ns):
+                    sizes[file_name] = ((st.st_size, st.st_mtime_ns), now)
+                elif now - last[1] >= self._settle and now - st.st_mtime >= self._settle:
+                    self._offer(file_name)
+            self._stopping.wait(self._poll_interval)
+
+    # find new files with inotify: a file is complete when it is closed
+    # after writing or moved into the tree
+    def _watch(self, inotify):
+        dirs = {}
+        def add_dir(dir_name):
+            wd = inotify.add_watch(dir_name)
+            if wd >= 0:
+                dirs[wd] = dir_name
+        for dir_name, subdirs, files in os.walk(self._watch_dir):
+            if self._skip_dir(dir_name):
+                subdirs[:] = []
+                continue
+            add_dir(dir_name)
+        # files that were there before the watch started
+        for file_name in self._scan():
+            self._offer(file_name)
+
+        while not self._stopping.is_set():
+            ready, _, _ = select.select([inotify.fd], [], [], 1)
+            if not ready:
+                continue
+            data = os.read(inotify.fd, 64 * 1024)
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, length = struct.unpack_from('iIII', data, pos)
+                name = data[pos + 16:pos + 16 + length].rstrip(b'\0').decode()
+                pos += 16 + length
+                if mask & IN_Q_OVERFLOW:
+                    # events were lost, fall back to a scan
+                    for file_name in self._scan():
+                        self._offer(file_name)
+                    continue
+                if not wd in dirs:
+                    continue
+                path = os.path.join(dirs[wd], name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and not self._skip_dir(path):
+                        add_dir(path)
+                        # files written before the watch was added
+                        for dir_name, subdirs, files in os.walk(path):
+                            subdirs[:] = [sub for sub in subdirs if not self._skip_dir(os.path.join(dir_name, sub))]
+                            for sub in subdirs:
+                                add_dir(os.path.join(dir_name, sub))
+                            for file_name in files:
+                                self._offer(os.path.join(dir_name, file_name))
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    self._offer(path)
+
+    # run the job for one file and fetch its results
+    def _process(self, file_name, key):
+        try:
+            if self._stopping.is_set():
+                return
+            try:
+                job_id, status = self._run_file(file_name, key)
+            except Exception as e:
+                logging.exception('processing {} failed'.format(file_name))
+                job_id, status = None, 'ERROR: ' + str(e)
+        finally:
+            self._pending.release()
+        if job_id is None and status == 'skipped':
+            self._journal(key, 'skipped')
+            return
+        if status in active_statuses:
+            # stopped while the job was running
+            self._journal(key, 'stopped', job_id=job_id, job_status=status)
+            return
+        result = 'done' if status == 'RESULTS_READY' else 'failed'
+        with self._lock:
+            self.counts[result] += 1
+        self._journal(key, result, job_id=job_id, job_status=status)
+
+    def _run_file(self, file_name, key):
+        out_dir = self._result_dir(key[0])
+        with self._lock:
+            self._result_dirs.add(out_dir)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        if file_name.endswith('.yaml') or file_name.endswith('.yml'):
+            job_yaml = load_yaml(file_name)
+            inputs = {}
+            for name, input_files in (job_yaml.get('inputs') or {}).items():
+                inputs[name] = { k: resolve_input(v, os.path.dirname(file_name)) for k, v in input_files.items() }
+        elif self._template:
+            file_type = sniff(file_name)[0]
+            if not file_type in input_types:
+                logging.info('ignoring {} ({})'.format(file_name, file_type))
+                return (None, 'skipped')
+            job_yaml = self._template
+            input_name = next(iter(job_yaml.get('inputs') or { 'input': None }))
+            input_files = { file_type: file_name }
+            meta_file = _meta_file(file_name)
+            if file_type == 'data' and meta_file:
+                input_files['meta'] = meta_file
+            inputs = { input_name: input_files }
+        else:
+            return (None, 'skipped')
+
+        with self._lock:
+            self.counts['submitted'] += 1
+        self._journal(key, 'submitted')
+        job_id = self.squonk.run_job(job_yaml['service_name'], job_yaml.get('options') or {}, inputs,
+                                     convert_onserver=self._convert_onserver, local=self._local)
+        if not job_id:
+            return (None, 'SUBMIT_FAILED')
+        logging.info('{} submitted as job {}'.format(key[0], job_id))
+        status = self.squonk.job_wait(job_id, dir=out_dir, sleep=self._wait, stop=self._stopping)
+        return (job_id, status)
+
+# True if path is dir_name or in it
+def _inside(path, dir_name):
+    return os.path.commonpath([path, dir_name]) == dir_name
+
+# the .metadata file of a dataset file eg x.metadata for x.data.gz
+def _meta_file(file_name):
+    base = file_name
+    while '.' in os.path.basename(base):
+        base = os.path.splitext(base)[0]
+        if os.path.isfile(base + '.metadata'):
+            return base + '.metadata'
+    return None
+
+# a minimal inotify binding through ctypes
+class _Inotify:
+
+    def __init__(self, libc, fd):
+        self._libc = libc
+        self.fd = fd
+
+    # start inotify, returning None if it is not available
+    @staticmethod
+    def create():
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init()
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return _Inotify(libc, fd)
+
+    def add_watch(self, dir_name):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dir_name), WATCH_MASK)
+        if wd < 0:
+            logging.warning('can not watch {}: {}'.format(dir_name, os.strerror(ctypes.get_errno())))
+        return wd
+
+    def close(self):
+        os.close(self.fd)
@@ -0,0 +1,348 @@
+"""End-to-end throughput and latency benchmark for the pysquonk client.
+
+Runs jobs through the Squonk API against a local fake server
+(SquonkFakeServer.py) and measures jobs completed per second, jobs
+submitted per second, status polls per second, result MB/s downloaded,
+peak RSS of the client and p50/p99 latencies. Scenarios that fail are
+reported with the end of their output and fail the run. Three sweeps are run, each scenario in a fresh interpreter so
+its peak RSS is its own:
+
+  concurrency - small jobs with 1, 4 and 16 at once, plus status polling
+  payload     - inputs from data/benzene.sdf up to synthetic sdf files of
+                --sdf-mb MB (eg 2048 for a 2GB file)
+  results     - results of increasing numbers of records
+
+The results are written as json (-o) and can be compared with an earlier
+run (--baseline), failing (exit status 1) if any metric is worse by more
+than the tolerance.
+
+  python bench_client.py -o bench.json
+  python bench_client.py --baseline bench.json --tolerance 15
+  python bench_client.py --sweep payload --sdf-mb 64 --sdf-mb 2048
+
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# the service the jobs are run with, which the fake server answers with
+# the records of the input
+SERVICE = 'rdkit.calculators.canonical_smiles'
+OPTIONS = { 'query.mode': 'WHOLE_MOLECULE' }
+
+# metrics compared with the baseline, and whether higher is better
+metric_directions = { 'jobs_per_second': True,
+                      'submits_per_second': True,
+                      'polls_per_second': True,
+                      'result_mb_per_second': True,
+                      'submit_p50_ms': False,
+                      'submit_p99_ms': False,
+                      'job_p50_ms': False,
+                      'job_p99_ms': False,
+                      'poll_p50_ms': False,
+                      'poll_p99_ms': False,
+                      'peak_rss_mb': False }
+
+def scenarios(args, sdf_files):
+    """
+    Returns the scenarios (dicts) of the sweeps asked for.
+    """
+    benzene = { 'sdf': os.path.join(here, 'data', 'benzene.sdf') }
+    out = []
+    if 'concurrency' in args.sweeps:
+        for concurrency in args.concurrency:
+            out.append({ 'name': 'concurrency-{}'.format(concurrency), 'input': benzene,
+                         'concurrency': concurrency, 'jobs': args.jobs * concurrency,
+                         'result_records': None, 'poll_seconds': args.poll_seconds })
+    if 'payload' in args.sweeps:
+        out.append({ 'name': 'payload-benzene', 'input': benzene, 'concurrency': 1, 'jobs': args.jobs,
+                     'result_records': 100 })
+        out.append({ 'name': 'payload-kinase-dataset', 'concurrency': 1, 'jobs': args.jobs, 'result_records': 100,
+                     'input': { 'data': os.path.join(here, 'data', 'Kinase_inhibs.json.gz'),
+                                'meta': os.path.join(here, 'data', 'Kinase_inhibs.metadata') } })
+        for mb, file_name in sdf_files:
+            out.append({ 'name': 'payload-sdf-{}mb'.format(mb), 'input': { 'sdf': file_name }, 'concurrency': 1,
+                         'jobs': max(1, args.jobs // 4), 'result_records': 100 })
+    if 'results' in args.sweeps:
+        for records in args.result_records:
+            out.append({ 'name': 'results-{}'.format(records), 'input': benzene, 'concurrency': 1,
+                         'jobs': args.jobs, 'result_records': records })
+    return out
+
+def synthetic_sdf(mb, dir):
+    """
+    Writes an sdf file of at least mb MB by repeating the molecules of
+    data/mols.sdf, returning its name.
+    """
+    file_name = os.path.join(dir, 'synthetic-{}mb.sdf'.format(mb))
+    with open(os.path.join(here, 'data', 'mols.sdf'), 'rb') as f:
+        block = f.read()
+    if not block.endswith(b'\n'):
+        block += b'\n'
+    block = block * max(1, (1024 * 1024) // len(block))
+    with open(file_name, 'wb') as f:
+        while f.tell() < mb * 1024 * 1024:
+            f.write(block)
+    return file_name
+
+@contextlib.contextmanager
+def fake_server(job_seconds, result_records, latency):
+    """
+    Runs SquonkFakeServer in its own process (so it doesn't compete with
+    the client for the interpreter), yielding its config.
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    command = [sys.executable, os.path.join(here, 'SquonkFakeServer.py'), '--port', str(port),
+               '--job-seconds', str(job_seconds), '--latency', str(latency)]
+    if result_records:
+        command += ['--result-records', str(result_records)]
+    process = subprocess.Popen(command, cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.time() > deadline or process.poll() is not None:
+                    raise Exception('fake server did not start')
+                time.sleep(0.1)
+        base = 'http://127.0.0.1:{}'.format(port)
+        yield { 'base_url': base + '/rest/v1', 'auth_url': base + '/auth/token',
+                'username': 'bench', 'password': 'bench',
+                'services_endpoint': 'services/', 'jobs_endpoint': 'jobs/' }
+    finally:
+        process.terminate()
+        process.wait()
+
+def run_scenario(scenario, config, poll):
+    """
+    Runs one scenario in this process, returning its metrics.
+    """
+    from squonk import Squonk
+    from SquonkCostModel import SquonkCostModel
+    from SquonkTiming import TimingStats
+
+    timing = TimingStats()
+    squonk = Squonk(config=config, observers=[timing], cost_model=SquonkCostModel(None))
+    results_dir = tempfile.TemporaryDirectory(prefix='squonk-bench-')
+    dir = results_dir.name
+    submit_seconds = []
+    # when each submit finished
+    submitted_at = []
+    job_seconds = []
+    statuses = []
+
+    def job(number):
+        start = time.perf_counter()
+        job_id = squonk.run_job(SERVICE, OPTIONS, { 'input': scenario['input'] })
+        submitted = time.perf_counter()
+        submit_seconds.append(submitted - start)
+        submitted_at.append(submitted)
+        if not job_id:
+            statuses.append('SUBMIT_FAILED')
+            return
+        out_dir = os.path.join(dir, str(number))
+        os.mkdir(out_dir)
+        statuses.append(squonk.job_wait(job_id, dir=out_dir, sleep=poll))
+        job_seconds.append(time.perf_counter() - start)
+
+    # job_wait reports progress on stdout, which carries the results
+    with contextlib.redirect_stdout(sys.stderr), results_dir:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=scenario['concurrency']) as executor:
+            list(executor.map(job, range(scenario['jobs'])))
+        wall = time.perf_counter() - start
+        polls = poll_rate(squonk, scenario) if scenario.get('poll_seconds') else None
+
+    timelines = list(squonk.timelines.values())
+    download_bytes = sum(timeline.download_bytes for timeline in timelines)
+    download_seconds = sum(timeline.download_seconds for timeline in timelines)
+    metrics = { 'jobs': scenario['jobs'],
+                'failed': len([status for status in statuses if status != 'RESULTS_READY']),
+                'seconds': wall,
+                'jobs_per_second': scenario['jobs'] / wall,
+                # submits over the time until the last was done
+                'submits_per_second': len(submitted_at) / (max(submitted_at) - start),
+                'submit_p50_ms': percentile(submit_seconds, 50) * 1000,
+                'submit_p99_ms': percentile(submit_seconds, 99) * 1000,
+                'job_p50_ms': percentile(job_seconds, 50) * 1000,
+                'job_p99_ms': percentile(job_seconds, 99) * 1000,
+                'upload_mb': sum(timeline.upload_bytes for timeline in timelines) / 1e6,
+                'result_mb': download_bytes / 1e6,
+                'result_mb_per_second': download_bytes / 1e6 / download_seconds if download_seconds else None,
+                'peak_rss_mb': peak_rss_mb(),
+                'requests': timing.summary()['requests'] }
+    if polls:
+        metrics.update(polls)
+    squonk.server.close()
+    return metrics
+
+def poll_rate(squonk, scenario):
+    """
+    Checks the status of a job from concurrency threads for poll_seconds,
+    returning the polls per second and their latency percentiles.
+    """
+    job_id = squonk.run_job(SERVICE, OPTIONS, { 'input': scenario['input'] })
+    if not job_id:
+        return None
+    stop = time.perf_counter() + scenario['poll_seconds']
+    latencies = []
+    lock = threading.Lock()
+    def poll():
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            squonk.job_status(job_id)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    threads = [threading.Thread(target=poll) for i in range(scenario['concurrency'])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    squonk.job_delete(job_id)
+    return { 'polls': len(latencies),
+             'polls_per_second': len(latencies) / seconds,
+             'poll_p50_ms': percentile(latencies, 50) * 1000,
+             'poll_p99_ms': percentile(latencies, 99) * 1000 }
+
+# nearest rank percentile
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, min(len(values), -(-p * len(values) // 100)) - 1)]
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB elsewhere
+    return rss / 1e6 if sys.platform == 'darwin' else rss / 1e3
+
+def compare(results, baseline, tolerance):
+    """
+    Compares results with a baseline, returning a line for each metric of
+    each scenario in both and a list of the regressions (worse by more
+    than tolerance percent).
+    """
+    lines = []
+    regressions = []
+    base = { result['name']: result['metrics'] for result in baseline['results'] }
+    for result in results:
+        if not result['name'] in base:
+            continue
+        for metric, higher_is_better in sorted(metric_directions.items()):
+            new = result['metrics'].get(metric)
+            old = base[result['name']].get(metric)
+            if new is None or not old:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > tolerance:
+                flag = '  REGRESSION'
+                regressions.append('{} {}'.format(result['name'], metric))
+            lines.append('{:28} {:22} {:12.2f} {:12.2f} {:+8.1f}%{}'.format(
+                         result['name'], metric, old, new, change, flag))
+    return lines, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pysquonk client against a local fake server')
+    parser.add_argument("-s", "--sweep", action="append", dest="sweeps", choices=['concurrency', 'payload', 'results'], help="sweep to run (default all), can be repeated", default=None)
+    parser.add_argument("-n", "--jobs", type=int, dest="jobs", help="jobs per scenario (per thread in the concurrency sweep)", default=8)
+    parser.add_argument("-c", "--concurrency", type=int, action="append", dest="concurrency", help="concurrency of the concurrency sweep, can be repeated (default 1, 4, 16)", default=None)
+    parser.add_argument("--sdf-mb", type=int, action="append", dest="sdf_mb", help="size in MB of a synthetic sdf input for the payload sweep, can be repeated (default 16)", default=None)
+    parser.add_argument("--result-records", type=int, action="append", dest="result_records", help="records returned in the results sweep, can be repeated (default 1000, 100000)", default=None)
+    parser.add_argument("--job-seconds", type=float, dest="job_seconds", help="seconds the fake server runs each job for", default=0.2)
+    parser.add_argument("--latency", type=float, dest="latency", help="seconds the fake server adds to each request", default=0)
+    parser.add_argument("--poll", type=float, dest="poll", help="seconds between status checks while waiting for jobs", default=0.1)
+    parser.add_argument("--poll-seconds", type=float, dest="poll_seconds", help="seconds status polling is measured for", default=2)
+    parser.add_argument("-o", "--output", type=str, dest="output", help="json file to write the results to", default=None)
+    parser.add_argument("-b", "--baseline", type=str, dest="baseline", help="json results of an earlier run to compare with", default=None)
+    parser.add_argument("-t", "--tolerance", type=float, dest="tolerance", help="percent a metric can be worse than the baseline by", default=10)
+    parser.add_argument("--run-scenario", type=str, dest="run_scenario", help=argparse.SUPPRESS, default=None)
+    args = parser.parse_args()
+
+    # run one scenario, in the process started for it
+    if args.run_scenario:
+        request = json.loads(args.run_scenario)
+        print(json.dumps(run_scenario(request['scenario'], request['config'], request['poll'])))
+        return
+
+    args.sweeps = args.sweeps or ['concurrency', 'payload', 'results']
+    args.concurrency = args.concurrency or [1, 4, 16]
+    args.sdf_mb = args.sdf_mb or [16]
+    args.result_records = args.result_records or [1000, 100000]
+
+    results = []
+    failed_scenarios = []
+    with tempfile.TemporaryDirectory(prefix='squonk-bench-') as dir:
+        sdf_files = [ (mb, synthetic_sdf(mb, dir)) for mb in args.sdf_mb ] if 'payload' in args.sweeps else []
+        for scenario in scenarios(args, sdf_files):
+            with fake_server(args.job_seconds, scenario['result_records'], args.latency) as config:
+                request = json.dumps({ 'scenario': scenario, 'config': config, 'poll': args.poll })
+                process = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-scenario', request],
+                                         cwd=here, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                         universal_newlines=True)
+            if process.returncode != 0:
+                # the end of its output, which has the error
+                print('{}: FAILED (exit status {})'.format(scenario['name'], process.returncode))
+                for line in process.stderr.splitlines()[-20:]:
+                    print('  ' + line)
+                failed_scenarios.append(scenario['name'])
+                continue
+            metrics = json.loads(process.stdout.strip().splitlines()[-1])
+            results.append({ 'name': scenario['name'], 'scenario': scenario, 'metrics': metrics })
+            print('{:28} {:6.1f} jobs/s  submit p50 {:7.1f}ms p99 {:7.1f}ms  job p99 {:7.1f}ms  '
+                  'results {:7.1f} MB/s  rss {:6.1f} MB{}'.format(
+                  scenario['name'], metrics['jobs_per_second'], metrics['submit_p50_ms'],
+                  metrics['submit_p99_ms'], metrics['job_p99_ms'] or 0, metrics['result_mb_per_second'] or 0,
+                  metrics['peak_rss_mb'],
+                  '  polls {:.0f}/s'.format(metrics['polls_per_second']) if 'polls_per_second' in metrics else ''))
+            if metrics['failed']:
+                print('  {} of {} jobs failed'.format(metrics['failed'], metrics['jobs']))
+
+    output = { 'time': time.time(),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'settings': { 'job_seconds': args.job_seconds, 'latency': args.latency, 'poll': args.poll },
+               'results': results }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    failed = bool(failed_scenarios) or any(result['metrics']['failed'] for result in results)
+    if failed_scenarios:
+        print('FAIL: {} scenarios failed: {}'.format(len(failed_scenarios), ', '.join(failed_scenarios)))
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        lines, regressions = compare(results, baseline, args.tolerance)
+        print('{:28} {:22} {:>12} {:>12} {:>9}'.format('scenario', 'metric', 'baseline', 'now', 'change'))
+        for line in lines:
+            print(line)
+        if regressions:
+            print('FAIL: {} regressions over {}%: {}'.format(len(regressions), args.tolerance, ', '.join(regressions)))
+            failed = True
+    if not failed:
+        print('OK')
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
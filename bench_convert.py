@@ -0,0 +1,218 @@
+"""Micro-benchmarks of the file conversion and checking functions of utils,
+the CPU hot path of preparing inputs on the client.
+
+Runs str2squonk, tosquonk, mol2sdf, tobasic, peek, guess_type and
+squonk_check over the files in data/ and over synthetic variants of them
+scaled up --scale times (records repeated), reporting records/s, MB/s (of
+uncompressed input) and peak memory (traced by tracemalloc, in a separate
+run from the timed ones) for each function and file.
+
+The results can be written as json (-o) and compared with an earlier run
+(--baseline), failing (exit status 1) if any function got slower or used
+more memory by more than the tolerance.
+
+  python bench_convert.py
+  python bench_convert.py --scale 10 --scale 100 -o convert.json
+  python bench_convert.py -f str2squonk -f tosquonk --baseline convert.json
+
+"""
+
+import argparse
+import gc
+import gzip
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import utils
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# small files are run until at least this many seconds have been timed,
+# so their best time isn't noise
+MIN_SECONDS = 0.5
+
+# the bundled files benchmarked
+sdf_files = ['ChemblActivitiesFetcher1.sdf', 'ChemblActivitiesFetcher2.sdf', 'ChemblActivitiesFetcher3.sdf',
+             'dhfr_3d.sdf.gz']
+mol_files = ['pyrimethamine.mol']
+dataset_files = ['Building_blocks_GBP.data.gz', 'Kinase_inhibs.json.gz']
+
+def read_text(file_name):
+    with utils.open_file(file_name) as f:
+        return f.read()
+
+# the benchmarks: for each function, the kinds of file it runs over and a
+# function of (file name, its text) returning the number of records.
+# Reading the text is not timed for the functions that take text.
+def _str2squonk(file_name, text):
+    return len(utils.str2squonk(text, 'sdf', file_name)[0])
+
+def _str2squonk_compact(file_name, text):
+    return len(utils.str2squonk(text, 'sdf', file_name, compact=True)[0])
+
+def _tosquonk(file_name, text):
+    return len(utils.tosquonk(file_name)[0])
+
+# the records are counted in the input, mol2sdf adds a $$$$ to the end
+def _mol2sdf(file_name, text):
+    utils.mol2sdf(file_name)
+    return text.count('$$$$') or 1
+
+def _tobasic(file_name, text):
+    return utils.tobasic(file_name)[1]['size']
+
+def _peek(file_name, text):
+    return utils.peek(file_name, False)['nrecs']
+
+def _guess_type(file_name, text):
+    return utils.guess_type(text, False)['nrecs']
+
+def _squonk_check(file_name, text):
+    return utils.squonk_check(utils.iter_dataset(io.StringIO(text)), False, None)[0]
+
+benchmarks = [ ('str2squonk', ['sdf'], _str2squonk),
+               ('str2squonk compact', ['sdf'], _str2squonk_compact),
+               ('tosquonk', ['sdf', 'mol'], _tosquonk),
+               ('mol2sdf', ['mol', 'sdf'], _mol2sdf),
+               ('tobasic', ['smi-data'], _tobasic),
+               ('peek', ['sdf', 'mol', 'data', 'smi-data'], _peek),
+               ('guess_type', ['sdf', 'mol', 'data', 'smi-data'], _guess_type),
+               ('squonk_check', ['data', 'smi-data'], _squonk_check) ]
+
+def scaled(file_name, kind, scale, dir):
+    """
+    Writes a copy of file_name with its records repeated scale times
+    (compressed if it is), returning its name.
+    """
+    base = os.path.basename(file_name)
+    stem, ext = base.split('.', 1)
+    out_name = os.path.join(dir, '{}.x{}.{}'.format(stem, scale, ext))
+    text = read_text(file_name)
+    if kind == 'sdf':
+        if not text.endswith('\n'):
+            text += '\n'
+        text = text * scale
+    else:
+        records = list(utils.iter_dataset(io.StringIO(text)))
+        text = json.dumps(records * scale, separators=(',', ':'))
+    opener = gzip.open if out_name.endswith('.gz') else open
+    with opener(out_name, 'wt') as f:
+        f.write(text)
+    return out_name
+
+def inputs(scales, dir):
+    """
+    Returns (file name, kind) of the bundled files and their scaled
+    variants. Datasets with a SMI value (which tobasic needs) are of kind
+    smi-data.
+    """
+    files = [ (os.path.join(here, 'data', name), 'sdf') for name in sdf_files ]
+    files += [ (os.path.join(here, 'data', name), 'mol') for name in mol_files ]
+    for name in dataset_files:
+        file_name = os.path.join(here, 'data', name)
+        first = next(utils.read_dataset(file_name))
+        files.append((file_name, 'smi-data' if 'SMI' in first.get('values', {}) else 'data'))
+    out = list(files)
+    for scale in scales:
+        for file_name, kind in files:
+            # a mol file has one molecule
+            if kind != 'mol':
+                out.append((scaled(file_name, kind, scale, dir), kind))
+    return out
+
+def measure(function, file_name, repeat):
+    """
+    Runs function over file_name repeat times (or more, see MIN_SECONDS),
+    returning the records, the best time (seconds) and the peak memory
+    (bytes) of a traced run.
+    """
+    text = read_text(file_name)
+    times = []
+    while len(times) < repeat or sum(times) < MIN_SECONDS:
+        gc.collect()
+        start = time.perf_counter()
+        records = function(file_name, text)
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    function(file_name, text)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return records, min(times), peak
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pysquonk file conversion functions')
+    parser.add_argument("-f", "--function", type=str, action="append", dest="functions", choices=[name for name, kinds, function in benchmarks], help="function to benchmark (default all), can be repeated", default=None)
+    parser.add_argument("-s", "--scale", type=int, action="append", dest="scales", help="times the records of each file are repeated in a synthetic variant, can be repeated (default 10, 0 for none)", default=None)
+    parser.add_argument("-n", "--repeat", type=int, dest="repeat", help="timed runs of each benchmark (the best is reported)", default=3)
+    parser.add_argument("-o", "--output", type=str, dest="output", help="json file to write the results to", default=None)
+    parser.add_argument("-b", "--baseline", type=str, dest="baseline", help="json results of an earlier run to compare with", default=None)
+    parser.add_argument("-t", "--tolerance", type=float, dest="tolerance", help="percent a function can be slower or use more memory by", default=10)
+    args = parser.parse_args()
+    scales = [scale for scale in (args.scales or [10]) if scale > 1]
+
+    results = []
+    print('{:20} {:36} {:>9} {:>8} {:>10} {:>8} {:>9}'.format(
+          'function', 'file', 'records', 'MB', 'records/s', 'MB/s', 'peak MB'))
+    with tempfile.TemporaryDirectory(prefix='squonk-bench-') as dir:
+        files = inputs(scales, dir)
+        for name, kinds, function in benchmarks:
+            if args.functions and not name in args.functions:
+                continue
+            for file_name, kind in files:
+                if not kind in kinds:
+                    continue
+                mb = len(read_text(file_name).encode()) / 1e6
+                records, seconds, peak = measure(function, file_name, args.repeat)
+                result = { 'function': name,
+                           'file': os.path.basename(file_name),
+                           'records': records,
+                           'mb': mb,
+                           'seconds': seconds,
+                           'records_per_second': records / seconds,
+                           'mb_per_second': mb / seconds,
+                           'peak_mb': peak / 1e6 }
+                results.append(result)
+                print('{function:20} {file:36} {records:9d} {mb:8.2f} {records_per_second:10.0f} '
+                      '{mb_per_second:8.1f} {peak_mb:9.1f}'.format(**result))
+
+    output = { 'time': time.time(),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'results': results }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    if not args.baseline:
+        return
+    with open(args.baseline) as f:
+        baseline = { (result['function'], result['file']): result for result in json.load(f)['results'] }
+    regressions = []
+    print('{:20} {:36} {:>12} {:>12} {:>9} {:>9}'.format('function', 'file', 'MB/s was', 'peak MB was',
+                                                         'speed', 'memory'))
+    for result in results:
+        old = baseline.get((result['function'], result['file']))
+        if old is None:
+            continue
+        speed = (result['mb_per_second'] - old['mb_per_second']) / old['mb_per_second'] * 100
+        memory = (result['peak_mb'] - old['peak_mb']) / old['peak_mb'] * 100 if old['peak_mb'] else 0
+        flag = ''
+        if -speed > args.tolerance or memory > args.tolerance:
+            flag = '  REGRESSION'
+            regressions.append('{} {}'.format(result['function'], result['file']))
+        print('{:20} {:36} {:12.1f} {:12.1f} {:+8.1f}% {:+8.1f}%{}'.format(
+              result['function'], result['file'], old['mb_per_second'], old['peak_mb'], speed, memory, flag))
+    if regressions:
+        print('FAIL: {} regressions over {}%: {}'.format(len(regressions), args.tolerance, ', '.join(regressions)))
+        sys.exit(1)
+    print('OK')
+
+if __name__ == "__main__":
+    main()
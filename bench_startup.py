@@ -0,0 +1,99 @@
+"""Startup benchmark for the pysquonk command line.
+
+Imports squonk in fresh interpreters with python -X importtime and times
+running squonk.py -h, failing (exit status 1) if the median import time
+is over the budget or if any of the heavy dependencies that should only
+be loaded when they are used are imported at startup.
+
+  python bench_startup.py
+  python bench_startup.py -n 20 -b 40 -t 10
+
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# modules that must not be imported just by importing squonk
+lazy_modules = ['requests', 'requests_toolbelt', 'yaml', 'numpy']
+
+# default budget (ms) for importing squonk
+DEFAULT_BUDGET_MS = 50
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# import squonk in a fresh interpreter, returning the list of
+# (module, self us, cumulative us) reported by -X importtime for squonk and
+# the modules it imported (not those loaded by the interpreter startup)
+def import_times(module='squonk'):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            cwd=here, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            universal_newlines=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # top level imports are indented by one space
+        if name.startswith('  '):
+            times.append((name.strip(), int(self_us), int(cumulative_us)))
+        elif name.strip() == module:
+            times.append((module, int(self_us), int(cumulative_us)))
+            break
+        else:
+            times = []
+    return times
+
+# time running the command line help
+def help_time():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(here, 'squonk.py'), '-h'],
+                   cwd=here, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pysquonk startup time')
+    parser.add_argument("-n", "--runs", type=int, dest="runs", help="number of runs (the median is reported)", default=10)
+    parser.add_argument("-b", "--budget", type=float, dest="budget", help="budget in ms for importing squonk", default=DEFAULT_BUDGET_MS)
+    parser.add_argument("-t", "--top", type=int, dest="top", help="number of slowest imports to list", default=10)
+    args = parser.parse_args()
+
+    import_ms = []
+    help_ms = []
+    slowest = {}
+    loaded = set()
+    for run in range(args.runs):
+        times = import_times()
+        for name, self_us, cumulative_us in times:
+            slowest.setdefault(name, []).append(self_us)
+            loaded.add(name.split('.')[0])
+        import_ms.append([cumulative for name, self_us, cumulative in times if name == 'squonk'][0] / 1000)
+        help_ms.append(help_time() * 1000)
+
+    import_median = statistics.median(import_ms)
+    print('import squonk: median {:.1f}ms (min {:.1f}ms, budget {:.1f}ms)'.format(
+          import_median, min(import_ms), args.budget))
+    print('squonk.py -h:  median {:.1f}ms (min {:.1f}ms)'.format(statistics.median(help_ms), min(help_ms)))
+
+    print('slowest imports (median self time):')
+    medians = sorted(((statistics.median(us), name) for name, us in slowest.items()), reverse=True)
+    for us, name in medians[:args.top]:
+        print('  {:8.2f}ms  {}'.format(us / 1000, name))
+
+    failed = False
+    eager = [module for module in lazy_modules if module in loaded]
+    if eager:
+        print('FAIL: imported at startup: ' + ', '.join(eager))
+        failed = True
+    if import_median > args.budget:
+        print('FAIL: import squonk is over budget')
+        failed = True
+    if not failed:
+        print('OK')
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
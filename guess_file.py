@@ -1,31 +1,49 @@
 #! /usr/bin/env python
 """Python script to guess what a file is and write some information about it
 
-   usage: guess_file.py <in_file> <field>
+   usage: guess_file.py [--quick] [--stats [FIELD ...]] [--json] <in_file> <field>
  
    reads <in_file> and tries to guess if its a squonk dataset, metdata, mol
    or sdf file. Writes out the time when the file was last modified, the
    number of records and the values from the first record.  
    <field> is optional, but if specified writes out a count of all values of
    the specified field for all records in the file.
+   The file type is worked out from the start of the file, --quick stops
+   there without reading the whole file.
+   --stats writes out the count, missing count, distinct values and numeric
+   min/max/mean/quantiles of the given fields (all fields if none are given)
+   in a single pass over the file, as a table or as json with --json.
 
 """
 
 import argparse
-import json
-import logging
-import sys
 import os
 import time
 from utils import peek
+from SquonkStats import dataset_stats
 
-file_name = sys.argv[1]
-field=None
-if len(sys.argv)>2:
-    field = sys.argv[2]
+parser = argparse.ArgumentParser(description='Guess what a file is')
+parser.add_argument("in_file", help="file to look at")
+parser.add_argument("field", nargs='?', help="field to count the values of", default=None)
+parser.add_argument("-q", "--quick", action="store_true", dest="quick", help="only report the file type, don't read the whole file", default=False)
+parser.add_argument("-s", "--stats", type=str, nargs='*', dest="stats", help="write out statistics for the fields (all fields if none given)", default=None)
+parser.add_argument("-j", "--json", action="store_true", dest="json", help="write the statistics as json", default=False)
+args = parser.parse_args()
+
+file_name = args.in_file
+field = args.field
 
 mtime=time.ctime(os.path.getmtime(file_name))
 print('File modification time='+str(mtime))
 
-file_info = peek(file_name,True,field)
-print(file_info)
+if args.stats is not None:
+    stats = dataset_stats(file_name, args.stats or None)
+    if stats is None:
+        print('Statistics need a squonk dataset, sdf or mol file')
+    elif args.json:
+        print(stats.to_json(indent=2))
+    else:
+        print(stats.table())
+else:
+    file_info = peek(file_name,True,field,not args.quick)
+    print(file_info)
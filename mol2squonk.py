@@ -1,31 +1,35 @@
 #! /usr/bin/env python
 """Python script to convert mol or sdf files to squonk.
 
-   usage: mol2squonk.py <in_file> <out_base>
+   usage: mol2squonk.py [--gzip] [--level L] [--threads T] <in_file> <out_base>
  
    reads <in_file> and writes <out_base>.data and <out_base>.metadata
+   --gzip writes <out_base>.data.gz instead, compressed with T threads.
 
 """
 
 import argparse
-import json
-import logging
-import sys
-import os
-from utils import tosquonk
+from SquonkDatasetWriter import write_squonk
+from SquonkGzip import ParallelGzipWriter, DEFAULT_LEVEL
 
-file_name = sys.argv[1]
-out_name = sys.argv[2]
+parser = argparse.ArgumentParser(description='Convert a mol file to squonk')
+parser.add_argument("in_file", help="mol file to convert (may be gzipped)")
+parser.add_argument("out_base", help="writes <out_base>.data and <out_base>.metadata")
+parser.add_argument("-z", "--gzip", action="store_true", dest="gzip", help="gzip the data file", default=False)
+parser.add_argument("-l", "--level", type=int, dest="level", help="gzip compression level 1-9", default=DEFAULT_LEVEL)
+parser.add_argument("-t", "--threads", type=int, dest="threads", help="number of gzip threads (default one per cpu)", default=None)
+args = parser.parse_args()
 
-data, meta, rcode = tosquonk(file_name, 'mol')
+file_name = args.in_file
+out_name = args.out_base
 
-if rcode != 0:
-    print("Error converting")
+# stream the records straight to the output files
+if args.gzip:
+    out = ParallelGzipWriter(out_name + '.data.gz', args.level, args.threads)
 else:
-    f=open(out_name + '.data', 'w+')
-    f.write(json.dumps(data))
-    f.close()
-    if meta:
-        f=open(out_name + '.metadata', 'w+')
-        f.write(json.dumps(meta))
-        f.close()
+    out = out_name + '.data'
+meta = write_squonk(file_name, out, out_name + '.metadata', 'mol')
+if args.gzip:
+    out.close()
+if meta is None:
+    print('Error converting')
@@ -1,30 +1,40 @@
 #! /usr/bin/env python
 """Python script to sdf files to squonk.
 
-   usage: sdf2squonk.py <in_file> <out_base>
+   usage: sdf2squonk.py [--workers N] [--gzip] [--level L] [--threads T] <in_file> <out_base>
  
    reads <in_file> and writes <out_base>.data and <out_base>.metadata
+   --workers converts the file in parallel using N processes.
+   --gzip writes <out_base>.data.gz instead, compressed with T threads.
 
 """
 
 import argparse
-import json
-import logging
-import sys
-import os
-from utils import tosquonk
+from SquonkDatasetWriter import write_squonk, write_squonk_parallel
+from SquonkGzip import ParallelGzipWriter, DEFAULT_LEVEL
 
-file_name = sys.argv[1]
-out_name = sys.argv[2]
+parser = argparse.ArgumentParser(description='Convert an sdf file to squonk')
+parser.add_argument("in_file", help="sdf file to convert (may be gzipped)")
+parser.add_argument("out_base", help="writes <out_base>.data and <out_base>.metadata")
+parser.add_argument("-w", "--workers", type=int, dest="workers", help="number of processes to convert with (0 for one per cpu)", default=1)
+parser.add_argument("-z", "--gzip", action="store_true", dest="gzip", help="gzip the data file", default=False)
+parser.add_argument("-l", "--level", type=int, dest="level", help="gzip compression level 1-9", default=DEFAULT_LEVEL)
+parser.add_argument("-t", "--threads", type=int, dest="threads", help="number of gzip threads (default one per cpu)", default=None)
+args = parser.parse_args()
 
-data, meta, rcode = tosquonk(file_name, 'sdf')
-if rcode != 0:
-    print('Error converting')
+file_name = args.in_file
+out_name = args.out_base
+
+# stream the records straight to the output files
+if args.gzip:
+    out = ParallelGzipWriter(out_name + '.data.gz', args.level, args.threads)
 else:
-    f=open(out_name + '.data', 'w+')
-    f.write(json.dumps(data))
-    f.close()
-    if meta:
-        f=open(out_name + '.metadata', 'w+')
-        f.write(json.dumps(meta))
-        f.close()
+    out = out_name + '.data'
+if args.workers == 1:
+    meta = write_squonk(file_name, out, out_name + '.metadata', 'sdf')
+else:
+    meta = write_squonk_parallel(file_name, out, out_name + '.metadata', args.workers)
+if args.gzip:
+    out.close()
+if meta is None:
+    print('Error converting')
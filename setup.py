@@ -21,7 +21,7 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     python_requires='>=3.6',
-    py_modules=["SquonkAuth", "SquonkJobDefinition", "SquonkJob", "SquonkServer", "squonk", "utils"],
+    py_modules=["SquonkAuth", "SquonkJobDefinition", "SquonkJob", "SquonkServer", "SquonkCache", "SquonkDatasetWriter", "SquonkSdfIndex", "SquonkStats", "SquonkDataset", "SquonkRecord", "SquonkGzip", "SquonkCostModel", "SquonkLocal", "SquonkAgent", "SquonkWatch", "SquonkManifest", "SquonkTiming", "SquonkMetrics", "SquonkFakeServer", "squonk", "utils"],
     install_requires=requirements,
     entry_points = {
         'console_scripts': ['pysquonk=squonk:main'],
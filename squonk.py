@@ -40,12 +40,17 @@ parameters passed in and then run a job. See example program below:
 
 import configparser
 import argparse
+import atexit
+import threading
 import json
 import logging
 import time
 import sys
 import os
-from requests_toolbelt.multipart import decoder
+import zlib
+import shutil
+import tempfile
+from uuid import uuid1
 try:
     from .SquonkAuth import SquonkAuth, SquonkAuthException
 except:
@@ -62,6 +67,30 @@ try:
     from .SquonkJob import SquonkJob
 except:
     from SquonkJob import SquonkJob
+try:
+    from .utils import is_gzip
+except:
+    from utils import is_gzip
+try:
+    from .SquonkCache import SquonkCache, DEFAULT_MAX_BYTES
+except:
+    from SquonkCache import SquonkCache, DEFAULT_MAX_BYTES
+try:
+    from .SquonkGzip import DEFAULT_LEVEL
+except:
+    from SquonkGzip import DEFAULT_LEVEL
+try:
+    from .SquonkLocal import local_service, run_local, DATA_FILE, META_FILE
+except:
+    from SquonkLocal import local_service, run_local, DATA_FILE, META_FILE
+try:
+    from .SquonkTiming import JobTimeline, JobEvent, notify
+except:
+    from SquonkTiming import JobTimeline, JobEvent, notify
+try:
+    from .SquonkCostModel import SquonkCostModel, DEFAULT_TIMINGS_FILE
+except:
+    from SquonkCostModel import SquonkCostModel, DEFAULT_TIMINGS_FILE
 
 # The version of this module.
 # Modify with every change, complying with
@@ -69,7 +98,10 @@ except:
 __version__ = '1.0.0'
 
 # how content-types that are part of the job results response 
-# are to be processed.
+# are to be processed:
+#   write_file - write the content as received, keeping any compression
+#   decompress - gunzip compressed content while writing it
+# (content types not listed are written as received)
 output_content_types = {
    'chemical/x-mdl-sdfile': 'write_file',
    'application/x-squonk-dataset-molecule+json': 'write_file',
@@ -78,14 +110,20 @@ output_content_types = {
    'image/png': 'write_file',
    'chemical/x-mol2': 'write_file'}
 
-# test for gzip
+# size of the blocks written out when decompressing
+WRITE_BLOCK_BYTES = 1024 * 1024
 
-def _is_gzip(content):
-    return content[:2]==b'1f8b'
+# job statuses job_wait keeps waiting through
+waiting_statuses = ['PENDING', 'SUBMITTING', 'RUNNING']
+
+# number of job timelines kept
+TIMELINE_LIMIT = 1000
 
 class Squonk:
 
-    def __init__(self,config_file='config.ini', config=None, user=None, password=None):
+    def __init__(self,config_file='config.ini', config=None, user=None, password=None, cache=None, content_types=None,
+                 compress_uploads=False, gzip_threads=None, cost_model=None, observers=None,
+                 timeline_file=None):
         """
         Instantiate a Squonk object.
 
@@ -106,6 +144,29 @@ class Squonk:
             Username to override the config
         password : str
             Password to override the config
+        cache : SquonkCache
+            Cache for converted input files. If not supplied one is created
+            using the optional cache_max_bytes and cache_dir config values.
+        content_types : dict
+            Overrides how job result content types are written,
+            'write_file' to keep them as received or 'decompress' to
+            gunzip them (see output_content_types).
+        compress_uploads : bool or int
+            True (or a gzip level 1-9) to gzip uncompressed input files
+            while uploading them. Can be overridden per job.
+        gzip_threads : int
+            Number of threads to compress uploads with (default one per cpu)
+        cost_model : SquonkCostModel
+            Chooses where inputs are converted for run_job with
+            convert_onserver='auto'. If not supplied one is created using
+            the optional timings_file and timings_record config values.
+        observers : list
+            Callables called with the timing of every request to the
+            server and to the authentication server, eg a
+            SquonkTiming.TimingStats (see add_observer).
+        timeline_file : str
+            Optional json lines file the timeline (SquonkTiming.JobTimeline)
+            of each job is appended to when job_wait finishes with it.
 
         Returns
         -------
@@ -137,6 +198,16 @@ class Squonk:
             self._config['base_url'] = settings.get('general', 'base_url')
             self._config['services_endpoint'] = settings.get('ids', 'endpoint')
             self._config['jobs_endpoint'] = settings.get('job', 'endpoint')
+            if 'cache' in settings:
+                if 'max_bytes' in settings['cache']:
+                    self._config['cache_max_bytes'] = settings.getint('cache', 'max_bytes')
+                if 'dir' in settings['cache']:
+                    self._config['cache_dir'] = settings.get('cache', 'dir')
+            if 'timings' in settings:
+                if 'file' in settings['timings']:
+                    self._config['timings_file'] = settings.get('timings', 'file')
+                if 'record' in settings['timings']:
+                    self._config['timings_record'] = settings.getboolean('timings', 'record')
 
         # override username and password if passed in
         if user:
@@ -157,10 +228,76 @@ class Squonk:
         # Create a SquonkAuth object
         # then authenticate (checking for success)...
         sa = SquonkAuth(self._config['auth_url'], self._config['username'], self._config['password'])
+        for observer in observers or []:
+            sa.add_observer(observer)
         sa.authenticate()
 
         # create SquonkServer object
-        self.server = SquonkServer(sa, self._config['base_url'])
+        self.server = SquonkServer(sa, self._config['base_url'], observers)
+        self.auth = sa
+        # called with a SquonkTiming.JobEvent as jobs start, are polled and
+        # finish
+        self._observers = list(observers or [])
+
+        # how each content type of the job results is written
+        self.content_types = dict(output_content_types)
+        if content_types:
+            self.content_types.update(content_types)
+
+        # compression of uncompressed input files when uploading
+        if compress_uploads is True:
+            compress_uploads = DEFAULT_LEVEL
+        self._gzip_level = compress_uploads or None
+        self._gzip_threads = gzip_threads
+        # upload compression statistics of each job started
+        self.upload_stats = {}
+
+        # cache of converted input files, shared by all jobs
+        if cache:
+            self.cache = cache
+        else:
+            self.cache = SquonkCache(self._config.get('cache_max_bytes', DEFAULT_MAX_BYTES),
+                                     self._config.get('cache_dir'))
+
+        # timings learnt from earlier runs, for choosing where to convert
+        if cost_model:
+            self.cost_model = cost_model
+        else:
+            self.cost_model = SquonkCostModel(self._config.get('timings_file', DEFAULT_TIMINGS_FILE),
+                                              self._config.get('timings_record', False))
+
+        # output directories of jobs run locally, by job id
+        self._local_jobs = {}
+
+        # the timelines of the most recent jobs, by job id
+        self.timelines = {}
+        self._timeline_file = timeline_file
+        self._timeline_lock = threading.Lock()
+
+        # service definitions are kept for this many seconds (0 to always
+        # fetch them), eg by a long running agent
+        self.service_info_ttl = 0
+        self._service_info = {}
+
+    def add_observer(self, observer):
+        """
+        Adds a callable to be called with a SquonkTiming.RequestTiming for
+        every request to the server, a SquonkTiming.AuthTiming each time
+        a token is got or refreshed and a SquonkTiming.JobEvent as each job
+        starts, is polled and finishes.
+
+        Parameters
+        ----------
+        observer : callable
+            eg a SquonkTiming.TimingStats or SquonkMetrics.SquonkMetrics
+
+        Returns
+        -------
+
+        """
+        self.server.add_observer(observer)
+        self.auth.add_observer(observer)
+        self._observers.append(observer)
 
     def ping(self):
         """
@@ -267,10 +404,18 @@ class Squonk:
 
         """
 
+        if self.service_info_ttl:
+            fetched, info = self._service_info.get(service_id, (0, None))
+            if time.time() - fetched < self.service_info_ttl:
+                return info
+
         logging.debug('getting info for service:'+service_id)
         response = self.server.send('get', self._config['services_endpoint'] + '/' + service_id)
         if response:
-            return response.json()
+            info = response.json()
+            if self.service_info_ttl:
+                self._service_info[service_id] = (time.time(), info)
+            return info
         else:
             return {}
 
@@ -358,7 +503,8 @@ class Squonk:
         else:
             print('Failed checking job input')
 
-    def run_job(self, service=None, options={}, inputs=[], yaml=None, convert_onserver=True):
+    def run_job(self, service=None, options={}, inputs=[], yaml=None, convert_onserver=True, compress=None,
+                local=False):
         """
         Runs a Squonk job
 
@@ -379,6 +525,20 @@ class Squonk:
         yaml : str
             A yaml file defining the job. A template file can be generated
             using the function job_yaml_template
+        convert_onserver : boolean or str
+            True (the default) to upload mol and sdf files for conversion
+            on the server, False to convert them to squonk format locally,
+            'auto' to choose for each file from the timings of earlier
+            uploads and conversions (see cost_model.decisions).
+        compress : bool or int
+            True (or a gzip level) to gzip uncompressed inputs while
+            uploading, False not to. Overrides the compress setting of the
+            yaml file and the client.
+        local : boolean
+            True to run services that only stream records (see
+            SquonkLocal) on the client instead of the server. Other
+            services, or if running locally fails, go to the server. The
+            job id and results of a local job are used as for any other.
 
         Returns
         -------
@@ -388,10 +548,20 @@ class Squonk:
         """
 
         # create job
-        job = SquonkJob(self.server,service=service, options=options, inputs=inputs, yaml=yaml, end_point= self._config['jobs_endpoint'])
+        job = SquonkJob(self.server,service=service, options=options, inputs=inputs, yaml=yaml, end_point= self._config['jobs_endpoint'], cache=self.cache,
+                        gzip_level=self._gzip_level, gzip_threads=self._gzip_threads, cost_model=self.cost_model)
 
         # check the input
         if job.check_input():
+            if compress is not None:
+                job.set_compression(compress)
+
+            # run simple services on the client if asked to
+            if local and local_service(job.get_service()):
+                job_id = self._run_local(job)
+                if job_id:
+                    return job_id
+                logging.info('Running {} on the server'.format(job.get_service()))
 
             # get service defintition
             info = self.list_full_service_info(job.get_service())
@@ -401,12 +571,39 @@ class Squonk:
 
             # start job
             job_id = job.start(convert_onserver)
+            if job_id and job.upload_stats:
+                self.upload_stats[job_id] = job.upload_stats
+            if job_id:
+                self._add_timeline(job.timeline)
+                notify(self._observers, JobEvent('started', job.timeline))
 
             return job_id
         else:
             print('Failed checking job input')
             return False
 
+    # run a job on the client, returning its job id or None on failure
+    def _run_local(self, job):
+        timeline = JobTimeline(job.get_service())
+        dir = tempfile.mkdtemp(prefix='squonk-local-')
+        try:
+            meta = run_local(job.get_service(), job.get_options(), job.get_inputs(), dir)
+        except Exception as e:
+            logging.warning('Local {} failed: {}'.format(job.get_service(), e))
+            meta = None
+        if meta is None:
+            shutil.rmtree(dir, ignore_errors=True)
+            return None
+        job_id = 'local-' + str(uuid1())
+        self._local_jobs[job_id] = dir
+        timeline.job_id = job_id
+        timeline.submitted = time.time()
+        timeline.prepare_seconds = timeline.submitted - timeline.created
+        self._add_timeline(timeline)
+        notify(self._observers, JobEvent('started', timeline))
+        logging.info('Ran {} locally, job id {}'.format(job.get_service(), job_id))
+        return job_id
+
     # get your jobs
     def list_jobs(self):
         """
@@ -451,6 +648,9 @@ class Squonk:
         """
 
         logging.info('Deleting job ' + job_id)
+        if job_id in self._local_jobs:
+            shutil.rmtree(self._local_jobs.pop(job_id), ignore_errors=True)
+            return True
         response = self.server.send('delete', self._config['jobs_endpoint'] + job_id)
         return response
 
@@ -497,6 +697,8 @@ class Squonk:
 
     """
 
+        if job_id in self._local_jobs:
+            return 'RESULTS_READY'
         status = 'SQUOANK_API_ERROR'
         response = self.server.send('get', self._config['jobs_endpoint'] + job_id + '/status')
         if response:
@@ -509,7 +711,7 @@ class Squonk:
                     print(json.dumps(job_json['events']))
             return status
 
-    def job_wait(self, job_id, dir=None, sleep=10, delete=True):
+    def job_wait(self, job_id, dir=None, sleep=10, delete=True, stop=None):
         """
         Waits for the specified job to finish and if it reaches a status of
         RESULTS_READY then reteives the jobs results.
@@ -529,6 +731,9 @@ class Squonk:
         delete: boolean
             True to delete the job after getting the results back successfully
             or False to keep the job (optional: default is True)
+        stop: threading.Event
+            Optional event that stops the wait when set, returning the
+            status of the (still running) job
 
         Returns
         -------
@@ -537,18 +742,64 @@ class Squonk:
 
         """
         status = self.job_status(job_id)
-        while status=='RUNNING':
+        self.observe_status(job_id, status)
+        while status in waiting_statuses:
             print('Job status:{} waiting for {} seconds'.format(status,sleep))
-            time.sleep(sleep)
+            if stop is None:
+                time.sleep(sleep)
+            elif stop.wait(sleep):
+                return status
             status = self.job_status(job_id)
+            self.observe_status(job_id, status)
         if status == 'RESULTS_READY':
             self.job_results(job_id, dir)
             if delete:
                 self.job_delete(job_id)
         else:
-            print('Job Failed status='+status)
+            print('Job Failed status='+str(status))
+        self.finish_timeline(job_id, status)
         return status
 
+    def job_timeline(self, job_id):
+        """
+        Returns the SquonkTiming.JobTimeline of a job, where the time of the
+        job went, creating it if the job wasn't started by this object.
+        """
+        timeline = self.timelines.get(job_id)
+        if timeline is None:
+            timeline = JobTimeline(job_id=job_id)
+            self._add_timeline(timeline)
+        return timeline
+
+    def observe_status(self, job_id, status):
+        """
+        Records a polled status of a job in its timeline.
+        """
+        timeline = self.job_timeline(job_id)
+        timeline.observe(status)
+        notify(self._observers, JobEvent('polled', timeline))
+
+    def finish_timeline(self, job_id, status):
+        """
+        Marks the timeline of a job finished with status, appending it to
+        the timeline file if there is one.
+        """
+        timeline = self.job_timeline(job_id)
+        timeline.finish(status)
+        notify(self._observers, JobEvent('finished', timeline))
+        if not self._timeline_file:
+            return
+        with self._timeline_lock:
+            with open(self._timeline_file, 'a') as f:
+                f.write(timeline.to_json() + '\n')
+
+    # keep the timeline of a job, dropping the oldest beyond the limit
+    def _add_timeline(self, timeline):
+        with self._timeline_lock:
+            self.timelines[timeline.job_id] = timeline
+            while len(self.timelines) > TIMELINE_LIMIT:
+                del self.timelines[next(iter(self.timelines))]
+
     # get content type from the header
     def _get_content_type(self,header):
         content_type = header['Content-Type'.encode()].decode()
@@ -592,28 +843,53 @@ class Squonk:
         """
 
         logging.info('getting results for job: ' + job_id)
+        timeline = self.timelines.get(job_id) or JobTimeline(job_id=job_id)
+        if job_id in self._local_jobs:
+            return self._local_results(job_id, dir, timeline)
 
         # stop the warning for a parse error due to whitespace in the
         # headers
         logging.getLogger("urllib3").setLevel(logging.ERROR)
 
+        start = time.time()
         response = self.server.send('get', self._config['jobs_endpoint'] + job_id + '/results')
+        timeline.download_seconds = time.time() - start
 
         # put the logging level back
         logging.getLogger("urllib3").setLevel(logging.INFO)
         if not response:
             return response
+        timeline.download_bytes = len(response.content)
         logging.debug('parsing response ....')
+        # the decoder is only loaded when it is needed, to keep startup fast
+        from requests_toolbelt.multipart import decoder
+        start = time.time()
         count=0
         multipart_data = decoder.MultipartDecoder.from_response(response)
         for part in multipart_data.parts:
             count+=1
             logging.debug("HEADER =========PART:"+str(count))
             logging.debug(part.headers)
-            self._write_file(part,dir)
+            timeline.write_bytes += self._write_file(part,dir)
+        timeline.write_seconds = time.time() - start
         return response
 
-    # given part of a multipart response, write out a file.
+    # copy the output files of a local job to dir
+    def _local_results(self, job_id, dir, timeline):
+        if dir and not os.path.exists(dir):
+            logging.error('Specified directory: {} does not exist'.format(dir) )
+            return False
+        start = time.time()
+        for file_name in [DATA_FILE, META_FILE]:
+            out_name = os.path.join(dir, file_name) if dir else file_name
+            logging.info('Writing: ' + out_name)
+            shutil.copyfile(os.path.join(self._local_jobs[job_id], file_name), out_name)
+            timeline.write_bytes += os.path.getsize(out_name)
+        timeline.write_seconds = time.time() - start
+        return True
+
+    # given part of a multipart response, write out a file, returning the
+    # number of bytes written.
 
     def _write_file(self,part,dir):
 
@@ -622,11 +898,22 @@ class Squonk:
         file_name = self._get_filename(part.headers)
         if len(file_name) < 2:
             logging.debug('No filename, ignoring')
-            return
+            return 0
+
+        # the content has been read into memory by the multipart decoder.
+        # A memoryview of it, so the blocks sliced off it to decompress
+        # aren't copies.
+        content = memoryview(part.content)
+        content_type = self._get_content_type(part.headers)
+        logging.debug('content type: ' + content_type)
+        action = self.content_types.get(content_type, 'write_file')
+        compressed = is_gzip(content)
+        decompress = compressed and action == 'decompress'
 
-        # if the file is not gzipped but ends in gz, remove the .gz
+        # if the file is not (or no longer) gzipped but ends in gz, remove
+        # the .gz
 
-        if not _is_gzip(part.content):
+        if not compressed or decompress:
             if file_name.endswith('.gz'):
                 file_name = file_name[:-3]
 
@@ -635,24 +922,78 @@ class Squonk:
         if dir:
             if not os.path.exists(dir):
                 logging.error('Specified directory: {} does not exist'.format(dir) )
-                return
+                return 0
             else:
                 file_name = os.path.join( dir, file_name)
         logging.info('Writing: ' + file_name)
 
-        # extract the content
-        content_type = self._get_content_type(part.headers)
-        print(content_type)
-        content = part.content
-        mode = 'wb'
-        if content_type != 'image/png':
-            content = part.content.decode()
-            mode = 'w'
-
         # write out the file.
-        with open(file_name, mode) as f:
-            f.write(content)
-            f.close()
+        with open(file_name, 'wb') as f:
+            if decompress:
+                _gunzip_to(content, f)
+            else:
+                f.write(content)
+            return f.tell()
+
+# decompress gzipped content (which may have several members) into an open
+# binary file a block at a time. Data after the last member that isn't
+# gzipped is left out, with a warning.
+def _gunzip_to(content, f):
+    pos = 0
+    while pos < len(content):
+        unzip = zlib.decompressobj(wbits=31)
+        while pos < len(content) and not unzip.eof:
+            block = content[pos:pos + WRITE_BLOCK_BYTES]
+            pos += len(block)
+            f.write(unzip.decompress(block, WRITE_BLOCK_BYTES))
+            # the rest of the block held back by the output limit, up to the
+            # end of the member
+            while unzip.unconsumed_tail and not unzip.eof:
+                f.write(unzip.decompress(unzip.unconsumed_tail, WRITE_BLOCK_BYTES))
+        if unzip.eof:
+            # start of the next member, if any. The input after the end of
+            # the member is all in unused_data (zlib leaves a copy of it in
+            # unconsumed_tail too, so that is not counted again), and
+            # flush would append it to unused_data a second time.
+            pos -= len(unzip.unused_data)
+        else:
+            f.write(unzip.flush())
+        if not is_gzip(content[pos:]):
+            break
+    if pos < len(content):
+        logging.warning('ignored {} bytes after the gzipped data of {}'.format(
+                        len(content) - pos, getattr(f, 'name', 'a result')))
+
+# run the job of the command line through an agent
+def run_via_agent(args):
+    try:
+        from .SquonkAgent import agent_request, DEFAULT_SOCKET
+    except:
+        from SquonkAgent import agent_request, DEFAULT_SOCKET
+    if not args.yaml:
+        print("You must specify --yaml with --via-agent")
+        exit()
+    convert = 'client' if args.client else args.convert
+    request = { 'command': 'run',
+                'yaml': args.yaml,
+                'cwd': os.getcwd(),
+                'dir': args.dir,
+                'convert': convert,
+                'compress': True if args.compress else None,
+                'local': args.local,
+                'wait': not args.no_wait }
+    try:
+        response = agent_request(request, args.socket or DEFAULT_SOCKET)
+    except OSError as e:
+        print('Failed to connect to the agent: {}. Start one with --agent'.format(e))
+        exit(1)
+    if 'error' in response:
+        print('ERROR: ' + response['error'])
+        exit(1)
+    logging.info('job: {} status: {}'.format(response['job_id'], response['status']))
+    if not args.no_wait and response['status'] != 'RESULTS_READY':
+        print('Job Failed status=' + response['status'])
+        exit(1)
 
 def main():
 
@@ -663,7 +1004,21 @@ def main():
     parser.add_argument("-s", "--service", type=str, action="store", dest="service", help="name of service to generate a yaml template from", default=None)
     parser.add_argument("-i", "--info", action="store_true", dest="info", help="output the service definition instead of creating a template", default=False)
     parser.add_argument("-f", "--format", type=str, action="store", dest="format", help="data format to generate the yaml template for ", default='squonk', choices=['squonk','mol','sdf'])
-    parser.add_argument("-c", "--client", action="store_true", dest="client", help="perform conversions from sdf or mol on the client (default is server)", default=False)
+    parser.add_argument("-c", "--client", action="store_true", dest="client", help="perform conversions from sdf or mol on the client (same as --convert client)", default=False)
+    parser.add_argument("--convert", type=str, action="store", dest="convert", help="where to convert sdf or mol inputs, auto chooses per file from the timings of earlier runs", default='server', choices=['server','client','auto'])
+    parser.add_argument("-z", "--compress", action="store_true", dest="compress", help="gzip uncompressed input files while uploading them", default=False)
+    parser.add_argument("-l", "--local", action="store_true", dest="local", help="run simple core.dataset services (slice, merger) on the client", default=False)
+    parser.add_argument("--watch", type=str, action="store", dest="watch", help="watch a directory, running each job yaml or (with -r as the job template) input file dropped in it, writing results under -o", default=None)
+    parser.add_argument("-m", "--manifest", type=str, action="store", dest="manifest", help="run all the jobs of a (multi-document) yaml manifest, writing each job's results under -o", default=None)
+    parser.add_argument("--concurrency", type=int, action="store", dest="concurrency", help="with --watch or --manifest, the maximum number of jobs running at once", default=4)
+    parser.add_argument("--agent", action="store_true", dest="agent", help="run as an agent that runs jobs for --via-agent clients", default=False)
+    parser.add_argument("--via-agent", action="store_true", dest="via_agent", help="hand the job to a running agent instead of running it here", default=False)
+    parser.add_argument("--no-wait", action="store_true", dest="no_wait", help="with --via-agent, don't wait for the job to finish", default=False)
+    parser.add_argument("--socket", type=str, action="store", dest="socket", help="socket of the agent (default ~/.pysquonk/agent.sock)", default=None)
+    parser.add_argument("--timeline", type=str, action="store", dest="timeline", help="append the timeline of each job (json lines) to this file", default=None)
+    parser.add_argument("--metrics-port", type=int, action="store", dest="metrics_port", help="serve prometheus metrics on this localhost port", default=None)
+    parser.add_argument("--metrics-file", type=str, action="store", dest="metrics_file", help="rewrite prometheus metrics to this file (for node_exporter's textfile collector)", default=None)
+    parser.add_argument("-T", "--timing", action="store_true", dest="timing", help="report the timings of the requests to the server when finished", default=False)
     parser.add_argument("-d", "--debug", action="store_true", dest="debug", help="output debug messages", default=False)
     parser.add_argument("-w", "--wait", type=int, action="store", dest="wait", help="wait time in seconds between checks for job finishing", default=10)
     parser.add_argument("-o", "--output", type=str, action="store", dest="dir", help="directory to write output to either job output or template generation", default=None)
@@ -682,25 +1037,103 @@ def main():
     if args.service:
         logging.debug("Got service: " + args.service)
  
-    if not args.service and not args.yaml:
+    # hand the job to an agent, without authenticating here
+    if args.via_agent:
+        run_via_agent(args)
+        return
+
+    if not args.service and not args.yaml and not args.agent and not args.watch and not args.manifest:
         print("You must specify --service or --yaml")
         exit()
     if args.service and args.yaml:
         print("You can't specify --service and --yaml")
         exit()
 
+    # collect request timings, reported at exit
+    observers = []
+    if args.timing:
+        try:
+            from .SquonkTiming import TimingStats
+        except:
+            from SquonkTiming import TimingStats
+        timing = TimingStats()
+        observers.append(timing)
+        atexit.register(lambda: print(timing.table()))
+    if args.metrics_port or args.metrics_file:
+        try:
+            from .SquonkMetrics import SquonkMetrics
+        except:
+            from SquonkMetrics import SquonkMetrics
+        metrics = SquonkMetrics()
+        observers.append(metrics)
+        if args.metrics_port:
+            metrics.serve(args.metrics_port)
+        if args.metrics_file:
+            metrics.start_textfile(args.metrics_file)
+            atexit.register(lambda: metrics.write_textfile(args.metrics_file))
+
     # Create a Squonk object
     try:
-        squonk = Squonk(user=args.user, password=args.password)
+        squonk = Squonk(user=args.user, password=args.password, compress_uploads=args.compress, observers=observers,
+                        timeline_file=args.timeline)
     except SquonkAuthException:
         print('Failed to authenticate with squonk service. Check your username and password')
         exit()
 
+    # run a batch of jobs
+    if args.manifest:
+        try:
+            from .SquonkManifest import load_manifest, run_manifest, summary
+        except:
+            from SquonkManifest import load_manifest, run_manifest, summary
+        jobs = load_manifest(args.manifest)
+        logging.info('Running {} jobs from {}'.format(len(jobs), args.manifest))
+        convert = 'client' if args.client else args.convert
+        results = run_manifest(squonk, jobs, args.dir or '.', concurrency=args.concurrency,
+                               convert_onserver='auto' if convert == 'auto' else convert == 'server',
+                               local=args.local, wait=args.wait)
+        print(summary(results))
+        if any(result['status'] != 'RESULTS_READY' for result in results):
+            exit(1)
+        return
+
+    # watch a directory until interrupted, -r is the job template
+    if args.watch:
+        try:
+            from .SquonkWatch import SquonkWatch
+        except:
+            from SquonkWatch import SquonkWatch
+        convert = 'client' if args.client else args.convert
+        watch = SquonkWatch(squonk, args.watch, args.dir or '.', template=args.yaml,
+                            concurrency=args.concurrency,
+                            convert_onserver='auto' if convert == 'auto' else convert == 'server',
+                            local=args.local, wait=args.wait)
+        try:
+            watch.run()
+        except KeyboardInterrupt:
+            watch.stop()
+        return
+
+    # run as an agent until stopped
+    if args.agent:
+        try:
+            from .SquonkAgent import SquonkAgent, DEFAULT_SOCKET
+        except:
+            from SquonkAgent import SquonkAgent, DEFAULT_SOCKET
+        agent = SquonkAgent(squonk, args.socket or DEFAULT_SOCKET, poll_interval=args.wait)
+        try:
+            agent.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
     # its a .yaml file, then run the job
     if args.yaml:
         input=args.yaml
         logging.info('Running job from yaml file: '+input)
-        job_id = squonk.run_job(yaml=input, convert_onserver=not args.client)
+        convert = 'client' if args.client else args.convert
+        convert_onserver = 'auto' if convert == 'auto' else convert == 'server'
+        job_id = squonk.run_job(yaml=input, convert_onserver=convert_onserver, local=args.local)
         if job_id:
             logging.info('submitted job: ' + job_id)
             # wait for job to finish and get the results
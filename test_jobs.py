@@ -4,8 +4,11 @@ import logging
 import argparse
 import glob
 import getpass
+import json
 from squonk import Squonk
-from utils import peek
+from utils import peek, sniff, open_sniffed, iter_dataset
+from SquonkLocal import local_service
+from SquonkFakeServer import SquonkFakeServer
 
 # this script runs all the jobs defined in the yaml directory and
 # tries to do some tests to see if they worked or not.
@@ -24,11 +27,72 @@ def check_value(expected,actual,item):
         print('ERROR: value {} expected {} got {}'.format(item,expected,actual))
         exit()
 
+# compare the output of a job run locally with the server output. uuids
+# are only compared for dataset inputs as the server generates new ones
+# when it reads sdf.
+def check_local(job_name, server_dir, local_dir, compare_uuids):
+    files = expected_files[job_name]
+    with open(os.path.join(server_dir, files['meta'])) as f:
+        server_meta = json.load(f)
+    with open(os.path.join(local_dir, files['meta'])) as f:
+        local_meta = json.load(f)
+    for item in ['type', 'size', 'valueClassMappings']:
+        check_value(server_meta.get(item), local_meta.get(item), 'local meta ' + item)
+    check_value([prop['fieldName'] for prop in server_meta.get('fieldMetaProps', [])],
+                [prop['fieldName'] for prop in local_meta.get('fieldMetaProps', [])],
+                'local meta fieldMetaProps')
+    server_records = read_records(os.path.join(server_dir, files['data']))
+    local_records = read_records(os.path.join(local_dir, files['data']))
+    if not compare_uuids:
+        for record in server_records + local_records:
+            record.pop('uuid', None)
+    check_value(len(server_records), len(local_records), 'local number of records')
+    for i, (server_record, local_record) in enumerate(zip(server_records, local_records)):
+        if server_record != local_record:
+            check_value(server_record, local_record, 'local record ' + str(i))
+    print('OK: local {} output matches the server'.format(job_name))
+
+# check the output files of a job in outdir are as expected
+def check_output(job_name, outdir):
+    # check if we got the files
+    if 'other' in expected_files[job_name]:
+        epath = os.path.join(outdir,expected_files[job_name]['other'])
+        check_exists(outdir,epath)
+    if 'meta' in expected_files[job_name]:
+        epath = os.path.join(outdir,expected_files[job_name]['meta'])
+        check_exists(outdir,epath)
+        file_info = peek(epath,False)
+        check_value('meta', file_info['type'], 'file type')
+        check_value(True, file_info['recent'], 'file timestamp recent')
+
+    if 'data' in expected_files[job_name]:
+        epath = os.path.join(outdir,expected_files[job_name]['data'])
+        check_exists(outdir,epath)
+        field=None
+        if 'field' in expected_files[job_name]:
+            field=expected_files[job_name]['field']
+        file_info = peek(epath,False,field)
+        check_value('data', file_info['type'], 'file type')
+        check_value(True, file_info['recent'], 'file timestamp')
+        if 'nrecs' in expected_files[job_name]:
+            check_value(expected_files[job_name]['nrecs'], file_info['nrecs'], 'number of records')
+        if field:
+            if file_info['fields']:
+                print('OK Field: ' + field + ' ' + str(file_info['fields']) )
+            else:
+                print('OK Field: ' + field + ' not present ')
+
+def read_records(file_name):
+    with open_sniffed(file_name, sniff(file_name)[1]) as f:
+        return list(iter_dataset(f))
+
 # Get command line
 parser = argparse.ArgumentParser(description='Python Squonk API test jobs')
 parser.add_argument("-u", "--username", type=str, help="Username on the service", dest='username')
 parser.add_argument("-p", "--password", type=str, help="Password on the service", dest='password')
 parser.add_argument("-d", "--debug", action="store_true", dest="debug", help="output debug messages", default=False)
+parser.add_argument("-l", "--local", action="store_true", dest="local", help="also run the services that can run on the client locally, and check their output matches the server (with -f, that it is as expected)", default=False)
+parser.add_argument("-f", "--fake", action="store_true", dest="fake", help="run the jobs against a local fake server (SquonkFakeServer) instead of the real one", default=False)
 parser.add_argument("-r", "--run", type=str, help="Service to run. Assumes the existence of a file called yaml/service.yaml", dest='yaml', default=None)
 
 args = parser.parse_args()
@@ -40,25 +104,30 @@ else:
 
 # user name and password and set config
 
-username = args.username
-if not username:
-    username = input('Enter Username:')
-password = args.password
-if not password:
-    password = getpass.getpass('Enter Password:')
-
-auth_url = 'https://sso.apps.xchem.diamond.ac.uk/auth/realms/xchem/protocol/openid-connect/token'
-base_url = 'https://jobexecutor.apps.xchem.diamond.ac.uk/jobexecutor/rest/v1'
-#service = 'core.dataset.filter.slice.v1';
-
-config = {
-  'base_url' : base_url,
-  'auth_url' : auth_url,
-  'username' : username,
-  'password' : password,
-  'services_endpoint' : 'services/',
-  'jobs_endpoint' : 'jobs/'
-}
+if args.fake:
+    fake_server = SquonkFakeServer(job_seconds=1)
+    fake_server.start()
+    config = fake_server.config()
+else:
+    username = args.username
+    if not username:
+        username = input('Enter Username:')
+    password = args.password
+    if not password:
+        password = getpass.getpass('Enter Password:')
+
+    auth_url = 'https://sso.apps.xchem.diamond.ac.uk/auth/realms/xchem/protocol/openid-connect/token'
+    base_url = 'https://jobexecutor.apps.xchem.diamond.ac.uk/jobexecutor/rest/v1'
+    #service = 'core.dataset.filter.slice.v1';
+
+    config = {
+      'base_url' : base_url,
+      'auth_url' : auth_url,
+      'username' : username,
+      'password' : password,
+      'services_endpoint' : 'services/',
+      'jobs_endpoint' : 'jobs/'
+    }
 
 # expected output files
 
@@ -154,39 +223,42 @@ for yaml in yamls:
 
     # wait for results
     print('job_wait ' + job_id)
-    squonk.job_wait(job_id, dir=outdir)
+    status = squonk.job_wait(job_id, dir=outdir, sleep=1 if args.fake else 10)
+
+    # the fake server only gives the real output for the services that
+    # can run locally, the others just have to finish
+    if args.fake and not local_service(job_name):
+        check_value('RESULTS_READY', status, 'job status')
+        count+=1
+        continue
 
     if not job_name in expected_files:
         print('No checks defined for :' + job_name)
         continue
 
-    # check if we got the files
-    if 'other' in expected_files[job_name]:
-        epath = os.path.join(outdir,expected_files[job_name]['other'])
-        check_exists(outdir,epath)
-    if 'meta' in expected_files[job_name]:
-        epath = os.path.join(outdir,expected_files[job_name]['meta'])
-        check_exists(outdir,epath)
-        file_info = peek(epath,False)
-        check_value('meta', file_info['type'], 'file type')
-        check_value(True, file_info['recent'], 'file timestamp recent')
-        
-    if 'data' in expected_files[job_name]:
-        epath = os.path.join(outdir,expected_files[job_name]['data'])
-        check_exists(outdir,epath)
-        field=None
-        if 'field' in expected_files[job_name]:
-            field=expected_files[job_name]['field']
-        file_info = peek(epath,False,field)
-        check_value('data', file_info['type'], 'file type')
-        check_value(True, file_info['recent'], 'file timestamp')
-        if 'nrecs' in expected_files[job_name]:
-            check_value(expected_files[job_name]['nrecs'], file_info['nrecs'], 'number of records')
-        if field:
-            if file_info['fields']:
-                print('OK Field: ' + field + ' ' + str(file_info['fields']) )
-            else:
-                print('OK Field: ' + field + ' not present ')
+    check_output(job_name, outdir)
+
+    # run locally and compare with the server output. The fake server
+    # makes the output of these services by running them locally, so
+    # offline the local output is checked against the expected files
+    # rather than compared with it.
+    if args.local and local_service(job_name):
+        local_dir = os.path.join(outdir, 'local')
+        if not os.path.exists(local_dir):
+            os.mkdir(local_dir)
+        job_id = squonk.run_job(yaml=yaml, local=True)
+        if not job_id or not job_id.startswith('local-'):
+            print('ERROR: job did not run locally: ' + yaml)
+            exit()
+        squonk.job_wait(job_id, dir=local_dir)
+        with open(yaml) as f:
+            job_text = f.read()
+        if args.fake:
+            check_output(job_name, local_dir)
+            print('OK: local {} output as expected'.format(job_name))
+        else:
+            compare_uuids = not 'sdf:' in job_text and not 'mol:' in job_text
+            check_local(job_name, outdir, local_dir, compare_uuids)
 
     count+=1
 
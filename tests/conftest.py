@@ -0,0 +1,20 @@
+# The modules are at the top of the repository (not an installed
+# package), so make them importable by the tests.
+import os
+import sys
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+@pytest.fixture
+def fake_server():
+    """
+    A SquonkFakeServer with quick jobs, its services made from yaml/
+    """
+    from SquonkFakeServer import SquonkFakeServer
+    server = SquonkFakeServer(yaml_dir=os.path.join(root, 'yaml'), job_seconds=0.05)
+    server.start()
+    yield server
+    server.stop()
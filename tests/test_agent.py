@@ -0,0 +1,185 @@
+import gzip
+import os
+import socket
+import stat
+import threading
+import time
+
+import pytest
+
+from squonk import Squonk
+from SquonkAgent import SquonkAgent, STATUS_RETRIES, agent_request, agent_running
+from SquonkFakeServer import SquonkFakeServer
+from utils import is_gzip
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SLICE = 'yaml/core.dataset.filter.slice.v1.yaml'
+
+def wait_for_socket(socket_path, seconds=10):
+    deadline = time.time() + seconds
+    while not agent_running(socket_path):
+        assert time.time() < deadline, 'the agent did not start'
+        time.sleep(0.02)
+
+@pytest.fixture
+def agent(fake_server, tmp_path):
+    squonk = Squonk(config=fake_server.config())
+    agent = SquonkAgent(squonk, str(tmp_path / 'agent.sock'), poll_interval=0.05)
+    thread = threading.Thread(target=agent.serve_forever, daemon=True)
+    thread.start()
+    wait_for_socket(agent._socket_path)
+    yield agent
+    agent.stop()
+    thread.join(10)
+
+def run_request(agent, tmp_path, **request):
+    request = dict({ 'command': 'run', 'yaml': SLICE, 'cwd': root, 'dir': str(tmp_path / 'out') }, **request)
+    # as with -o, the output directory must exist
+    os.makedirs(request['dir'], exist_ok=True)
+    return agent_request(request, agent._socket_path)
+
+def read_text(file_name):
+    """
+    The text of a result file, which is kept gzipped if it was sent so
+    """
+    with open(file_name, 'rb') as f:
+        content = f.read()
+    return (gzip.decompress(content) if is_gzip(content) else content).decode()
+
+def count_records(file_name):
+    return read_text(file_name).count('"uuid"')
+
+def test_ping_and_unknown_requests(agent):
+    assert agent_request({ 'command': 'ping' }, agent._socket_path) == { 'status': 'OK', 'jobs': 0 }
+    assert 'error' in agent_request({ 'command': 'nonsense' }, agent._socket_path)
+    assert 'error' in agent_request({ 'command': 'status', 'job_id': 'nope' }, agent._socket_path)
+    assert 'error' in agent_request({ 'command': 'wait', 'job_id': 'nope' }, agent._socket_path)
+
+def test_run_and_wait(agent, tmp_path):
+    response = run_request(agent, tmp_path, wait=True)
+    assert response['status'] == 'RESULTS_READY'
+    assert response['dir'] == str(tmp_path / 'out')
+    # the slice of the yaml, count 5
+    assert count_records(str(tmp_path / 'out' / 'output_output.data')) == 5
+
+def test_run_without_waiting(agent, tmp_path):
+    response = run_request(agent, tmp_path)
+    assert response['status'] == 'SUBMITTED'
+    job_id = response['job_id']
+    assert agent_request({ 'command': 'wait', 'job_id': job_id }, agent._socket_path)['status'] == 'RESULTS_READY'
+    assert agent_request({ 'command': 'status', 'job_id': job_id }, agent._socket_path) == \
+        { 'job_id': job_id, 'status': 'RESULTS_READY' }
+    assert os.path.isfile(str(tmp_path / 'out' / 'output_output.data'))
+
+def test_concurrent_clients(agent, tmp_path):
+    responses = {}
+    def client(n):
+        responses[n] = run_request(agent, tmp_path, dir=str(tmp_path / str(n)), wait=True)
+    threads = [ threading.Thread(target=client, args=(n,)) for n in range(4) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert [ responses[n]['status'] for n in range(4) ] == ['RESULTS_READY'] * 4
+    assert len(set(response['job_id'] for response in responses.values())) == 4
+    for n in range(4):
+        assert count_records(str(tmp_path / str(n) / 'output_output.data')) == 5
+
+def test_bad_job_yaml(agent, tmp_path):
+    yaml_name = tmp_path / 'bad.yaml'
+    yaml_name.write_text('service_name: core.dataset.filter.slice.v1\n')
+    response = run_request(agent, tmp_path, yaml=str(yaml_name))
+    assert 'missing section' in response['error']
+
+def test_stop_removes_the_socket(fake_server, tmp_path):
+    socket_path = str(tmp_path / 'agent.sock')
+    agent = SquonkAgent(Squonk(config=fake_server.config()), socket_path, poll_interval=0.05)
+    thread = threading.Thread(target=agent.serve_forever, daemon=True)
+    thread.start()
+    wait_for_socket(socket_path)
+    assert agent_request({ 'command': 'stop' }, socket_path) == { 'status': 'STOPPING' }
+    thread.join(10)
+    assert not thread.is_alive()
+    assert not os.path.exists(socket_path)
+    assert not agent_running(socket_path)
+
+def test_stale_socket_is_replaced(fake_server, tmp_path):
+    socket_path = str(tmp_path / 'agent.sock')
+    # left by an agent that was killed
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+    agent = SquonkAgent(Squonk(config=fake_server.config()), socket_path, poll_interval=0.05)
+    thread = threading.Thread(target=agent.serve_forever, daemon=True)
+    thread.start()
+    wait_for_socket(socket_path)
+    # but not one an agent is listening on
+    second = SquonkAgent(Squonk(config=fake_server.config()), socket_path)
+    with pytest.raises(Exception, match='already listening'):
+        second.serve_forever()
+    assert agent_running(socket_path)
+    agent.stop()
+    thread.join(10)
+
+def test_socket_is_private(fake_server, tmp_path):
+    socket_path = str(tmp_path / 'new' / 'agent.sock')
+    agent = SquonkAgent(Squonk(config=fake_server.config()), socket_path)
+    thread = threading.Thread(target=agent.serve_forever, daemon=True)
+    thread.start()
+    try:
+        wait_for_socket(socket_path)
+        assert stat.S_IMODE(os.stat(str(tmp_path / 'new')).st_mode) == 0o700
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) & 0o077 == 0
+    finally:
+        agent.stop()
+        thread.join(10)
+
+def test_failed_status_checks_are_retried(agent, tmp_path, monkeypatch):
+    job_status = agent.squonk.job_status
+    failures = []
+    def flaky_job_status(job_id):
+        # the first checks fail, as job_status does when the server errs
+        if len(failures) < STATUS_RETRIES - 1:
+            failures.append(job_id)
+            return None
+        return job_status(job_id)
+    monkeypatch.setattr(agent.squonk, 'job_status', flaky_job_status)
+    assert run_request(agent, tmp_path, wait=True)['status'] == 'RESULTS_READY'
+    assert len(failures) == STATUS_RETRIES - 1
+
+def test_status_errors_are_reported(agent, tmp_path, monkeypatch):
+    monkeypatch.setattr(agent.squonk, 'job_status', lambda job_id: None)
+    assert run_request(agent, tmp_path, wait=True)['status'] == 'SQUOANK_API_ERROR'
+
+def test_threads_do_not_share_sessions(tmp_path):
+    server = SquonkFakeServer(yaml_dir=os.path.join(root, 'yaml'), latency=0.2)
+    server.start()
+    try:
+        squonk = Squonk(config=server.config())
+        sessions = set()
+        take_session = squonk.server._take_session
+        def recording_take_session():
+            session = take_session()
+            sessions.add(id(session))
+            return session
+        squonk.server._take_session = recording_take_session
+        barrier = threading.Barrier(4)
+        results = []
+        def client():
+            barrier.wait()
+            results.append(squonk.ping())
+        threads = [ threading.Thread(target=client) for n in range(4) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        assert results == [True] * 4
+        assert len(sessions) == 4
+        # and they are reused
+        assert squonk.ping()
+        assert len(sessions) == 4
+        squonk.server.close()
+        assert squonk.server._sessions == []
+    finally:
+        server.stop()
@@ -0,0 +1,78 @@
+import os
+import threading
+
+from SquonkCache import SquonkCache
+
+def source(tmp_path, text='CCO\n'):
+    file_name = str(tmp_path / 'input.sdf')
+    with open(file_name, 'w') as f:
+        f.write(text)
+    return file_name
+
+def test_memory_hit_and_miss(tmp_path):
+    cache = SquonkCache()
+    file_name = source(tmp_path)
+    assert cache.get(file_name, 'sdf>squonk') is None
+    cache.put(file_name, 'sdf>squonk', [b'data', b'meta'])
+    assert cache.get(file_name, 'sdf>squonk') == (b'data', b'meta')
+    assert cache.get(file_name, 'mol>sdf') is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_changed_file_is_a_miss(tmp_path):
+    cache = SquonkCache()
+    file_name = source(tmp_path)
+    cache.put(file_name, 'sdf>squonk', [b'data'])
+    source(tmp_path, 'CCCO\n')
+    assert cache.get(file_name, 'sdf>squonk') is None
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = SquonkCache(max_bytes=10)
+    first = source(tmp_path)
+    cache.put(first, 'a', [b'123456'])
+    cache.put(first, 'b', [b'123456'])
+    assert cache.get(first, 'a') is None
+    assert cache.get(first, 'b') == (b'123456',)
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    file_name = source(tmp_path)
+    SquonkCache(cache_dir=cache_dir).put(file_name, 'sdf>squonk', [b'data', b''])
+    cache = SquonkCache(cache_dir=cache_dir)
+    assert cache.has(file_name, 'sdf>squonk')
+    assert cache.get(file_name, 'sdf>squonk') == (b'data', b'')
+    assert not [name for name in os.listdir(cache_dir) if name.endswith('.tmp')]
+
+def test_concurrent_puts_of_the_same_key(tmp_path):
+    cache = SquonkCache(cache_dir=str(tmp_path / 'cache'))
+    file_name = source(tmp_path)
+    errors = []
+    def put():
+        try:
+            for i in range(50):
+                cache.put(file_name, 'sdf>squonk', [b'x' * 10000])
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=put) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert SquonkCache(cache_dir=str(tmp_path / 'cache')).get(file_name, 'sdf>squonk') == (b'x' * 10000,)
+
+def test_disk_errors_are_ignored(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    cache = SquonkCache(cache_dir=cache_dir)
+    file_name = source(tmp_path)
+    os.rmdir(cache_dir)
+    cache.put(file_name, 'sdf>squonk', [b'data'])
+    assert cache.get(file_name, 'sdf>squonk') == (b'data',)
+
+def test_truncated_disk_file_is_a_miss(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    file_name = source(tmp_path)
+    SquonkCache(cache_dir=cache_dir).put(file_name, 'sdf>squonk', [b'data' * 100])
+    disk_name = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+    with open(disk_name, 'r+b') as f:
+        f.truncate(20)
+    assert SquonkCache(cache_dir=cache_dir).get(file_name, 'sdf>squonk') is None
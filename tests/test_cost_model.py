@@ -0,0 +1,105 @@
+import gzip
+import json
+import os
+import threading
+
+import pytest
+
+from SquonkCostModel import SquonkCostModel, default_estimates
+from squonk import Squonk
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+SERVICE = 'rdkit.calculators.canonical_smiles'
+OPTIONS = { 'query.mode': 'WHOLE_MOLECULE' }
+
+def test_defaults_without_a_timings_file():
+    model = SquonkCostModel(None)
+    assert model.estimates == default_estimates
+    model.save()
+
+def test_decide_follows_the_estimates():
+    model = SquonkCostModel(None)
+    file_name = os.path.join(DATA, 'mols.sdf')
+    # a slow link and data that shrinks when converted: convert locally
+    model.estimates.update(upload_bps=1000, expansion=0.5, convert_bps=1e9)
+    assert model.decide(file_name) is False
+    # a fast link and slow local conversion: convert on the server
+    model.estimates.update(upload_bps=1e9, expansion=1.3, convert_bps=1000)
+    assert model.decide(file_name) is True
+    # unless the local conversion is already cached
+    model.estimates.update(upload_bps=1e6, expansion=0.9, convert_bps=1)
+    assert model.decide(file_name, cached=True) is False
+    assert [decision['convert'] for decision in model.decisions] == ['client', 'server', 'client']
+
+def test_running_averages():
+    model = SquonkCostModel(None)
+    model.record_upload(1000, 1)
+    assert model.samples['upload_bps'] == 0
+    model.record_upload(1000000, 1)
+    model.record_upload(2000000, 1)
+    assert model.estimates['upload_bps'] == pytest.approx(1300000)
+    model.record_compression(100, 20)
+    assert model.estimates['gzip_ratio'] == 0.2
+
+def test_timings_carry_over(tmp_path):
+    timings_file = str(tmp_path / 'dir' / 'timings.json')
+    model = SquonkCostModel(timings_file)
+    model.record_conversion(1000, 2000, 0.001)
+    model.save()
+    assert SquonkCostModel(timings_file).estimates['expansion'] == 2
+    assert os.listdir(str(tmp_path / 'dir')) == ['timings.json']
+
+def test_unreadable_timings_file(tmp_path):
+    timings_file = str(tmp_path / 'timings.json')
+    with open(timings_file, 'w') as f:
+        f.write('{ not json')
+    assert SquonkCostModel(timings_file).estimates == default_estimates
+
+def test_concurrent_saves(tmp_path):
+    timings_file = str(tmp_path / 'timings.json')
+    model = SquonkCostModel(timings_file)
+    threads = [ threading.Thread(target=lambda: [model.save() for i in range(20)]) for i in range(8) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with open(timings_file) as f:
+        assert 'estimates' in json.load(f)
+    assert os.listdir(str(tmp_path)) == ['timings.json']
+
+@pytest.mark.parametrize('convert, always_record, recorded', [ (True, False, False),
+                                                               (False, False, False),
+                                                               ('auto', False, True),
+                                                               (True, True, True),
+                                                               (False, True, True) ])
+def test_jobs_only_record_timings_in_auto_mode(fake_server, tmp_path, convert, always_record, recorded):
+    timings_file = str(tmp_path / 'timings.json')
+    model = SquonkCostModel(timings_file, always_record)
+    squonk = Squonk(config=fake_server.config(), cost_model=model)
+    job_id = squonk.run_job(SERVICE, OPTIONS, { 'input': { 'sdf': os.path.join(DATA, 'mols.sdf') } },
+                            convert_onserver=convert)
+    assert job_id
+    assert os.path.exists(timings_file) == recorded
+    if not recorded:
+        assert sum(model.samples.values()) == 0
+    elif convert is False:
+        assert model.samples['convert_bps'] == 1
+
+def test_gzipped_conversions_are_recorded_uncompressed(fake_server, tmp_path):
+    gz_name = os.path.join(DATA, 'dhfr_3d.sdf.gz')
+    sdf_name = str(tmp_path / 'dhfr_3d.sdf')
+    with gzip.open(gz_name, 'rb') as f_in, open(sdf_name, 'wb') as f_out:
+        f_out.write(f_in.read())
+    expansions = []
+    for file_name in [sdf_name, gz_name]:
+        model = SquonkCostModel(None, always_record=True)
+        model.estimates['gzip_ratio'] = os.path.getsize(gz_name) / os.path.getsize(sdf_name)
+        assert model.raw_size(file_name) == pytest.approx(os.path.getsize(sdf_name))
+        squonk = Squonk(config=fake_server.config(), cost_model=model)
+        assert squonk.run_job(SERVICE, OPTIONS, { 'input': { 'sdf': file_name } }, convert_onserver=False)
+        assert model.samples['expansion'] == 1
+        expansions.append(model.estimates['expansion'])
+    # the same molecules give the same expansion, gzipped or not
+    assert expansions[1] == pytest.approx(expansions[0])
+    assert 1 < expansions[0] < 3
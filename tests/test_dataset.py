@@ -0,0 +1,105 @@
+import gzip
+import io
+import json
+import math
+import os
+
+import pytest
+
+import utils
+from SquonkDataset import SquonkDataset
+from SquonkDatasetWriter import SquonkDatasetWriter
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+records = [ { 'uuid': '1', 'source': 'C', 'format': 'smiles', 'values': { 'score': 0.5, 'n': 1, 'ok': True } },
+            { 'uuid': '2', 'source': 'CC', 'format': 'smiles', 'values': { 'n': 2, 'name': 'b' } },
+            { 'uuid': '3', 'source': 'CCC', 'format': 'mol', 'values': { 'score': 0.1, 'n': 3 },
+              'extra': { 'x': [1] } },
+            { 'source': 'CCCC', 'uuid': '4', 'values': { 'score': 0.9, 'n': 4 } } ]
+
+def write(tmp_path, records, name='test.data.gz'):
+    file_name = str(tmp_path / name)
+    with gzip.open(file_name, 'wt') as f:
+        json.dump(records, f)
+    return file_name
+
+def round_trip(dataset):
+    out = io.StringIO()
+    with SquonkDatasetWriter(out) as writer:
+        for record in dataset.records():
+            writer.write(record)
+    return out.getvalue()
+
+@pytest.mark.parametrize('name', ['Kinase_inhibs', 'Building_blocks_GBP'])
+def test_records_reproduce_the_bundled_datasets(name):
+    data_file = os.path.join(DATA, name + ('.json.gz' if name == 'Kinase_inhibs' else '.data.gz'))
+    dataset = SquonkDataset(data_file, os.path.join(DATA, name + '.metadata'))
+    # pairs rather than dicts, so the order of the keys is compared too
+    with utils.open_file(data_file) as f:
+        expected = json.load(f, object_pairs_hook=list)
+    assert json.loads(round_trip(dataset), object_pairs_hook=list) == expected
+
+def test_records_keep_format_extra_keys_and_order(tmp_path):
+    dataset = SquonkDataset(write(tmp_path, records))
+    assert json.loads(round_trip(dataset), object_pairs_hook=list) == \
+        json.loads(json.dumps(records), object_pairs_hook=list)
+
+def test_columns_and_missing_values(tmp_path):
+    dataset = SquonkDataset(write(tmp_path, records))
+    assert len(dataset) == 4
+    assert dataset.kinds == { 'score': 'float', 'n': 'int', 'ok': 'bool', 'name': 'str' }
+    assert list(dataset.missing('score')) == [0, 1, 0, 0]
+    assert dataset.value('score', 1) is None
+    assert list(dataset.column('n')) == [1, 2, 3, 4]
+    assert list(dataset.column('name')) == [None, 'b', None, None]
+
+def test_mixed_column_becomes_strings(tmp_path):
+    dataset = SquonkDataset(write(tmp_path, [ { 'uuid': '1', 'values': { 'v': 1 } },
+                                              { 'uuid': '2', 'values': { 'v': 'many' } } ]))
+    assert dataset.kinds['v'] == 'str'
+    assert [dataset.value('v', i) for i in range(2)] == ['1', 'many']
+
+def test_chosen_fields_and_lazy_sources(tmp_path):
+    dataset = SquonkDataset(write(tmp_path, records), fields=['score'])
+    assert dataset.names == ['score']
+    assert dataset.source(2) == 'CCC'
+    assert list(dataset.sources()) == ['C', 'CC', 'CCC', 'CCCC']
+    assert list(dataset.records())[2] == { 'uuid': '3', 'source': 'CCC', 'format': 'mol',
+                                           'values': { 'score': 0.1 }, 'extra': { 'x': [1] } }
+
+def test_sort_filter_and_take(tmp_path):
+    dataset = SquonkDataset(write(tmp_path, records))
+    assert dataset.argsort('score') == [2, 0, 3, 1]
+    ordered = dataset.sort('score', reverse=True)
+    assert ordered.uuids == ['4', '1', '3', '2']
+    assert list(ordered.sources()) == ['CCCC', 'C', 'CCC', 'CC']
+    assert [record['uuid'] for record in ordered.records()] == ['4', '1', '3', '2']
+    assert list(ordered.records())[2] == records[2]
+    high = dataset.filter([not missing and value > 0.4
+                           for value, missing in zip(dataset.column('score'), dataset.missing('score'))])
+    assert high.uuids == ['1', '4']
+    assert list(high.records()) == [records[0], records[3]]
+
+def test_aggregate(tmp_path):
+    dataset = SquonkDataset(write(tmp_path, records))
+    result = dataset.aggregate('score')
+    assert result['count'] == 3
+    assert result['mean'] == pytest.approx(0.5)
+    with pytest.raises(Exception):
+        dataset.aggregate('name')
+
+def test_int_column_widened_to_float(tmp_path):
+    dataset = SquonkDataset(write(tmp_path, [ { 'uuid': '1', 'values': { 'v': 1 } },
+                                              { 'uuid': '2', 'values': { 'v': 2.5 } } ]))
+    assert dataset.kinds['v'] == 'float'
+    assert [dataset.value('v', i) for i in range(2)] == [1.0, 2.5]
+    assert not any(math.isnan(value) for value in dataset.column('v'))
+
+def test_int_in_float_column(tmp_path):
+    dataset = SquonkDataset(write(tmp_path, [ { 'uuid': '1', 'values': { 'v': 1.5 } },
+                                              { 'uuid': '2', 'values': { 'v': 2 } },
+                                              { 'uuid': '3', 'values': {} } ]))
+    assert dataset.kinds['v'] == 'float'
+    assert [dataset.value('v', i) for i in range(2)] == [1.5, 2.0]
+    assert dataset.missing('v') == bytearray(b'\x00\x00\x01')
@@ -0,0 +1,57 @@
+import gzip
+import io
+import json
+import os
+
+import utils
+from SquonkDatasetWriter import SquonkDatasetWriter, write_squonk
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+def without_uuids(records):
+    return [ { key: value for key, value in record.items() if key != 'uuid' } for record in records ]
+
+def test_write_records_to_streams():
+    out = io.StringIO()
+    meta_out = io.BytesIO()
+    with SquonkDatasetWriter(out, meta_out, 'in.sdf') as writer:
+        writer.write({ 'uuid': '1', 'source': 'C', 'format': 'smiles', 'values': { 'name': 'a', 'n': 1 } })
+        writer.write({ 'uuid': '2', 'source': 'CC', 'format': 'smiles', 'values': { 'x': 1.5, 'ok': True } })
+    assert json.loads(out.getvalue())[1]['values'] == { 'x': 1.5, 'ok': True }
+    meta = json.loads(meta_out.getvalue())
+    assert meta['size'] == 2
+    assert meta['valueClassMappings'] == { 'name': 'java.lang.String', 'n': 'java.lang.Integer',
+                                           'x': 'java.lang.Float', 'ok': 'java.lang.Boolean' }
+
+def test_empty_dataset():
+    out = io.BytesIO()
+    meta = SquonkDatasetWriter(out).close()
+    assert json.loads(out.getvalue()) == []
+    assert meta['size'] == 0
+
+def test_close_twice_returns_the_meta_data():
+    writer = SquonkDatasetWriter(io.StringIO())
+    assert writer.close() is writer.close()
+
+def test_write_squonk_matches_tosquonk(tmp_path):
+    file_name = os.path.join(DATA, 'dhfr_3d.sdf.gz')
+    data_name = str(tmp_path / 'out.data.gz')
+    meta_name = str(tmp_path / 'out.metadata')
+    meta = write_squonk(file_name, data_name, meta_name)
+    records, expected_meta, rc = utils.tosquonk(file_name)
+    with gzip.open(data_name, 'rt') as f:
+        assert without_uuids(json.load(f)) == without_uuids(records)
+    with open(meta_name) as f:
+        assert json.load(f) == meta
+    assert meta['size'] == expected_meta['size'] == len(records)
+    assert list(meta['valueClassMappings']) == list(expected_meta['valueClassMappings'])
+
+def test_write_squonk_mol(tmp_path):
+    out = io.StringIO()
+    meta = write_squonk(os.path.join(DATA, 'pyrimethamine.mol'), out)
+    records = json.loads(out.getvalue())
+    assert len(records) == meta['size'] == 1
+    assert records[0]['source'].endswith('M  END\n')
+
+def test_write_squonk_wrong_type():
+    assert write_squonk(os.path.join(DATA, 'Kinase_inhibs.json.gz'), io.StringIO()) is None
@@ -0,0 +1,142 @@
+import gzip
+import json
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import pytest
+
+from squonk import Squonk
+from SquonkFakeServer import SquonkFakeServer, catalog_from_yaml, AUTH_PATH, BASE_PATH
+from utils import is_gzip
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+YAML = os.path.join(root, 'yaml')
+
+SLICE = 'core.dataset.filter.slice.v1'
+SMILES = 'rdkit.calculators.canonical_smiles'
+
+def request(server, path, data=None, token=None, method=None):
+    """
+    Returns the status and parsed json response of a request to server
+    """
+    headers = { 'Authorization': 'bearer ' + token } if token else {}
+    req = urllib.request.Request(server.url + path, data=data, headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.status, json.loads(response.read().decode())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read().decode())
+
+def token(server, **form):
+    form = dict({ 'grant_type': 'password', 'username': 'fake', 'password': 'fake' }, **form)
+    return request(server, AUTH_PATH, urllib.parse.urlencode(form).encode())
+
+def kinase_inputs():
+    return { 'input': { 'data': os.path.join(root, 'data', 'Kinase_inhibs.json.gz'),
+                        'meta': os.path.join(root, 'data', 'Kinase_inhibs.metadata') } }
+
+def read_text(file_name):
+    """
+    The text of a result file, which is kept gzipped if it was sent so
+    """
+    with open(file_name, 'rb') as f:
+        content = f.read()
+    return (gzip.decompress(content) if is_gzip(content) else content).decode()
+
+def read_records(file_name):
+    return json.loads(read_text(file_name))
+
+def test_catalog_from_yaml():
+    catalog = { service['id']: service for service in catalog_from_yaml(YAML) }
+    assert SLICE in catalog and SMILES in catalog
+    slice = catalog[SLICE]
+    assert [descriptor['name'] for descriptor in slice['inputDescriptors']] == ['input']
+    # the type of the options is from their values in the yaml
+    types = { option['key']: option['typeDescriptor']['type'] for option in slice['optionDescriptors'] }
+    assert types == { 'count': 'java.lang.Integer', 'skip': 'java.lang.Integer' }
+
+def test_tokens():
+    server = SquonkFakeServer(yaml_dir=YAML, username='user', password='secret', token_seconds=60)
+    server.start()
+    try:
+        assert token(server, username='user', password='wrong')[0] == 401
+        status, response = token(server, username='user', password='secret')
+        assert status == 200 and response['expires_in'] == 60
+        status, refreshed = token(server, grant_type='refresh_token', refresh_token=response['refresh_token'])
+        assert status == 200 and refreshed['access_token'] != response['access_token']
+        assert token(server, grant_type='refresh_token', refresh_token='nope')[0] == 400
+        assert token(server, grant_type='implicit')[0] == 400
+        # the REST endpoints need a token
+        assert request(server, BASE_PATH + '/ping')[0] == 401
+        assert request(server, BASE_PATH + '/ping', token=response['access_token']) == (200, { 'status': 'OK' })
+    finally:
+        server.stop()
+
+def test_services_and_unknown_paths(fake_server):
+    access_token = token(fake_server)[1]['access_token']
+    status, services = request(fake_server, BASE_PATH + '/services', token=access_token)
+    assert status == 200
+    assert sorted(service['id'] for service in services) == sorted(service['id'] for service in fake_server.catalog)
+    status, service = request(fake_server, BASE_PATH + '/services/' + SLICE, token=access_token)
+    assert status == 200 and service['id'] == SLICE
+    assert request(fake_server, BASE_PATH + '/services/nope', token=access_token)[0] == 404
+    assert request(fake_server, BASE_PATH + '/jobs/nope/status', token=access_token)[0] == 404
+    assert request(fake_server, BASE_PATH + '/jobs/nope', token=access_token, method='DELETE')[0] == 404
+    assert request(fake_server, '/elsewhere')[0] == 404
+
+def test_slice_is_run_for_real(fake_server, tmp_path):
+    squonk = Squonk(config=fake_server.config())
+    job_id = squonk.run_job(SLICE, { 'skip': 2, 'count': 3 }, kinase_inputs())
+    assert squonk.job_status(job_id) in ['PENDING', 'RUNNING']
+    assert squonk.job_wait(job_id, dir=str(tmp_path), sleep=0.05) == 'RESULTS_READY'
+    expected = read_records(os.path.join(root, 'data', 'Kinase_inhibs.json.gz'))[2:5]
+    assert read_records(str(tmp_path / 'output_output.data')) == expected
+    # deleted by job_wait
+    assert job_id not in [job['jobId'] for job in squonk.list_jobs()]
+
+def test_other_services_return_their_input(tmp_path):
+    server = SquonkFakeServer(yaml_dir=YAML, job_seconds=0.05, result_records=30)
+    server.start()
+    try:
+        squonk = Squonk(config=server.config())
+        job_id = squonk.run_job(SMILES, { 'query.mode': 'WHOLE_MOLECULE' }, kinase_inputs())
+        assert squonk.job_wait(job_id, dir=str(tmp_path), sleep=0.05) == 'RESULTS_READY'
+    finally:
+        server.stop()
+    records = read_records(str(tmp_path / 'output_output.data'))
+    # repeated up to result_records, with new uuids
+    assert len(records) == 30 and len(set(record['uuid'] for record in records)) == 30
+    with open(str(tmp_path / 'output_metadata')) as f:
+        assert json.load(f)['size'] == 30
+
+def test_queued_and_failed_jobs(tmp_path):
+    server = SquonkFakeServer(yaml_dir=YAML, queue_seconds=0.2, job_seconds=0.05, fail_rate=1, seed=1)
+    server.start()
+    try:
+        squonk = Squonk(config=server.config())
+        job_id = squonk.run_job(SLICE, { 'count': 3 }, kinase_inputs())
+        assert squonk.job_status(job_id) == 'PENDING'
+        assert squonk.job_wait(job_id, dir=str(tmp_path), sleep=0.05) == 'ERROR'
+        statuses = [status for status, when in squonk.job_timeline(job_id).statuses]
+        assert statuses[0] == 'PENDING' and statuses[-1] == 'ERROR'
+    finally:
+        server.stop()
+
+def test_injected_errors():
+    server = SquonkFakeServer(yaml_dir=YAML, error_rate=1)
+    server.start()
+    try:
+        access_token = token(server)[1]['access_token']
+        # tokens are not failed, the REST requests are
+        assert request(server, BASE_PATH + '/ping', token=access_token)[0] == 503
+        assert server.requests == 2
+    finally:
+        server.stop()
+
+def test_write_config(fake_server, tmp_path):
+    config_file = str(tmp_path / 'config.ini')
+    fake_server.write_config(config_file)
+    squonk = Squonk(config_file=config_file)
+    assert SLICE in squonk.list_service_ids()
@@ -0,0 +1,95 @@
+import gzip
+import io
+import json
+import os
+import signal
+import zlib
+
+import pytest
+
+import squonk
+from squonk import _gunzip_to
+from utils import is_gzip
+
+# fail rather than hang if the decompression loops
+@pytest.fixture(autouse=True)
+def timeout():
+    def expired(signum, frame):
+        raise TimeoutError('_gunzip_to did not finish')
+    old = signal.signal(signal.SIGALRM, expired)
+    signal.alarm(10)
+    yield
+    signal.alarm(0)
+    signal.signal(signal.SIGALRM, old)
+
+def gunzip(content):
+    out = io.BytesIO()
+    _gunzip_to(memoryview(content), out)
+    return out.getvalue()
+
+def test_one_member():
+    data = b'CCO\n' * 100000
+    assert gunzip(gzip.compress(data)) == data
+
+def test_members_that_expand_beyond_a_block():
+    # each member expands to several output blocks from one input block
+    data = b'a' * 5000000
+    assert gunzip(gzip.compress(data) * 2) == data * 2
+
+def test_member_bigger_than_a_block_then_another():
+    first = bytes(range(256)) * 8000 + b'x' * 3000000
+    second = b'second member\n' * 1000
+    content = gzip.compress(first, compresslevel=0) + gzip.compress(second)
+    assert len(content) > squonk.WRITE_BLOCK_BYTES
+    assert gunzip(content) == first + second
+
+def test_many_small_members():
+    parts = [ str(i).encode() * (i + 1) for i in range(200) ]
+    assert gunzip(b''.join(gzip.compress(part) for part in parts)) == b''.join(parts)
+
+@pytest.mark.parametrize('trailing', [b'\0' * 1024, b'not gzip', b'\0' * (2 * 1024 * 1024)],
+                         ids=['padding', 'text', 'padding-bigger-than-a-block'])
+def test_trailing_data_is_left_out_with_a_warning(trailing, caplog):
+    data = b'a' * 5000000
+    assert gunzip(gzip.compress(data) + trailing) == data
+    assert gunzip(gzip.compress(data) * 2 + trailing) == data * 2
+    warnings = [record.getMessage() for record in caplog.records if record.levelname == 'WARNING']
+    assert warnings == ['ignored {} bytes after the gzipped data of a result'.format(len(trailing))] * 2
+
+def test_no_warning_without_trailing_data(caplog):
+    gunzip(gzip.compress(b'CCO\n') * 2)
+    assert not [record for record in caplog.records if record.levelname == 'WARNING']
+
+def test_truncated_member():
+    data = bytes(range(256)) * 1000
+    content = gzip.compress(data, compresslevel=0)
+    out = gunzip(content[:len(content) // 2])
+    assert data.startswith(out) and len(out) > 0
+
+def test_blocks_of_a_few_bytes(monkeypatch):
+    monkeypatch.setattr(squonk, 'WRITE_BLOCK_BYTES', 7)
+    data = b'CCO\n' * 1000
+    assert gunzip(gzip.compress(data) * 3 + b'\0\0') == data * 3
+
+SLICE = 'core.dataset.filter.slice.v1'
+
+def run_slice(squonk, dir):
+    data = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+    inputs = { 'input': { 'data': os.path.join(data, 'Kinase_inhibs.json.gz'),
+                          'meta': os.path.join(data, 'Kinase_inhibs.metadata') } }
+    job_id = squonk.run_job(SLICE, { 'count': 3 }, inputs)
+    assert squonk.job_wait(job_id, dir=str(dir), sleep=0.05) == 'RESULTS_READY'
+
+def test_results_are_kept_as_received_by_default(fake_server, tmp_path):
+    run_slice(squonk.Squonk(config=fake_server.config()), tmp_path)
+    # the fake server gzips the data
+    with open(str(tmp_path / 'output_output.data'), 'rb') as f:
+        content = f.read()
+    assert is_gzip(content)
+    assert len(json.loads(gzip.decompress(content).decode())) == 3
+
+def test_results_decompressed_by_content_type(fake_server, tmp_path):
+    content_types = { 'application/x-squonk-dataset-molecule+json': 'decompress' }
+    run_slice(squonk.Squonk(config=fake_server.config(), content_types=content_types), tmp_path)
+    with open(str(tmp_path / 'output_output.data')) as f:
+        assert len(json.load(f)) == 3
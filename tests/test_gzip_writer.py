@@ -0,0 +1,62 @@
+import gzip
+import io
+import os
+
+import pytest
+
+import SquonkGzip
+from SquonkGzip import ParallelGzipWriter, compress, gzip_file
+from squonk import _gunzip_to
+
+def sample(size):
+    return b''.join(b'%d CCO c1ccccc1\n' % i for i in range(size // 16 + 1))[:size]
+
+@pytest.mark.parametrize('size', [0, 1, 1000, 4096, 4097, 100000])
+def test_round_trip(size):
+    data = sample(size)
+    content = compress(data, threads=4, block_bytes=4096)
+    assert gzip.decompress(content) == data
+
+def test_many_small_writes():
+    data = sample(50000)
+    out = io.BytesIO()
+    with ParallelGzipWriter(out, level=1, threads=2, block_bytes=1000) as writer:
+        for i in range(0, len(data), 7):
+            writer.write(data[i:i + 7])
+    assert gzip.decompress(out.getvalue()) == data
+    assert writer.bytes_in == len(data)
+    assert writer.bytes_out == len(out.getvalue())
+
+def test_flush_writes_everything_so_far():
+    out = io.BytesIO()
+    writer = ParallelGzipWriter(out, block_bytes=1000)
+    writer.write(b'first')
+    writer.flush()
+    assert gzip.decompress(out.getvalue()) == b'first'
+    writer.write(b' second')
+    writer.close()
+    assert gzip.decompress(out.getvalue()) == b'first second'
+
+def test_write_after_close():
+    writer = ParallelGzipWriter(io.BytesIO())
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.write(b'x')
+
+def test_gzip_file(tmp_path):
+    data = sample(300000)
+    in_name = str(tmp_path / 'in.sdf')
+    with open(in_name, 'wb') as f:
+        f.write(data)
+    out_name = str(tmp_path / 'in.sdf.gz')
+    bytes_in, bytes_out = gzip_file(in_name, out_name, threads=3, block_bytes=65536)
+    assert bytes_in == len(data)
+    assert bytes_out == os.path.getsize(out_name)
+    with gzip.open(out_name, 'rb') as f:
+        assert f.read() == data
+
+def test_members_read_by_the_result_writer():
+    data = sample(3000000)
+    out = io.BytesIO()
+    _gunzip_to(memoryview(compress(data, block_bytes=SquonkGzip.DEFAULT_BLOCK_BYTES)), out)
+    assert out.getvalue() == data
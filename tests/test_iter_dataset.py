@@ -0,0 +1,55 @@
+import io
+import json
+import os
+
+import pytest
+
+import utils
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+records = [ { 'uuid': '1', 'source': 'C', 'values': { 'name': 'a "quoted" [name]' } },
+            { 'uuid': '2', 'source': 'CC', 'values': { 'name': 'back\\slash }', 'list': [1, [2]] } },
+            { 'uuid': '3', 'source': 'CCC', 'values': { 'name': 'é中' } } ]
+
+def parse(text, **kwargs):
+    return list(utils.iter_dataset(io.StringIO(text), **kwargs))
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 1024])
+def test_records_straddling_reads(chunk_size):
+    text = json.dumps(records, indent=1)
+    assert parse(text, chunk_size=chunk_size) == records
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 1024])
+def test_skip_and_limit(chunk_size):
+    text = json.dumps(records)
+    assert parse(text, skip=1, chunk_size=chunk_size) == records[1:]
+    assert parse(text, skip=2, limit=5, chunk_size=chunk_size) == records[2:]
+    assert parse(text, skip=1, limit=1, chunk_size=chunk_size) == records[1:2]
+    assert parse(text, skip=10, chunk_size=chunk_size) == []
+    assert parse(text, limit=0, chunk_size=chunk_size) == []
+
+def test_empty():
+    assert parse('') == []
+    assert parse(' [ ] ') == []
+    assert parse('[]\n') == []
+
+def test_not_an_array():
+    with pytest.raises(ValueError):
+        parse('{"uuid": "1"}')
+
+@pytest.mark.parametrize('text', ['[{"uuid": "1"}, {"uuid": ', '[{"uuid": "1"}', '['])
+def test_truncated(text):
+    with pytest.raises(ValueError):
+        parse(text, chunk_size=4)
+
+def test_truncated_while_skipping():
+    with pytest.raises(ValueError):
+        parse('[{"uuid": "1"}, {"uuid": "2', skip=2, chunk_size=4)
+
+def test_read_dataset_matches_json():
+    file_name = os.path.join(DATA, 'Kinase_inhibs.json.gz')
+    with utils.open_file(file_name) as f:
+        expected = json.load(f)
+    assert list(utils.read_dataset(file_name)) == expected
+    assert list(utils.read_dataset(file_name, skip=5, limit=3)) == expected[5:8]
@@ -0,0 +1,146 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+from squonk import Squonk
+from SquonkFakeServer import SquonkFakeServer
+from SquonkManifest import load_manifest, run_manifest, summary
+from utils import is_gzip
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SLICE = 'core.dataset.filter.slice.v1'
+
+MANIFEST = """
+defaults:
+  service_name: core.dataset.filter.slice.v1
+  options:
+    skip: 0
+  inputs:
+    input:
+      data: data/Kinase_inhibs.json.gz
+      meta: data/Kinase_inhibs.metadata
+jobs:
+  - name: first10
+    options:
+      count: 10
+  - name: next5
+    options:
+      skip: 10
+      count: 5
+---
+- service_name: core.dataset.filter.slice.v1
+  options:
+    count: 3
+  inputs:
+    input:
+      data: data/Kinase_inhibs.json.gz
+      meta: data/Kinase_inhibs.metadata
+"""
+
+def write(tmp_path, text, name='manifest.yaml'):
+    file_name = str(tmp_path / name)
+    with open(file_name, 'w') as f:
+        f.write(text)
+    return file_name
+
+def read_text(file_name):
+    """
+    The text of a result file, which is kept gzipped if it was sent so
+    """
+    with open(file_name, 'rb') as f:
+        content = f.read()
+    return (gzip.decompress(content) if is_gzip(content) else content).decode()
+
+def count_records(file_name):
+    return read_text(file_name).count('"uuid"')
+
+def test_defaults_are_merged(tmp_path):
+    jobs = load_manifest(write(tmp_path, MANIFEST))
+    assert [job['name'] for job in jobs] == ['first10', 'next5', SLICE + '-3']
+    # the job's options are merged over the defaults
+    assert jobs[0]['options'] == { 'skip': 0, 'count': 10 }
+    assert jobs[1]['options'] == { 'skip': 10, 'count': 5 }
+    assert jobs[0]['inputs'] == jobs[1]['inputs']
+    # defaults apply to all the jobs after them, in later documents too
+    assert jobs[2]['options'] == { 'skip': 0, 'count': 3 }
+
+def test_later_defaults_replace_earlier(tmp_path):
+    text = """
+defaults:
+  service_name: a
+  inputs: {}
+jobs:
+  - name: one
+---
+defaults:
+  service_name: b
+---
+name: two
+inputs: {}
+"""
+    jobs = load_manifest(write(tmp_path, text))
+    assert [(job['name'], job['service_name'], job['options']) for job in jobs] == [('one', 'a', {}), ('two', 'b', {})]
+
+def test_missing_section(tmp_path):
+    with pytest.raises(Exception, match='job 1 missing section: inputs'):
+        load_manifest(write(tmp_path, 'service_name: a\n'))
+
+def test_duplicate_names(tmp_path):
+    with pytest.raises(Exception, match='same name'):
+        load_manifest(write(tmp_path, """
+- { name: one, service_name: a, inputs: {} }
+- { name: one, service_name: b, inputs: {} }
+"""))
+
+def test_run_manifest(fake_server, tmp_path, monkeypatch):
+    # the inputs are relative to the current directory
+    monkeypatch.chdir(root)
+    jobs = load_manifest(write(tmp_path, MANIFEST))
+    squonk = Squonk(config=fake_server.config())
+    results = run_manifest(squonk, jobs, str(tmp_path / 'out'), concurrency=2, wait=0.05)
+    assert [(result['name'], result['status']) for result in results] == \
+        [('first10', 'RESULTS_READY'), ('next5', 'RESULTS_READY'), (SLICE + '-3', 'RESULTS_READY')]
+    for name, count in [('first10', 10), ('next5', 5), (SLICE + '-3', 3)]:
+        assert count_records(str(tmp_path / 'out' / name / 'output_output.data')) == count
+    assert summary(results).splitlines()[-1] == '3 jobs: 3 ok, 0 failed'
+
+def test_failures_are_reported(tmp_path, monkeypatch):
+    monkeypatch.chdir(root)
+    server = SquonkFakeServer(yaml_dir=os.path.join(root, 'yaml'), job_seconds=0.05, fail_rate=1)
+    server.start()
+    try:
+        jobs = load_manifest(write(tmp_path, MANIFEST))
+        # an input that isn't there fails the job without stopping the others
+        jobs[1]['inputs'] = { 'input': { 'data': 'data/missing.json.gz', 'meta': 'data/missing.metadata' } }
+        results = run_manifest(Squonk(config=server.config()), jobs, str(tmp_path / 'out'), wait=0.05)
+    finally:
+        server.stop()
+    statuses = [result['status'] for result in results]
+    assert statuses[0] == 'ERROR' and statuses[2] == 'ERROR'
+    assert statuses[1] != 'RESULTS_READY'
+    assert summary(results).splitlines()[-1] == '3 jobs: 0 ok, 3 failed'
+
+@pytest.mark.parametrize('name', ['../x', '/tmp/x', 'a/b', '..', '.', ''])
+def test_names_must_be_directory_names(tmp_path, name):
+    with pytest.raises(Exception, match='not a directory name'):
+        load_manifest(write(tmp_path, 'name: "{}"\nservice_name: a\ninputs: {{}}\n'.format(name)))
+    with pytest.raises(Exception, match='not a directory name'):
+        run_manifest(None, [ { 'name': name, 'service_name': 'a', 'inputs': {} } ], str(tmp_path))
+    assert os.listdir(str(tmp_path)) == ['manifest.yaml']
+
+def test_inputs_relative_to_the_manifest(fake_server, tmp_path, monkeypatch):
+    batch = tmp_path / 'batch'
+    (batch / 'data').mkdir(parents=True)
+    for name in ['Kinase_inhibs.json.gz', 'Kinase_inhibs.metadata']:
+        shutil.copy(os.path.join(root, 'data', name), str(batch / 'data' / name))
+    manifest = write(batch, MANIFEST)
+    # run from elsewhere
+    monkeypatch.chdir(str(tmp_path))
+    jobs = load_manifest(manifest)
+    assert jobs[0]['inputs']['input']['data'] == str(batch / 'data' / 'Kinase_inhibs.json.gz')
+    results = run_manifest(Squonk(config=fake_server.config()), jobs[:1], 'out', wait=0.05)
+    assert results[0]['status'] == 'RESULTS_READY'
+    assert count_records(str(tmp_path / 'out' / 'first10' / 'output_output.data')) == 10
@@ -0,0 +1,123 @@
+import os
+import urllib.request
+
+from squonk import Squonk
+from SquonkMetrics import SquonkMetrics
+from SquonkTiming import AuthTiming, JobEvent, JobTimeline, RequestTiming
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def samples(text):
+    """
+    The samples of metrics text, as a dict of name with labels to value
+    """
+    out = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            out[name] = float(value)
+    return out
+
+def test_requests():
+    metrics = SquonkMetrics()
+    metrics(RequestTiming('GET', '/jobs/{id}', 200, 0, 100, 0.001, 0.002, 0))
+    metrics(RequestTiming('GET', '/jobs/{id}', 200, 0, 50, 0.01, 0.3, 1))
+    metrics(RequestTiming('POST', '/jobs', 503, 1000, 0, 0.1, 0.1, 2))
+    values = samples(metrics.render())
+    assert values['squonk_requests_total{method="GET",endpoint="/jobs/{id}",status="200"}'] == 2
+    assert values['squonk_requests_total{method="POST",endpoint="/jobs",status="503"}'] == 1
+    assert values['squonk_request_retries_total{method="GET",endpoint="/jobs/{id}"}'] == 1
+    assert values['squonk_request_sent_bytes_total{method="POST",endpoint="/jobs"}'] == 1000
+    assert values['squonk_request_received_bytes_total{method="GET",endpoint="/jobs/{id}"}'] == 150
+    # the histogram buckets are cumulative
+    get = '{method="GET",endpoint="/jobs/{id}",le="'
+    assert values['squonk_request_seconds_bucket' + get + '0.005"}'] == 1
+    assert values['squonk_request_seconds_bucket' + get + '0.25"}'] == 1
+    assert values['squonk_request_seconds_bucket' + get + '0.5"}'] == 2
+    assert values['squonk_request_seconds_bucket' + get + '+Inf"}'] == 2
+    assert values['squonk_request_seconds_count{method="GET",endpoint="/jobs/{id}"}'] == 2
+    assert values['squonk_request_seconds_sum{method="GET",endpoint="/jobs/{id}"}'] == 0.302
+
+def test_auth():
+    metrics = SquonkMetrics(prefix='test')
+    metrics(AuthTiming('new', 0.2, True))
+    metrics(AuthTiming('refresh', 0.05, False))
+    values = samples(metrics.render())
+    assert values['test_auth_total{grant="new",ok="true"}'] == 1
+    assert values['test_auth_total{grant="refresh",ok="false"}'] == 1
+    assert values['test_auth_seconds_count{grant="refresh"}'] == 1
+
+def test_jobs_in_flight():
+    metrics = SquonkMetrics()
+    timelines = [ JobTimeline('slice', 'job' + str(n)) for n in range(3) ]
+    for timeline in timelines:
+        timeline.upload_bytes = 10
+        metrics(JobEvent('started', timeline))
+    metrics(JobEvent('polled', timelines[0]))
+    timelines[0].status = 'RESULTS_READY'
+    timelines[0].finished = timelines[0].created + 2
+    timelines[0].download_bytes = 5
+    metrics(JobEvent('finished', timelines[0]))
+    values = samples(metrics.render())
+    assert values['squonk_jobs_started_total{service="slice"}'] == 3
+    assert values['squonk_jobs_in_flight{service="slice"}'] == 2
+    assert values['squonk_job_polls_total{service="slice"}'] == 1
+    assert values['squonk_jobs_finished_total{service="slice",status="RESULTS_READY"}'] == 1
+    assert values['squonk_upload_bytes_total{service="slice"}'] == 30
+    assert values['squonk_download_bytes_total{service="slice"}'] == 5
+    assert values['squonk_job_seconds_bucket{service="slice",le="5"}'] == 1
+    assert values['squonk_job_seconds_bucket{service="slice",le="1"}'] == 0
+    # never seen running
+    assert 'squonk_job_queue_seconds_count{service="slice"}' not in values
+
+def test_format():
+    metrics = SquonkMetrics()
+    metrics(RequestTiming('GET', 'a"b\\c\nd', 200, 0, 0, 0, 0, 0))
+    text = metrics.render()
+    assert text.endswith('\n')
+    assert 'endpoint="a\\"b\\\\c\\nd"' in text
+    # every metric has its help and type, even with no samples yet
+    assert '# HELP squonk_jobs_in_flight Jobs started and not yet finished\n# TYPE squonk_jobs_in_flight gauge\n' in text
+    assert text.count('# TYPE') == len(metrics._metrics)
+
+def test_textfile(tmp_path):
+    metrics = SquonkMetrics()
+    file_name = str(tmp_path / 'squonk.prom')
+    metrics(AuthTiming('new', 0.2, True))
+    metrics.start_textfile(file_name, interval=60)
+    try:
+        metrics.write_textfile(file_name)
+        with open(file_name) as f:
+            assert f.read() == metrics.render()
+    finally:
+        metrics.stop()
+    assert os.listdir(str(tmp_path)) == ['squonk.prom']
+
+def test_serve():
+    metrics = SquonkMetrics()
+    metrics(AuthTiming('new', 0.2, True))
+    port = metrics.serve(0)
+    try:
+        with urllib.request.urlopen('http://127.0.0.1:{}/metrics'.format(port)) as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert response.read().decode() == metrics.render()
+    finally:
+        metrics.stop()
+
+def test_job_against_fake_server(fake_server, tmp_path):
+    metrics = SquonkMetrics()
+    squonk = Squonk(config=fake_server.config(), observers=[metrics])
+    inputs = { 'input': { 'data': os.path.join(root, 'data', 'Kinase_inhibs.json.gz'),
+                          'meta': os.path.join(root, 'data', 'Kinase_inhibs.metadata') } }
+    job_id = squonk.run_job('core.dataset.filter.slice.v1', { 'count': 5 }, inputs)
+    assert squonk.job_wait(job_id, dir=str(tmp_path), sleep=0.05) == 'RESULTS_READY'
+    values = samples(metrics.render())
+    service = '{service="core.dataset.filter.slice.v1"}'
+    assert values['squonk_jobs_started_total' + service] == 1
+    assert values['squonk_jobs_in_flight' + service] == 0
+    assert values['squonk_jobs_finished_total{service="core.dataset.filter.slice.v1",status="RESULTS_READY"}'] == 1
+    assert values['squonk_job_polls_total' + service] >= 1
+    assert values['squonk_upload_bytes_total' + service] > 0
+    assert values['squonk_download_bytes_total' + service] > 0
+    assert values['squonk_auth_total{grant="new",ok="true"}'] == 1
+    assert sum(value for name, value in values.items() if name.startswith('squonk_requests_total')) >= 3
@@ -0,0 +1,63 @@
+import gzip
+import io
+import json
+import os
+import shutil
+
+import utils
+from SquonkDatasetWriter import write_squonk, write_squonk_parallel
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+def without_uuids(records):
+    return [ { key: value for key, value in record.items() if key != 'uuid' } for record in records ]
+
+def convert(file_name, chunk_bytes):
+    out = io.StringIO()
+    meta = write_squonk_parallel(file_name, out, workers=2, chunk_bytes=chunk_bytes)
+    return json.loads(out.getvalue()), meta
+
+# small chunks so the file is split into many, in order
+def test_matches_serial_conversion(tmp_path):
+    file_name = str(tmp_path / 'dhfr_3d.sdf')
+    with gzip.open(os.path.join(DATA, 'dhfr_3d.sdf.gz'), 'rb') as f, open(file_name, 'wb') as out:
+        shutil.copyfileobj(f, out)
+    expected, expected_meta, rc = utils.tosquonk(file_name)
+    records, meta = convert(file_name, 4096)
+    assert without_uuids(records) == without_uuids(expected)
+    assert meta['size'] == len(expected)
+    assert set(meta['valueClassMappings']) == set(expected_meta['valueClassMappings'])
+
+def test_gzipped_input():
+    file_name = os.path.join(DATA, 'dhfr_3d.sdf.gz')
+    expected = utils.tosquonk(file_name)[0]
+    records, meta = convert(file_name, 4096)
+    assert without_uuids(records) == without_uuids(expected)
+
+def test_one_chunk_without_final_terminator(tmp_path):
+    file_name = str(tmp_path / 'benzene.sdf')
+    with open(os.path.join(DATA, 'benzene.sdf')) as f:
+        text = f.read().rstrip().rstrip('$')
+    with open(file_name, 'w') as f:
+        f.write(text)
+    records, meta = convert(file_name, 1024 * 1024)
+    assert len(records) == meta['size'] == 1
+
+# characters str.splitlines splits at, but iterating over a file doesn't
+def test_line_separators_in_values_match_serial_conversion(tmp_path):
+    with open(os.path.join(DATA, 'benzene.sdf')) as f:
+        molecule = f.read().rstrip().rstrip('$').rstrip()
+    text = ''
+    for i, separator in enumerate(['\x0b', '\x0c', '\x1c', '\x1d', '\x1e', '\x85', '\u2028', '\u2029']):
+        text += molecule + '\n> <note>\nbefore{}after {}\n\n$$$$\n'.format(separator, i)
+    file_name = str(tmp_path / 'separators.sdf')
+    with open(file_name, 'w', encoding='utf-8', newline='') as f:
+        f.write(text.replace('\n', '\r\n'))
+    out = io.StringIO()
+    write_squonk(file_name, out)
+    expected = json.loads(out.getvalue())
+    assert len(expected) == 8
+    for chunk_bytes in [1, 1024 * 1024]:
+        records, meta = convert(file_name, chunk_bytes)
+        assert without_uuids(records) == without_uuids(expected)
+    assert expected[2]['values']['note'] == 'before\x1cafter 2'
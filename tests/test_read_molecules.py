@@ -0,0 +1,101 @@
+import gzip
+import os
+
+import pytest
+
+from utils import iter_molecules, read_molecules
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+MOLBLOCK = """benzene
+  test
+
+  6  6  0  0  0  0  0  0  0  0999 V2000
+    1.2124    0.7000    0.0000 C   0  0
+    0.0000    1.4000    0.0000 C   0  0
+   -1.2124    0.7000    0.0000 C   0  0
+   -1.2124   -0.7000    0.0000 C   0  0
+    0.0000   -1.4000    0.0000 C   0  0
+    1.2124   -0.7000    0.0000 C   0  0
+  1  2  2  0
+  2  3  1  0
+  3  4  2  0
+  4  5  1  0
+  5  6  2  0
+  6  1  1  0
+M  END
+"""
+
+def sdf(*records):
+    text = ''
+    for values in records:
+        text += MOLBLOCK
+        for name, value in values.items():
+            text += '> <{}>\n{}\n\n'.format(name, value)
+        text += '$$$$\n'
+    return text
+
+def test_records():
+    text = sdf({ 'name': 'one', 'weight': '78.1' }, { 'name': 'two' })
+    molecules = list(iter_molecules(text.splitlines(True)))
+    assert molecules == [ (MOLBLOCK, { 'name': 'one', 'weight': '78.1' }), (MOLBLOCK, { 'name': 'two' }) ]
+
+def test_no_trailing_terminator():
+    text = sdf({ 'name': 'one' }, { 'name': 'two' })
+    text = text[:-len('$$$$\n')]
+    molecules = list(iter_molecules(text.splitlines(True)))
+    assert molecules == [ (MOLBLOCK, { 'name': 'one' }), (MOLBLOCK, { 'name': 'two' }) ]
+    # nor a last newline
+    molecules = list(iter_molecules(text.rstrip('\n').splitlines(True)))
+    assert molecules[-1] == (MOLBLOCK, { 'name': 'two' })
+
+def test_no_trailing_terminator_or_properties():
+    text = sdf({ 'name': 'one' }) + MOLBLOCK
+    molecules = list(iter_molecules(text.splitlines(True)))
+    assert molecules == [ (MOLBLOCK, { 'name': 'one' }), (MOLBLOCK, {}) ]
+
+def test_empty_values():
+    text = sdf({ 'name': '', 'weight': '78.1', 'note': '' })
+    molblock, values = next(iter_molecules(text.splitlines(True)))
+    assert values == { 'name': '', 'weight': '78.1', 'note': '' }
+    assert list(values) == ['name', 'weight', 'note']
+
+def test_crlf():
+    text = sdf({ 'name': 'one', 'empty': '' }, { 'name': 'two' })
+    lf = list(iter_molecules(text.splitlines(True)))
+    crlf = list(iter_molecules(text.replace('\n', '\r\n').splitlines(True)))
+    assert crlf == lf
+    assert not any('\r' in molblock or '\r' in ''.join(values.values()) for molblock, values in crlf)
+
+def test_mol():
+    assert list(iter_molecules(MOLBLOCK.splitlines(True), 'mol')) == [ (MOLBLOCK, {}) ]
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+def test_read_molecules(tmp_path, newline):
+    text = sdf({ 'name': 'one', 'empty': '' }, { 'name': 'two' })[:-len('$$$$\n')]
+    expected = list(iter_molecules(text.splitlines(True)))
+    sdf_name = str(tmp_path / 'mols.sdf')
+    with open(sdf_name, 'w', newline=newline) as f:
+        f.write(text)
+    assert list(read_molecules(sdf_name)) == expected
+    gz_name = sdf_name + '.gz'
+    with gzip.open(gz_name, 'wt', newline=newline) as f:
+        f.write(text)
+    assert list(read_molecules(gz_name)) == expected
+
+def test_read_gzipped_file(tmp_path):
+    gz_name = os.path.join(DATA, 'dhfr_3d.sdf.gz')
+    sdf_name = str(tmp_path / 'dhfr_3d.sdf')
+    with gzip.open(gz_name, 'rb') as f_in, open(sdf_name, 'wb') as f_out:
+        f_out.write(f_in.read())
+    molecules = list(read_molecules(gz_name))
+    assert molecules == list(read_molecules(sdf_name))
+    with gzip.open(gz_name, 'rt') as f:
+        assert len(molecules) == sum(1 for line in f if line.startswith('$$$$'))
+
+def test_read_mol_file():
+    mol_name = os.path.join(DATA, 'pyrimethamine.mol')
+    molecules = list(read_molecules(mol_name))
+    assert len(molecules) == 1
+    molblock, values = molecules[0]
+    assert molblock.rstrip('\n').endswith('M  END') and values == {}
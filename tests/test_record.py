@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+from SquonkRecord import KeyTable, MoleculeRecord, iter_records
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(root, 'data')
+
+def read_records(file_name, table=None):
+    with open(os.path.join(DATA, file_name)) as f:
+        return list(iter_records(f, 'sdf', table))
+
+def test_to_dict():
+    table = KeyTable()
+    record = MoleculeRecord('mol\nM  END\n', table.get(['a', 'b']), ('1', 'x'), uuid='u1')
+    assert record.to_dict() == { 'uuid': 'u1', 'source': 'mol\nM  END\n', 'format': 'mol',
+                                 'values': { 'a': '1', 'b': 'x' } }
+    assert json.loads(record.to_json()) == record.to_dict()
+    assert record.get('b') == 'x'
+    assert record.get('c') is None and record.get('c', 0) == 0
+
+def test_uuid_is_generated_once():
+    record = MoleculeRecord('', KeyTable().get([]), ())
+    assert record._uuid is None
+    uuid = record.uuid
+    assert uuid and record.uuid == uuid
+    assert record.to_dict()['uuid'] == uuid
+
+def test_round_trip():
+    records = read_records('ChemblActivitiesFetcher1.sdf')
+    assert records
+    table = KeyTable()
+    for record in records:
+        data = json.loads(record.to_json())
+        copy = MoleculeRecord.from_dict(data, table)
+        assert copy.to_dict() == data
+        assert copy.to_json() == record.to_json()
+
+def test_round_trip_keeps_the_value_order():
+    data = { 'uuid': 'u1', 'source': 'mol\n', 'format': 'mol',
+             'values': { 'z': 1, 'a': 2.5, 'm': 'x' } }
+    record = MoleculeRecord.from_dict(data)
+    assert record.keys.names == ('z', 'a', 'm')
+    assert record.to_json() == json.dumps(data)
+
+def test_records_share_their_key_order():
+    table = KeyTable()
+    records = read_records('ChemblActivitiesFetcher1.sdf', table)
+    assert len(set(id(record.keys) for record in records)) == len(table._orders)
+    names = set()
+    for record in records:
+        names.update(record.keys.names)
+    assert set(table.names) == names
+    copies = [MoleculeRecord.from_dict(record.to_dict(), table) for record in records]
+    assert all(copy.keys is record.keys for copy, record in zip(copies, records))
+
+def test_unknown_attributes_are_rejected():
+    record = MoleculeRecord('', KeyTable().get(['a']), ('1',), uuid='u1')
+    with pytest.raises(AttributeError):
+        record.name = 'benzene'
+    with pytest.raises(AttributeError):
+        record.__dict__
+    with pytest.raises(AttributeError):
+        record.keys.extra = 1
+    record.values = ('2',)
+    assert record.get('a') == '2'
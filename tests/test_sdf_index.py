@@ -0,0 +1,106 @@
+import os
+import shutil
+
+import pytest
+
+import utils
+from SquonkSdfIndex import SquonkSdfIndex
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+def copy(tmp_path, name='mols.sdf'):
+    file_name = str(tmp_path / name)
+    shutil.copyfile(os.path.join(DATA, name), file_name)
+    return file_name
+
+def test_records_match_the_reader(tmp_path):
+    file_name = copy(tmp_path)
+    index = SquonkSdfIndex(file_name)
+    molecules = list(utils.read_molecules(file_name))
+    assert len(index) == len(molecules) == utils.count_records(file_name)
+    assert list(index.molecules()) == molecules
+    assert list(index.molecules(2, 4)) == molecules[2:4]
+    assert index[0].endswith('$$$$\n')
+    assert index[-1] == index[len(index) - 1]
+    assert index[1:3] == [index[1], index[2]]
+
+def test_shards_cover_the_file(tmp_path):
+    file_name = copy(tmp_path)
+    index = SquonkSdfIndex(file_name)
+    shards = index.shards(3)
+    assert shards[0][0] == 0
+    assert shards[-1][1] == index.offsets[-1]
+    assert all(shards[n][1] == shards[n + 1][0] for n in range(2))
+
+def test_record_without_terminator(tmp_path):
+    file_name = str(tmp_path / 'one.sdf')
+    with open(os.path.join(DATA, 'pyrimethamine.mol')) as f:
+        text = f.read()
+    with open(file_name, 'w') as f:
+        f.write(text + '$$$$\n' + text)
+    assert len(SquonkSdfIndex(file_name)) == 2
+
+def test_empty_file(tmp_path):
+    file_name = str(tmp_path / 'empty.sdf')
+    open(file_name, 'w').close()
+    assert len(SquonkSdfIndex(file_name)) == 0
+
+def test_saved_index_is_reused_until_the_file_changes(tmp_path):
+    file_name = copy(tmp_path)
+    count = len(SquonkSdfIndex(file_name, persist=True))
+    assert os.path.isfile(file_name + '.idx')
+    index = SquonkSdfIndex(file_name)
+    assert len(index) == count
+    with open(file_name, 'a') as f:
+        f.write(index[0])
+    assert len(SquonkSdfIndex(file_name)) == count + 1
+
+def test_gzipped_file_is_refused():
+    with pytest.raises(Exception, match='gzipped'):
+        SquonkSdfIndex(os.path.join(DATA, 'dhfr_3d.sdf.gz'))
+
+@pytest.mark.parametrize('keep', [0, 4, 8, 20, 40, -3])
+def test_short_index_is_rebuilt(tmp_path, keep):
+    file_name = copy(tmp_path)
+    offsets = SquonkSdfIndex(file_name, persist=True).offsets
+    index_name = file_name + '.idx'
+    with open(index_name, 'r+b') as f:
+        f.truncate(keep if keep >= 0 else os.path.getsize(index_name) + keep)
+    assert SquonkSdfIndex(file_name, persist=True).offsets == offsets
+    # and rewritten
+    with open(index_name, 'rb') as f:
+        assert f.read(8) == b'SQIX0001'
+    assert SquonkSdfIndex(file_name)._load()
+
+def test_index_is_only_rewritten_if_persist(tmp_path):
+    file_name = copy(tmp_path)
+    offsets = SquonkSdfIndex(file_name, persist=True).offsets
+    index_name = file_name + '.idx'
+    with open(index_name, 'r+b') as f:
+        f.truncate(20)
+    assert SquonkSdfIndex(file_name).offsets == offsets
+    assert os.path.getsize(index_name) == 20
+
+def test_corrupt_index_is_rebuilt(tmp_path):
+    file_name = copy(tmp_path)
+    index = SquonkSdfIndex(file_name, persist=True)
+    offsets = index.offsets
+    index.offsets = type(offsets)('Q', [0, os.path.getsize(file_name) * 2])
+    index.save()
+    assert SquonkSdfIndex(file_name).offsets == offsets
+    with open(file_name + '.idx', 'ab') as f:
+        f.write(b'junk')
+    assert SquonkSdfIndex(file_name).offsets == offsets
+
+def test_save_leaves_no_temporary_files(tmp_path):
+    file_name = copy(tmp_path)
+    SquonkSdfIndex(file_name, persist=True).save()
+    assert sorted(os.listdir(str(tmp_path))) == ['mols.sdf', 'mols.sdf.idx']
+
+def test_index_with_a_bad_count_is_rebuilt(tmp_path):
+    file_name = copy(tmp_path)
+    offsets = SquonkSdfIndex(file_name, persist=True).offsets
+    with open(file_name + '.idx', 'r+b') as f:
+        f.seek(8 + 16)
+        f.write((2 ** 62).to_bytes(8, 'little'))
+    assert SquonkSdfIndex(file_name).offsets == offsets
@@ -0,0 +1,47 @@
+import gzip
+import os
+
+import utils
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+# a molblock of n atoms, about 70 bytes an atom
+def molblock(n):
+    atoms = ''.join('{:10.4f}{:10.4f}{:10.4f} C   0  0  0  0  0  0  0  0  0  0  0  0\n'.format(i, 0, 0)
+                    for i in range(n))
+    return 'big\n  test\n\n{:3d}  0  0  0  0  0  0  0  0  0999 V2000\n'.format(n % 1000) + atoms + 'M  END\n'
+
+def write(tmp_path, name, text):
+    file_name = str(tmp_path / name)
+    with (gzip.open if name.endswith('.gz') else open)(file_name, 'wt') as f:
+        f.write(text)
+    return file_name
+
+def test_bundled_files():
+    assert utils.sniff(os.path.join(DATA, 'pyrimethamine.mol')) == ('mol', None)
+    assert utils.sniff(os.path.join(DATA, 'mols.sdf')) == ('sdf', None)
+    assert utils.sniff(os.path.join(DATA, 'dhfr_3d.sdf.gz')) == ('sdf', 'gzip')
+    assert utils.sniff(os.path.join(DATA, 'Kinase_inhibs.json.gz')) == ('data', 'gzip')
+    assert utils.sniff(os.path.join(DATA, 'Kinase_inhibs.metadata')) == ('meta', None)
+
+def test_mol_bigger_than_the_head(tmp_path):
+    text = molblock(500)
+    assert len(text) > utils.SNIFF_BYTES * 3
+    assert utils.sniff(write(tmp_path, 'big.mol', text)) == ('mol', None)
+    assert utils.sniff(write(tmp_path, 'big.mol.gz', text)) == ('mol', 'gzip')
+    assert utils.guess_type(text, False)['type'] == 'mol'
+
+def test_sdf_with_a_big_first_record(tmp_path):
+    text = molblock(500) + '> <name>\nbig\n\n$$$$\n' + molblock(2) + '$$$$\n'
+    assert utils.sniff(write(tmp_path, 'big.sdf', text)) == ('sdf', None)
+    assert utils.sniff(write(tmp_path, 'big.sdf.gz', text)) == ('sdf', 'gzip')
+    assert utils.peek(write(tmp_path, 'big.sdf', text), False)['nrecs'] == 2
+
+def test_sdf_records_in_the_head():
+    assert utils.sniff_data(molblock(2) + '$$$$\n' + molblock(2), False) == 'sdf'
+    assert utils.sniff_data(molblock(2) + '> <name>\n', False) == 'sdf'
+    assert utils.sniff_data(molblock(2)) == 'mol'
+
+def test_unknown(tmp_path):
+    assert utils.sniff_data('just some text') == 'unknown'
+    assert utils.sniff(write(tmp_path, 'text.gz', 'just some text')) == ('gzip', 'gzip')
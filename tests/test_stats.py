@@ -0,0 +1,62 @@
+import json
+import os
+import statistics
+
+import pytest
+
+import utils
+from SquonkStats import SquonkStats, dataset_stats
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+def test_counts_and_numbers():
+    stats = SquonkStats()
+    for values in [ { 'a': 1, 'b': 'x' }, { 'a': '3.5', 'b': 'y' }, { 'a': 'n/a' }, { 'c': True } ]:
+        stats.add(values)
+    results = stats.results()
+    assert stats.nrecs == 4
+    a = results['a']
+    assert (a['count'], a['missing'], a['distinct'], a['numeric']) == (3, 1, 3, 2)
+    assert (a['min'], a['max'], a['mean']) == (1, 3.5, 2.25)
+    assert a['exact']
+    assert 'numeric' not in results['b']
+    assert results['b']['histogram'] == { 'x': 1, 'y': 1 }
+    # booleans are not numbers
+    assert 'numeric' not in results['c']
+
+def test_chosen_fields_only():
+    stats = SquonkStats(fields=['a', 'z'])
+    stats.add({ 'a': 1, 'b': 2 })
+    assert set(stats.results()) == { 'a', 'z' }
+    assert stats.results()['z']['missing'] == 1
+
+def test_exact_quantiles():
+    stats = SquonkStats(quantiles=(0, 0.5, 1))
+    values = [5, 1, 4, 2, 3, 10]
+    for value in values:
+        stats.add({ 'v': value })
+    assert stats.results()['v']['quantiles'] == { '0': 1, '0.5': statistics.median(values), '1': 10 }
+
+def test_sampled_quantiles_and_capped_histogram():
+    stats = SquonkStats(max_distinct=10, sample_size=500)
+    for i in range(10000):
+        stats.add({ 'v': i })
+    v = stats.results()['v']
+    assert not v['exact']
+    assert v['truncated'] and v['distinct'] == 10
+    assert v['mean'] == pytest.approx(4999.5)
+    assert v['quantiles']['0.5'] == pytest.approx(5000, abs=1000)
+
+def test_table_and_json():
+    stats = SquonkStats()
+    stats.add({ 'v': 1, 's': 'x' })
+    assert 'records: 1' in stats.table()
+    assert json.loads(stats.to_json())['nrecs'] == 1
+
+def test_dataset_and_sdf_files():
+    file_name = os.path.join(DATA, 'Kinase_inhibs.json.gz')
+    stats = dataset_stats(file_name)
+    assert stats.nrecs == len(list(utils.read_dataset(file_name)))
+    stats = dataset_stats(os.path.join(DATA, 'mols.sdf'))
+    assert stats.nrecs == utils.count_records(os.path.join(DATA, 'mols.sdf'))
+    assert dataset_stats(os.path.join(DATA, 'Kinase_inhibs.metadata')) is None
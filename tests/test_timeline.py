@@ -0,0 +1,81 @@
+import json
+import os
+
+import pytest
+
+from squonk import Squonk
+from SquonkFakeServer import SquonkFakeServer
+from SquonkTiming import JobTimeline
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(root, 'data')
+
+SLICE = 'core.dataset.filter.slice.v1'
+
+def kinase_inputs():
+    return { 'input': { 'data': os.path.join(DATA, 'Kinase_inhibs.json.gz'),
+                        'meta': os.path.join(DATA, 'Kinase_inhibs.metadata') } }
+
+def test_phases_from_statuses():
+    timeline = JobTimeline('slice', 'job1')
+    timeline.submitted = 100.0
+    assert timeline.queue_seconds is None and timeline.run_seconds is None and timeline.server_seconds is None
+    timeline.observe('PENDING', 101.0)
+    timeline.observe('PENDING', 102.0)
+    timeline.observe('RUNNING', 103.5)
+    timeline.observe('RUNNING', 104.0)
+    timeline.observe('RESULTS_READY', 110.0)
+    assert timeline.polls == 5
+    # a status is timed from when it was first seen
+    assert timeline.statuses == [['PENDING', 101.0], ['RUNNING', 103.5], ['RESULTS_READY', 110.0]]
+    assert timeline.queue_seconds == 3.5
+    assert timeline.run_seconds == 6.5
+    assert timeline.server_seconds == 10.0
+
+def test_never_seen_running():
+    timeline = JobTimeline()
+    timeline.submitted = 100.0
+    timeline.observe('ERROR', 101.0)
+    assert timeline.queue_seconds is None and timeline.run_seconds is None
+    assert timeline.server_seconds == 1.0
+
+def test_job_on_fake_server(tmp_path):
+    server = SquonkFakeServer(yaml_dir=os.path.join(root, 'yaml'), queue_seconds=0.2, job_seconds=0.3)
+    server.start()
+    timeline_file = str(tmp_path / 'timelines.jsonl')
+    try:
+        squonk = Squonk(config=server.config(), timeline_file=timeline_file)
+        job_id = squonk.run_job(SLICE, { 'count': 5 }, kinase_inputs())
+        assert squonk.job_wait(job_id, dir=str(tmp_path), sleep=0.05) == 'RESULTS_READY'
+    finally:
+        server.stop()
+    timeline = squonk.job_timeline(job_id)
+    assert timeline.service == SLICE and timeline.status == 'RESULTS_READY'
+    assert [status for status, when in timeline.statuses] == ['PENDING', 'RUNNING', 'RESULTS_READY']
+    # the phases are in order
+    assert timeline.created <= timeline.submitted <= timeline.statuses[0][1] <= timeline.statuses[1][1] \
+        <= timeline.statuses[2][1] <= timeline.finished
+    assert timeline.queue_seconds == pytest.approx(0.2, abs=0.15)
+    assert timeline.run_seconds == pytest.approx(0.3, abs=0.15)
+    assert timeline.server_seconds == pytest.approx(timeline.queue_seconds + timeline.run_seconds)
+    assert timeline.upload_bytes > 0 and timeline.upload_seconds > 0
+    assert timeline.download_bytes > 0 and timeline.write_bytes > 0
+    assert timeline.polls >= 3
+
+    with open(timeline_file) as f:
+        lines = [json.loads(line) for line in f]
+    assert len(lines) == 1
+    line = lines[0]
+    assert set(line) == set(timeline.to_dict())
+    assert line['job_id'] == job_id and line['status'] == 'RESULTS_READY'
+    assert line['queue_seconds'] == timeline.queue_seconds
+    assert line['total_seconds'] == pytest.approx(timeline.finished - timeline.created)
+
+def test_a_line_per_job(fake_server, tmp_path):
+    timeline_file = str(tmp_path / 'timelines.jsonl')
+    squonk = Squonk(config=fake_server.config(), timeline_file=timeline_file)
+    job_ids = [ squonk.run_job(SLICE, { 'count': n }, kinase_inputs()) for n in [1, 2] ]
+    for job_id in job_ids:
+        assert squonk.job_wait(job_id, dir=str(tmp_path), sleep=0.05) == 'RESULTS_READY'
+    with open(timeline_file) as f:
+        assert [json.loads(line)['job_id'] for line in f] == job_ids
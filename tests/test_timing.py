@@ -0,0 +1,116 @@
+import datetime
+import os
+
+import pytest
+import requests
+
+from squonk import Squonk
+from SquonkAuth import SquonkAuth, SquonkAuthException
+from SquonkFakeServer import SquonkFakeServer, AUTH_PATH
+from SquonkTiming import AuthTiming, JobEvent, RequestTiming, TimingStats, endpoint_template, notify
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+JOB_ID = '0123456789abcdef0123456789abcdef'
+
+@pytest.mark.parametrize('request_path, template', [
+    ('services/', 'services'),
+    ('services/core.dataset.filter.slice.v1', 'services/core.dataset.filter.slice.v1'),
+    ('jobs/' + JOB_ID + '/status', 'jobs/{id}/status'),
+    ('jobs/123e4567-e89b-12d3-a456-426614174000?x=1', 'jobs/{id}'),
+    ('jobs/abc/results', 'jobs/abc/results') ])
+def test_endpoint_template(request_path, template):
+    assert endpoint_template(request_path) == template
+
+def test_notify_carries_on_after_a_failing_observer():
+    seen = []
+    def failing(timing):
+        raise ValueError('broken observer')
+    notify([failing, seen.append], 'timing')
+    assert seen == ['timing']
+
+def request_timing(latency, status=200, endpoint='jobs/{id}/status'):
+    return RequestTiming('get', endpoint, status, 10, 100, latency / 2, latency, 0)
+
+def test_percentiles():
+    stats = TimingStats()
+    for ms in range(1, 101):
+        stats(request_timing(ms / 1000))
+    summary = stats.summary()['requests']['get jobs/{id}/status']
+    assert summary['count'] == 100
+    assert summary['latency'] == { 'p50': 0.05, 'p90': 0.09, 'p99': 0.099 }
+    assert summary['ttfb']['p50'] == 0.025
+    assert summary['bytes_sent'] == 1000 and summary['bytes_received'] == 10000
+
+def test_errors_and_statuses():
+    stats = TimingStats()
+    for status in [200, 200, 404, 503, None]:
+        stats(request_timing(0.01, status))
+    stats(AuthTiming('new', 0.1, True))
+    stats(AuthTiming('refresh', 0.1, False))
+    # job events are not request timings
+    stats(JobEvent('started', None))
+    summary = stats.summary()
+    assert summary['requests']['get jobs/{id}/status']['errors'] == 3
+    assert summary['requests']['get jobs/{id}/status']['statuses'] == { '200': 2, '404': 1, '503': 1, 'None': 1 }
+    assert summary['auth'] == { 'new': { 'count': 1, 'errors': 0, 'latency': { 'p50': 0.1, 'p90': 0.1, 'p99': 0.1 } },
+                                'refresh': { 'count': 1, 'errors': 1, 'latency': { 'p50': 0.1, 'p90': 0.1, 'p99': 0.1 } } }
+    lines = stats.table().splitlines()
+    assert lines[0].split()[:3] == ['request', 'count', 'errors']
+    assert [line.split()[:2] for line in lines[2:]] == [['get', 'jobs/{id}/status'], ['auth', 'new'], ['auth', 'refresh']]
+    stats.reset()
+    assert stats.summary() == { 'requests': {}, 'auth': {} }
+
+def test_latencies_are_sampled():
+    stats = TimingStats(sample_size=10)
+    for i in range(1000):
+        stats(request_timing(0.001))
+    assert stats.summary()['requests']['get jobs/{id}/status']['count'] == 1000
+    assert len(stats._requests[('get', 'jobs/{id}/status')].latency) == 10
+
+def test_requests_against_fake_server(fake_server):
+    timings = []
+    stats = TimingStats()
+    squonk = Squonk(config=fake_server.config(), observers=[timings.append, stats])
+    assert 'core.dataset.filter.slice.v1' in squonk.list_service_ids()
+    squonk.job_status(JOB_ID)
+    requests_timed = [timing for timing in timings if isinstance(timing, RequestTiming)]
+    assert [(timing.method, timing.endpoint, timing.status) for timing in requests_timed] == \
+        [('get', 'services', 200), ('get', 'jobs/{id}/status', 404)]
+    for timing in requests_timed:
+        assert timing.bytes_received > 0 and timing.latency >= timing.ttfb > 0
+    assert [(timing.grant, timing.ok) for timing in timings if isinstance(timing, AuthTiming)] == [('new', True)]
+    summary = stats.summary()['requests']
+    assert summary['get jobs/{id}/status']['errors'] == 1
+    assert summary['get services']['errors'] == 0
+
+def test_failed_request_is_reported():
+    server = SquonkFakeServer(yaml_dir=os.path.join(root, 'yaml'))
+    server.start()
+    timings = []
+    squonk = Squonk(config=server.config(), observers=[timings.append])
+    server.stop()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        squonk.ping()
+    assert [(timing.endpoint, timing.status) for timing in timings if isinstance(timing, RequestTiming)] == \
+        [('ping', None)]
+
+def test_token_timings():
+    server = SquonkFakeServer(yaml_dir=os.path.join(root, 'yaml'), username='user', password='secret')
+    server.start()
+    try:
+        timings = []
+        auth = SquonkAuth(server.url + AUTH_PATH, 'user', 'wrong')
+        auth.add_observer(timings.append)
+        with pytest.raises(SquonkAuthException):
+            auth.authenticate()
+        auth = SquonkAuth(server.url + AUTH_PATH, 'user', 'secret')
+        auth.add_observer(timings.append)
+        auth.authenticate()
+        # near expiry, the token is refreshed
+        auth._access_token_expiry = datetime.datetime.now()
+        auth.check_token()
+    finally:
+        server.stop()
+    assert [(timing.grant, timing.ok) for timing in timings] == [('new', False), ('new', True), ('refresh', True)]
+    assert all(timing.seconds > 0 for timing in timings)
@@ -0,0 +1,123 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+from SquonkGzip import DEFAULT_LEVEL
+from SquonkJob import SquonkJob
+from squonk import Squonk
+from utils import is_gzip, mol2sdf
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+SERVICE = 'rdkit.calculators.canonical_smiles'
+OPTIONS = { 'query.mode': 'WHOLE_MOLECULE' }
+SLICE = 'core.dataset.filter.slice.v1'
+
+# the content of an input as the fake server received it
+def uploaded(server, job_id, name):
+    with open(os.path.join(server._dir, job_id, 'inputs', name), 'rb') as f:
+        return f.read()
+
+def read_bytes(file_name):
+    with open(file_name, 'rb') as f:
+        return f.read()
+
+@pytest.fixture
+def kinase_data(tmp_path):
+    data_name = str(tmp_path / 'Kinase_inhibs.json')
+    with gzip.open(os.path.join(DATA, 'Kinase_inhibs.json.gz'), 'rb') as f_in, open(data_name, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    return data_name
+
+def test_set_compression():
+    job = SquonkJob(None)
+    job.set_compression(True)
+    assert job._gzip_level == DEFAULT_LEVEL
+    job.set_compression(3, threads=2)
+    assert job._gzip_level == 3 and job._gzip_threads == 2
+    job.set_compression(False)
+    assert job._gzip_level is None and job._gzip_threads == 2
+    job.set_compression(0)
+    assert job._gzip_level is None
+
+def test_upload_bytes():
+    data = b'x' * 10000
+    job = SquonkJob(None)
+    assert job._upload_bytes('a', data) is data
+    job.set_compression(True)
+    content = job._upload_bytes('a', data)
+    assert gzip.decompress(content) == data
+    assert job.upload_stats == [{ 'file': 'a', 'bytes_in': len(data), 'bytes_out': len(content),
+                                  'seconds': job.upload_stats[0]['seconds'] }]
+    # already compressed data is sent as it is
+    assert job._upload_bytes('b', content) is content
+    assert len(job.upload_stats) == 1
+
+def test_upload_file(kinase_data):
+    job = SquonkJob(None)
+    with job._upload_file(kinase_data) as f:
+        assert f.read() == read_bytes(kinase_data)
+    job.set_compression(True)
+    with job._upload_file(kinase_data) as f:
+        assert gzip.decompress(f.read()) == read_bytes(kinase_data)
+    assert len(job.upload_stats) == 1
+    gz_name = os.path.join(DATA, 'Kinase_inhibs.json.gz')
+    with job._upload_file(gz_name) as f:
+        assert f.read() == read_bytes(gz_name)
+    assert len(job.upload_stats) == 1
+
+def test_uncompressed_data_is_uploaded_gzipped(fake_server, kinase_data, tmp_path):
+    squonk = Squonk(config=fake_server.config(), compress_uploads=True)
+    job_id = squonk.run_job(SLICE, { 'count': 5 },
+                            { 'input': { 'data': kinase_data,
+                                         'meta': os.path.join(DATA, 'Kinase_inhibs.metadata') } })
+    assert job_id
+    content = uploaded(fake_server, job_id, 'input_data.data')
+    assert is_gzip(content)
+    assert gzip.decompress(content) == read_bytes(kinase_data)
+    assert [stat['file'] for stat in squonk.upload_stats[job_id]] == [kinase_data]
+    assert squonk.job_wait(job_id, dir=str(tmp_path), sleep=0.05) == 'RESULTS_READY'
+
+def test_gzipped_data_is_not_compressed_twice(fake_server):
+    gz_name = os.path.join(DATA, 'Kinase_inhibs.json.gz')
+    squonk = Squonk(config=fake_server.config(), compress_uploads=True)
+    job_id = squonk.run_job(SLICE, { 'count': 5 },
+                            { 'input': { 'data': gz_name,
+                                         'meta': os.path.join(DATA, 'Kinase_inhibs.metadata') } })
+    assert job_id
+    assert uploaded(fake_server, job_id, 'input_data.data') == read_bytes(gz_name)
+    assert job_id not in squonk.upload_stats
+
+@pytest.mark.parametrize('file_name', ['mols.sdf', 'dhfr_3d.sdf.gz'])
+def test_sdf_converted_on_the_server(fake_server, file_name):
+    sdf_name = os.path.join(DATA, file_name)
+    squonk = Squonk(config=fake_server.config())
+    job_id = squonk.run_job(SERVICE, OPTIONS, { 'input': { 'sdf': sdf_name } }, compress=True)
+    assert job_id
+    content = uploaded(fake_server, job_id, 'input.sdf')
+    assert is_gzip(content)
+    if is_gzip(read_bytes(sdf_name)):
+        assert content == read_bytes(sdf_name)
+    else:
+        assert gzip.decompress(content) == read_bytes(sdf_name)
+
+def test_mol_converted_for_the_server(fake_server):
+    mol_name = os.path.join(DATA, 'pyrimethamine.mol')
+    squonk = Squonk(config=fake_server.config(), compress_uploads=True)
+    job_id = squonk.run_job(SERVICE, OPTIONS, { 'input': { 'mol': mol_name } })
+    assert job_id
+    assert gzip.decompress(uploaded(fake_server, job_id, 'input.sdf')) == mol2sdf(mol_name).encode()
+
+def test_converted_on_the_client(fake_server):
+    sdf_name = os.path.join(DATA, 'mols.sdf')
+    squonk = Squonk(config=fake_server.config(), compress_uploads=True)
+    job_id = squonk.run_job(SERVICE, OPTIONS, { 'input': { 'sdf': sdf_name } }, convert_onserver=False)
+    assert job_id
+    content = uploaded(fake_server, job_id, 'input_data.data')
+    assert is_gzip(content)
+    stat, = squonk.upload_stats[job_id]
+    assert len(gzip.decompress(content)) == stat['bytes_in']
+    assert len(content) == stat['bytes_out']
+    assert b'"source"' in gzip.decompress(content)
@@ -0,0 +1,159 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from squonk import Squonk
+from SquonkFakeServer import SquonkFakeServer
+from SquonkWatch import SquonkWatch, JOURNAL_NAME, PENDING_PER_JOB, _Inotify
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(root, 'data')
+TEMPLATE = os.path.join(root, 'yaml', 'rdkit.calculators.canonical_smiles.yaml')
+
+modes = ['poll']
+if _Inotify.create() is not None:
+    modes.append('inotify')
+
+class Watching:
+    """
+    Runs a watch in a thread while files are dropped in
+    """
+    def __init__(self, squonk, watch_dir, out_dir, mode, concurrency=2):
+        self.watch = SquonkWatch(squonk, watch_dir, out_dir, template=TEMPLATE, concurrency=concurrency,
+                                 poll_interval=0.1, settle=0.2, wait=0.05, use_inotify=mode == 'inotify')
+        self.thread = threading.Thread(target=self.watch.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        # let inotify set up its watches
+        time.sleep(0.3)
+        return self.watch
+
+    def __exit__(self, *args):
+        self.watch.stop()
+        self.thread.join(10)
+
+def drop(dir_name, name='benzene.sdf'):
+    os.makedirs(dir_name, exist_ok=True)
+    # moved in complete, as an instrument would
+    tmp_name = os.path.join(os.path.dirname(dir_name.rstrip('/')) or '.', '.' + name + '.tmp')
+    shutil.copyfile(os.path.join(DATA, 'benzene.sdf'), tmp_name)
+    os.replace(tmp_name, os.path.join(dir_name, name))
+
+def wait_for(watch, done, seconds=20):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        if watch.counts['done'] + watch.counts['failed'] >= done:
+            # anything wrongly picked up would show up by now
+            time.sleep(0.5)
+            return watch.counts
+        time.sleep(0.05)
+    return watch.counts
+
+@pytest.fixture
+def squonk(fake_server):
+    return Squonk(config=fake_server.config())
+
+@pytest.mark.parametrize('mode', modes)
+def test_output_directory_above_the_watched_one(squonk, tmp_path, monkeypatch, mode):
+    # the command line default, -o .
+    monkeypatch.chdir(tmp_path)
+    incoming = str(tmp_path / 'incoming')
+    os.mkdir(incoming)
+    drop(incoming, 'before.sdf')
+    with Watching(squonk, 'incoming', '.', mode) as watch:
+        drop(incoming, 'a.sdf')
+        drop(os.path.join(incoming, 'run2'), 'b.sdf')
+        counts = wait_for(watch, 3)
+    assert counts == { 'submitted': 3, 'done': 3, 'failed': 0 }
+    for name in ['before', 'a', 'run2/b']:
+        assert os.path.isfile(str(tmp_path / name / 'output_output.data'))
+
+@pytest.mark.parametrize('mode', modes)
+def test_output_directory_is_the_watched_one(squonk, tmp_path, mode):
+    watched = str(tmp_path)
+    with Watching(squonk, watched, watched, mode) as watch:
+        drop(watched, 'a.sdf')
+        counts = wait_for(watch, 1)
+    # the results written in the watched tree are not run
+    assert counts == { 'submitted': 1, 'done': 1, 'failed': 0 }
+    assert os.path.isfile(str(tmp_path / 'a' / 'output_output.data'))
+
+@pytest.mark.parametrize('mode', modes)
+def test_output_directory_inside_the_watched_one(squonk, tmp_path, mode):
+    watched = str(tmp_path)
+    with Watching(squonk, watched, str(tmp_path / 'out'), mode) as watch:
+        drop(str(tmp_path / 'outgoing'), 'a.sdf')
+        drop(watched, 'b.sdf')
+        counts = wait_for(watch, 2)
+    # outgoing is not the output directory out, though it starts the same
+    assert counts == { 'submitted': 2, 'done': 2, 'failed': 0 }
+    assert os.path.isfile(str(tmp_path / 'out' / 'outgoing' / 'a' / 'output_output.data'))
+    assert os.path.isfile(str(tmp_path / 'out' / 'b' / 'output_output.data'))
+
+def test_restart_skips_processed_files(squonk, tmp_path):
+    watched = str(tmp_path / 'in')
+    out = str(tmp_path / 'out')
+    drop(watched, 'a.sdf')
+    with Watching(squonk, watched, out, 'poll') as watch:
+        assert wait_for(watch, 1)['done'] == 1
+    assert os.path.isfile(os.path.join(out, JOURNAL_NAME))
+    drop(watched, 'b.sdf')
+    with Watching(squonk, watched, out, 'poll') as watch:
+        counts = wait_for(watch, 1)
+    assert counts == { 'submitted': 1, 'done': 1, 'failed': 0 }
+
+def test_files_that_are_not_inputs_are_skipped(squonk, tmp_path):
+    watched = str(tmp_path / 'in')
+    os.mkdir(watched)
+    with open(os.path.join(watched, 'notes.txt'), 'w') as f:
+        f.write('not a molecule')
+    with Watching(squonk, watched, str(tmp_path / 'out'), 'poll') as watch:
+        drop(watched, 'a.sdf')
+        counts = wait_for(watch, 1)
+    assert counts == { 'submitted': 1, 'done': 1, 'failed': 0 }
+
+def journal_statuses(out_dir):
+    with open(os.path.join(out_dir, JOURNAL_NAME)) as f:
+        return [json.loads(line)['status'] for line in f]
+
+@pytest.mark.parametrize('mode', modes)
+def test_stop_does_not_wait_for_queued_files(tmp_path, mode):
+    watched = str(tmp_path / 'in')
+    out = str(tmp_path / 'out')
+    for n in range(6):
+        drop(watched, '{}.sdf'.format(n))
+    server = SquonkFakeServer(yaml_dir=os.path.join(root, 'yaml'), job_seconds=60)
+    server.start()
+    try:
+        watching = Watching(Squonk(config=server.config()), watched, out, mode, concurrency=1)
+        with watching as watch:
+            deadline = time.time() + 10
+            while watch.counts['submitted'] < 1 and time.time() < deadline:
+                time.sleep(0.05)
+            # the rest wait to be queued
+            assert watch._executor._work_queue.qsize() <= PENDING_PER_JOB - 1
+            start = time.time()
+        assert not watching.thread.is_alive()
+        assert time.time() - start < 5
+    finally:
+        server.stop()
+    assert watch.counts == { 'submitted': 1, 'done': 0, 'failed': 0 }
+    assert journal_statuses(out) == ['submitted', 'stopped']
+
+def test_stopped_files_are_run_on_restart(squonk, tmp_path):
+    watched = str(tmp_path / 'in')
+    out = str(tmp_path / 'out')
+    drop(watched, 'a.sdf')
+    os.mkdir(out)
+    with open(os.path.join(out, JOURNAL_NAME), 'w') as f:
+        f.write(json.dumps({ 'file': 'a.sdf', 'size': os.path.getsize(os.path.join(watched, 'a.sdf')),
+                             'mtime_ns': os.stat(os.path.join(watched, 'a.sdf')).st_mtime_ns,
+                             'status': 'stopped' }) + '\n')
+    with Watching(squonk, watched, out, 'poll') as watch:
+        counts = wait_for(watch, 1)
+    assert counts == { 'submitted': 1, 'done': 1, 'failed': 0 }
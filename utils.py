@@ -3,9 +3,12 @@
 """
 
 import gzip
+import io
 import os
 import datetime
 import json
+import re
+import sys
 import time
 from uuid import uuid1
 from logging import debug, error
@@ -31,22 +34,9 @@ def tobasic(file_name):
     Returns a string containing the file data
     """
 
-    file_data = ''
-    file_base, file_ext = os.path.splitext(file_name)
-    if file_ext == '.gz':
-        file_base, file_ext = os.path.splitext(file_base)
-        debug('opening gzipped file:' + file_name)
-        with gzip.open(file_name, 'rt') as f:
-            file_data = f.read()
-    else:
-        debug('opening ordinary file:' + file_name)
-        with open(file_name, 'r') as f:
-            file_data = f.read()
-
-    json_data = json.loads(file_data)
     new_json=[]
     count=0
-    for mol in json_data:
+    for mol in read_dataset(file_name):
         count+=1
         mol['source'] = mol['values']['SMI']
         del(mol['values'])
@@ -85,6 +75,38 @@ def mol2sdf(file_name):
     file_data += "$$$$\n"
     return file_data
 
+def open_file(file_name, mode='rt'):
+    """
+    Opens a file for reading, gunzipping it on the fly if its name ends
+    in .gz
+
+    Parameters
+    ----------
+    file_name: str
+        name of the file. if it ends in gz is assumed to be gzipped
+    mode: str
+        mode to open the file in, 'rt' (default) or 'rb'
+
+    Returns
+    -------
+    Returns the open file object
+    """
+    if file_name.endswith('.gz'):
+        debug('opening gzipped file:' + file_name)
+        return gzip.open(file_name, mode)
+    debug('opening ordinary file:' + file_name)
+    return open(file_name, mode)
+
+def file_type(file_name):
+    """
+    Returns the type of a file from its extension, ignoring any .gz
+    eg 'sdf' for mols.sdf.gz
+    """
+    file_base, file_ext = os.path.splitext(file_name)
+    if file_ext == '.gz':
+        file_base, file_ext = os.path.splitext(file_base)
+    return file_ext[1:]
+
 def tosquonk(file_name,type=None):
     """
     Converts a mol or sdf format file to squonk data and meta data files.
@@ -106,38 +128,115 @@ def tosquonk(file_name,type=None):
        -return code
 
     """
-    file_data = ''
-    file_base, file_ext = os.path.splitext(file_name)
-    if file_ext == '.gz':
-        file_base, file_ext = os.path.splitext(file_base)
-        debug('opening gzipped file:' + file_name)
-        with gzip.open(file_name, 'rt') as f:
-            file_data = f.read()
-    else:
-        debug('opening ordinary file:' + file_name)
-        with open(file_name, 'r') as f:
-            file_data = f.read()
+    if not type:
+        type = file_type(file_name)
 
+    if type != 'mol' and type != 'sdf':
+        error('File: ' + file_name + ' is of wrong type ' + type)
+        return(' ', ' ', 1)
+
+    with open_file(file_name) as f:
+        return str2squonk(f, type, file_name)
+
+def read_molecules(file_name, type=None):
+    """
+    Reads a mol or sdf format file one molecule at a time.
+    Unzips the file on the fly if its name ends in .gz
+
+    Parameters
+    ----------
+    file_name: str
+        name of the file. if it ends in gz is assumed to be gzipped
+    type: str
+        type of file 'mol' or 'sdf'. If not specified determines it from 
+        the file name.
+
+    Returns
+    -------
+    Generator yielding a tuple (molblock, values) for each molecule.
+    See iter_molecules.
+    """
     if not type:
-        type = file_ext[1:]
-        
-    if type == 'mol':
-        return str2squonk(file_data, 'mol', file_name)
-    else:
-        if type == 'sdf':
-            return str2squonk(file_data, 'sdf', file_name)
-        else:
-            error('File: ' + file_name + ' is of wrong type ' + type)
-            return(' ', ' ', 1)
+        type = file_type(file_name)
+    with open_file(file_name) as f:
+        yield from iter_molecules(f, type)
 
-def str2squonk(squonk_string, type, file_name):
+def iter_molecules(lines, type='sdf'):
+    """
+    Splits mol or sdf format lines into molecules. Only one molecule is
+    held at a time so lines can come from a file handle or gzip stream of
+    any size.
+
+    Parameters
+    ----------
+    lines: iterable
+        lines of the file, eg an open file object or a list of strings.
+    type: str
+        type of file 'mol' or 'sdf'.
+
+    Returns
+    -------
+    Generator yielding a tuple for each molecule containing:
+       -the molblock (str), up to and including the M  END line
+       -dict of the sdf property values (empty for mol)
+    """
+    mol_lines = []
+    molblock = None
+    values = {}
+    name = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+
+        # reading the molblock
+        if molblock is None:
+            # end of a record with no M  END
+            if type == 'sdf' and line.startswith('$$$$'):
+                yield ("\n".join(mol_lines) + "\n", {})
+                mol_lines = []
+                continue
+            mol_lines.append(line)
+            if line.startswith('M  END'):
+                molblock = "\n".join(mol_lines) + "\n"
+                mol_lines = []
+                if type != 'sdf':
+                    yield (molblock, {})
+                    molblock = None
+            continue
+
+        # processing sdf properties
+        if name is not None:
+            values[name] = line.rstrip()
+            name = None
+        if line.startswith('> <'):
+            end_name = line.find('>', 3)
+            if end_name == -1:
+                error('Invalid SDF file format')
+            else:
+                name = sys.intern(line[3:end_name])
+
+        # found the end of the molecule
+        if line.startswith('$$$$'):
+            yield (molblock, values)
+            molblock = None
+            values = {}
+
+    # last record in an sdf file with no terminating $$$$
+    if molblock is not None:
+        yield (molblock, values)
+
+def str2squonk(squonk_string, type, file_name, compact=False):
     """
     Converts a mol format file as a string to squonk data and meta data files
 
     Parameters
     ----------
     squonk_string: str
-        data from the mol file.
+        data from the mol file, or an iterable of its lines such as
+        an open file object.
+    compact: bool
+        if true the data is a list of SquonkRecord.MoleculeRecord objects,
+        which take much less memory than dicts. Use their to_dict or
+        to_json methods, or SquonkDatasetWriter, to serialize them.
 
     Returns
     -------
@@ -149,103 +248,86 @@ def str2squonk(squonk_string, type, file_name):
     """
   
     debug('converting file of type: ' + type)
-    mol_count=0
-    in_mol=True
-    in_opts=False
-    got_name=False
     names={}
-    values={}
     lines=squonk_string
     if(isinstance(lines,str)):
         lines=squonk_string.splitlines()
 
-    today = datetime.date.today()
-    date_string = today.strftime("%d-%b-%Y %H:%M:%S UTC")
+    if compact:
+        try:
+            from .SquonkRecord import KeyTable, iter_records
+        except:
+            from SquonkRecord import KeyTable, iter_records
+        table = KeyTable()
+        mol_list = list(iter_records(lines, type, table))
+        meta_data = {}
+        if type == 'sdf':
+            meta_data = sdf_metadata(table.names, len(mol_list), file_name)
+        return (mol_list, meta_data, 0)
 
-    # start of the output data
+    # process each molecule in the file
     mol_list = []
-#   data='['
-
-    # process each line in the file
-    for line in lines:
-#       debug('LINE:'+line)
-
-        # start a new molecule def
-        if in_mol:
-            data = {}
-            data['uuid'] = str(uuid1())
-            mol_data = ''
-            in_mol = False
-            mol_count+=1
-
-        # processing options
-        if in_opts:
-            if got_name:
-                values[name] = line.rstrip()
-                got_name = False
-            if line.startswith('> <'):
-                end_name=line[3:].find('>')
-                if end_name == -1:
-                    error('Invalid SDF file format')
-                else:
-                    got_name = True
-                    name = line[3:end_name+3]
-                    names[name] = 1
-        else:
-            mol_data += line
-            mol_data += "\n"
-
-        # found the end of a molecule
-        if line.startswith('M  END'):
-            data['source'] = mol_data
-            data['format'] ='mol'
-            if type == 'sdf':
-                in_opts=True
-                values={}
-            else:
-                in_mol = True
-
-        # found the end of options in sdf file
-        if line.startswith('$$$$'):
-            in_mol = True
-            in_opts=False
-#           debug('end of opts sdf')
-            val_strings={}
-            for name, value in values.items():
-                 val_strings[name] = value
-            data['values'] = val_strings
-            mol_list.append(data)
-
-    # end of the data
+    for molblock, values in iter_molecules(lines, type):
+        for name in values:
+            names[name] = 1
+        data = {}
+        data['uuid'] = str(uuid1())
+        data['source'] = molblock
+        data['format'] = 'mol'
+        data['values'] = values
+        mol_list.append(data)
 
     meta_data={}
     # sdf meta data
     if type == 'sdf':
-        size = mol_count
-        meta_data['type'] = "org.squonk.types.MoleculeObject"
-        meta_data['size'] = size
-        val_strings={}
-        for name in names.keys():
-             type_str = 'java.lang.String'
-             val_strings[name] = type_str
-        meta_data['valueClassMappings'] = val_strings
-        base_name = os.path.basename(file_name)
-        metaprops = []
-        for name in names.keys():
-            metaprops.append(metaprop(name,date_string,base_name))
-        meta_data['fieldMetaProps'] = metaprops
-        properties = {}
-        properties['created'] = date_string
-        properties['source'] = 'SD file: ' + base_name 
-        properties['description'] = 'Read from SD file: ' + base_name
-        histories = []
-        for name in names.keys():
-            histories.append(history(name,date_string,file_name))
-        properties['history'] = "\n" . join(histories)
-        meta_data['properties'] = properties
+        meta_data = sdf_metadata(names, len(mol_list), file_name)
 
     return (mol_list, meta_data, 0)
 
+def sdf_metadata(names, size, file_name):
+    """
+    Creates the squonk meta data for a dataset read from an sdf file.
+
+    Parameters
+    ----------
+    names: iterable
+        names of the sdf properties, in order
+    size: int
+        number of records
+    file_name: str
+        name of the sdf file
+
+    Returns
+    -------
+    Returns a dict of the meta data
+    """
+    today = datetime.date.today()
+    date_string = today.strftime("%d-%b-%Y %H:%M:%S UTC")
+
+    meta_data={}
+    meta_data['type'] = "org.squonk.types.MoleculeObject"
+    meta_data['size'] = size
+    val_strings={}
+    for name in names:
+         type_str = 'java.lang.String'
+         val_strings[name] = type_str
+    meta_data['valueClassMappings'] = val_strings
+    base_name = os.path.basename(file_name)
+    metaprops = []
+    for name in names:
+        metaprops.append(metaprop(name,date_string,base_name))
+    meta_data['fieldMetaProps'] = metaprops
+    properties = {}
+    properties['created'] = date_string
+    properties['source'] = 'SD file: ' + base_name 
+    properties['description'] = 'Read from SD file: ' + base_name
+    histories = []
+    for name in names:
+        histories.append(history(name,date_string,file_name))
+    properties['history'] = "\n" . join(histories)
+    meta_data['properties'] = properties
+    return meta_data
+
 # format a fields metaproperty entry
 def metaprop(field,date,filename):
     data = {}
@@ -264,22 +346,149 @@ def history(field,date,filename):
     data += ' Added field ' + field
     return data
 
-def peek(file_name,report=True,field=None):
+# magic bytes at the start of binary file types
+GZIP_MAGIC = b'\x1f\x8b'
+ZIP_MAGIC = b'PK\x03\x04'
+PNG_MAGIC = b'\x89PNG\r\n\x1a\n'
+
+# number of bytes read from the start of a file to work out its type
+SNIFF_BYTES = 8192
+
+# messages reported for each file type
+type_messages = { 'data': 'Looks like squonk dataset',
+                  'meta': 'Looks like squonk meta data',
+                  'sdf': 'sdf file',
+                  'mol': 'mol file',
+                  'gzip': 'gzip file',
+                  'zip': 'zip file',
+                  'png': 'png image',
+                  'unknown': 'File type unknown' }
+
+def is_gzip(content):
+    """
+    Returns True if content (bytes) starts with the gzip magic number
+    """
+    return bytes(content[:2]) == GZIP_MAGIC
+
+def sniff(file_name, head_bytes=SNIFF_BYTES):
+    """
+    Works out the type of a file from the first few KB of it, using magic
+    bytes for binary and compressed files, so it is quick whatever the
+    size of the file. A molblock bigger than that is read to its end to
+    tell a mol file from an sdf. Gzipped files are recognised by their content rather
+    than their name, and the type of the data inside is returned.
+
+    Parameters
+    ----------
+    file_name: str
+        name of the file.
+    head_bytes: int
+        number of bytes to look at.
+
+    Returns
+    -------
+    Returns a tuple of:
+    - string file type: data, meta, sdf, mol, gzip, zip, png or unknown
+    - string compression: 'gzip' or None
+    """
+    with open(file_name, 'rb') as f:
+        head = f.read(head_bytes)
+        if head.startswith(ZIP_MAGIC):
+            return ('zip', None)
+        if head.startswith(PNG_MAGIC):
+            return ('png', None)
+        if not is_gzip(head):
+            return (_sniff_stream(f, head), None)
+    try:
+        with gzip.open(file_name, 'rb') as f:
+            file_type = _sniff_stream(f, f.read(head_bytes))
+    except (OSError, EOFError):
+        return ('gzip', 'gzip')
+    if file_type == 'unknown':
+        file_type = 'gzip'
+    return (file_type, 'gzip')
+
+# sniff the type of the data of a binary stream from its head (already read
+# from it). A molblock with no sdf records seen in the head could be a
+# mol file or the start of an sdf with a big first record, so the stream
+# is read on until a record is found or it ends.
+def _sniff_stream(f, head):
+    more = f.read(1)
+    file_type = sniff_data(head.decode('utf-8', errors='replace'), not more)
+    if file_type != 'mol' or not more:
+        return file_type
+    tail = head[-4:] + more
+    while True:
+        try:
+            block = f.read(SNIFF_BYTES)
+        except (OSError, EOFError):
+            # a truncated gzip file
+            block = None
+        if not block:
+            return 'mol'
+        text = tail + block
+        if b'$$$$' in text or b'> <' in text:
+            return 'sdf'
+        tail = text[-4:]
+
+def sniff_data(head, complete=True):
+    """
+    Works out the type of text data from its start.
+
+    Parameters
+    ----------
+    head: str
+        the start of the data
+    complete: bool
+        True if head is the whole of the data. If not, 'mol' means a
+        molblock with no sdf records or properties in head, and the rest
+        of the data has to be looked at to tell a mol file from an sdf
+        with a big first record (see sniff).
+
+    Returns
+    -------
+    Returns the string file type: data, meta, sdf, mol or unknown
+    """
+    start = head.lstrip()
+    if start[0:7] == '[{"uuid' or start[0:7] == '[{"sour':
+        return 'data'
+    if start[0:7] == '{"type"':
+        return 'meta'
+    end = head.find('M  END')
+    if end == -1 and not ('V2000' in head or 'V3000' in head):
+        return 'unknown'
+    # an sdf has properties or $$$$ after the first molblock
+    if '$$$$' in head or (end != -1 and '> <' in head[end:]):
+        return 'sdf'
+    return 'mol'
+
+def peek(file_name,report=True,field=None,scan=True):
     """
     Looks at a file and tries to guess what type it is
     Reports some information about the file.
-    Unzips the file first if it name ends in .gz
+    Only the start of the file is read to work out its type. The whole
+    file is only read to count records and field values if scan is True.
 
     Parameters
     ----------
     file_name: str
-        name of the file. if it ends in gz is assumed to be gzipped
+        name of the file. gzipped files are detected from their content.
     report: bool
         if true, writes out info about the file.
+    field: str
+        optional name of a field to count the values of.
+    scan: bool
+        if true (the default) reads the whole file to count the records
+        and field values.
 
     Returns
     -------
-    Returns a string representing the apparent file type
+    Returns a dict of:
+    - string representing the apparent file type
+    - string compression, 'gzip' or None
+    - int number of records
+    - dict values of field passed in
+    - boolean recent, True if the file changed in the last 10 minutes
     """
 
     mtime=os.path.getmtime(file_name)
@@ -292,22 +501,41 @@ def peek(file_name,report=True,field=None):
             print('File changed in last 10 minutes')
         else:
             print('ERROR - file older than 10 minutes')
-    file_data = ''
-    file_base, file_ext = os.path.splitext(file_name)
-    if file_ext == '.gz':
-        file_base, file_ext = os.path.splitext(file_base)
-        debug('opening gzipped file:' + file_name)
-        with gzip.open(file_name, 'rt') as f:
-            file_data = f.read()
-    else:
-        debug('opening ordinary file:' + file_name)
-        with open(file_name, 'r') as f:
-            file_data = f.read()
 
-    file_info = guess_type(file_data,report,field)
+    file_type, compression = sniff(file_name)
+    file_info = {'type': file_type, 'compression': compression, 'nrecs':0, 'fields': {} }
     file_info['recent'] = recent
+    if report:
+        print(type_messages[file_type], flush=True)
+    if not scan:
+        return file_info
+
+    if file_type == 'data':
+        with open_sniffed(file_name, compression) as f:
+            nrecs, fields = squonk_check(iter_dataset(f), report, field)
+    elif file_type == 'sdf' or file_type == 'mol':
+        # values are needed for the report or field counts, otherwise just
+        # count the records (count_records goes by the file name).
+        if field or report or (compression and not file_name.endswith('.gz')):
+            with open_sniffed(file_name, compression) as f:
+                nrecs, fields = sdf_check(f, file_type, report, field)
+        else:
+            nrecs = count_records(file_name, file_type)
+            fields = {}
+    else:
+        return file_info
+    file_info['nrecs'] = nrecs
+    file_info['fields'] = fields
     return file_info
 
+def open_sniffed(file_name, compression):
+    """
+    Opens a file for reading as text using the compression found by sniff
+    """
+    if compression == 'gzip':
+        return gzip.open(file_name, 'rt')
+    return open(file_name, 'r')
+
 def guess_type(file_data,report=True,field=None):
     """
     Looks at file_data and tries to guess what type it is
@@ -333,64 +561,297 @@ def guess_type(file_data,report=True,field=None):
             print('Less than 8 characters file type not known')
         return file_info
 
-    if file_data[0:7] == '[{"uuid' or file_data[0:7] == '[{"sour':
-        file_info['type'] = 'data'
-        if report:
-            print('Looks like squonk dataset')
-        
-        json_data = json.loads(file_data)
+    file_type = sniff_data(file_data)
+    file_info['type'] = file_type
+    if report:
+        print(type_messages[file_type])
+
+    if file_type == 'data':
+        json_data = iter_dataset(io.StringIO(file_data))
         nrecs, fields = squonk_check(json_data, report, field)
-        file_info['nrecs'] = nrecs
-        file_info['fields'] = fields
+    elif file_type == 'sdf' or file_type == 'mol':
+        nrecs, fields = sdf_check(file_data.splitlines(), file_type, report, field)
+    else:
         return file_info
+    file_info['nrecs'] = nrecs
+    file_info['fields'] = fields
+    return file_info
 
-    if file_data[0:7] == '{"type"':
-        file_info['type'] = 'meta'
-        if report:
-            print('Looks like squonk meta data')
-        return file_info
+def count_records(file_name, type=None):
+    """
+    Counts the records in a mol or sdf file without converting it.
+    Uncompressed sdf files are counted from their record offset index
+    (see SquonkSdfIndex), gzipped ones by scanning for $$$$ lines.
 
-    if 'M  END' in file_data:
-        if '$$$$' in file_data:
-            file_type = 'sdf'
-            file_info['type'] = file_type
-            if report:
-                print('sdf file')
-        else:
-            file_type = 'mol'
-            file_info['type'] = file_type
-            if report:
-                print('mol file')
-        data, meta, rcode = str2squonk(file_data, file_type, 'file_name')
-        if rcode == 0:
-            print('Converted to squonk, checking ...')
-        nrecs, fields = squonk_check(data, report, field)
-        file_info['nrecs'] = nrecs
-        file_info['fields'] = fields
-        return file_info
-    else:
-        if report:
-            print('File type unknown')
-    return file_info
+    Parameters
+    ----------
+    file_name: str
+        name of the file. if it ends in gz is assumed to be gzipped
+    type: str
+        type of file 'mol' or 'sdf'. If not specified determines it from 
+        the file name.
 
-def squonk_check(file_data, report, field):
-    json_data = file_data
-    nrecs = len(json_data)
+    Returns
+    -------
+    Returns the number of records
+    """
+    if not type:
+        type = file_type(file_name)
+    if type != 'sdf':
+        nrecs, fields = sdf_check(read_lines(file_name), type, False, None)
+        return nrecs
+    if not file_name.endswith('.gz'):
+        try:
+            from .SquonkSdfIndex import SquonkSdfIndex
+        except:
+            from SquonkSdfIndex import SquonkSdfIndex
+        return len(SquonkSdfIndex(file_name))
+    nrecs = 0
+    with open_file(file_name, 'rb') as f:
+        for line in f:
+            if line.startswith(b'$$$$'):
+                nrecs += 1
+    return nrecs
+
+def read_lines(file_name):
+    """
+    Generator yielding the lines of a (possibly gzipped) file
+    """
+    with open_file(file_name) as f:
+        yield from f
+
+def sdf_check(lines, type, report, field):
+    """
+    Counts the records in mol or sdf lines, and the values of field,
+    one molecule at a time.
+    """
+    nrecs = 0
+    fields = {}
+    for molblock, values in iter_molecules(lines, type):
+        nrecs += 1
+        if nrecs == 1 and report:
+            print('Values in first records:' + str(values))
+        if field and field in values:
+            fval = values[field]
+            if fval in fields:
+                fields[fval] += 1
+            else:
+                fields[fval] = 1
     if report:
         print('Number of Records:' + str(nrecs))
-    values = json_data[0]['values']
-    if report:
-        print('Values in first records:' + str(values))
+        if field:
+            print('values of: ' + field)
+            print(fields)
+    return (nrecs, fields)
+
+def squonk_check(file_data, report, field):
+    """
+    Counts the records in squonk data, and the values of field.
+
+    Parameters
+    ----------
+    file_data: iterable
+        the squonk records, eg a list or an iter_dataset generator
+    report: bool
+        if true, writes out info about the data.
+    field: str
+        optional name of a field to count the values of.
+
+    Returns
+    -------
+    Returns a tuple of the number of records and a dict of the counts
+    of each value of field.
+    """
+    nrecs = 0
     fields={}
-    if field:
-        for mol in json_data:
-            if field in mol['values']:
-                fval=mol['values'][field]
-                if fval in fields:
-                    fields[fval] += 1
-                else:
-                    fields[fval] = 1
-        if report:
+    for mol in file_data:
+        nrecs += 1
+        if nrecs == 1 and report:
+            print('Values in first records:' + str(mol['values']))
+        if field and field in mol['values']:
+            fval=mol['values'][field]
+            if fval in fields:
+                fields[fval] += 1
+            else:
+                fields[fval] = 1
+    if report:
+        print('Number of Records:' + str(nrecs))
+        if field:
             print('values of: ' + field)
             print(fields)
     return (nrecs, fields)
+
+def read_dataset(file_name, skip=0, limit=None):
+    """
+    Reads a squonk dataset file one record at a time.
+    Unzips the file on the fly if its name ends in .gz
+
+    Parameters
+    ----------
+    file_name: str
+        name of the file. if it ends in gz is assumed to be gzipped
+    skip: int
+        number of records to skip at the start
+    limit: int
+        maximum number of records to return (None for all)
+
+    Returns
+    -------
+    Generator yielding a dict for each record. See iter_dataset.
+    """
+    with open_file(file_name) as f:
+        yield from iter_dataset(f, skip, limit)
+
+# tokens that matter when skipping over json without decoding it
+_json_tokens = re.compile(r'[{}\[\]"]')
+_string_tokens = re.compile(r'["\\]')
+
+# whitespace between json values
+_json_space = re.compile(r'[ \t\n\r]*')
+
+def iter_dataset(stream, skip=0, limit=None, chunk_size=1024*1024):
+    """
+    Parses a squonk dataset (a json array of records) incrementally from
+    a text stream, holding only the current record and a read buffer in
+    memory. Skipped records are stepped over without being decoded.
+
+    Parameters
+    ----------
+    stream: file object
+        text stream of the dataset, eg from open_file
+    skip: int
+        number of records to skip at the start
+    limit: int
+        maximum number of records to return (None for all)
+    chunk_size: int
+        number of characters to read from the stream at a time
+
+    Returns
+    -------
+    Generator yielding a dict for each record.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    started = False
+    count = 0
+
+    while True:
+        if limit is not None and count >= limit:
+            return
+
+        # find the start of the next value, reading more if needed
+        pos = _json_space.match(buf, pos).end()
+        if pos >= len(buf):
+            if eof:
+                if started:
+                    raise ValueError('squonk dataset is truncated')
+                return
+            buf = buf[pos:] + stream.read(chunk_size)
+            pos = 0
+            eof = len(buf) == 0
+            continue
+        char = buf[pos]
+        if not started:
+            if char != '[':
+                raise ValueError('squonk dataset is not a json array')
+            started = True
+            pos += 1
+            continue
+        if char == ']':
+            return
+        if char == ',':
+            pos += 1
+            continue
+
+        # skip or decode the record. If it runs off the end of the buffer
+        # read more and try again.
+        end = -1
+        if skip:
+            end = _skip_value(buf, pos)
+        else:
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                end = -1
+        if end == -1:
+            if eof:
+                raise ValueError('squonk dataset is truncated or invalid')
+            more = stream.read(max(chunk_size, len(buf) - pos))
+            buf = buf[pos:] + more
+            pos = 0
+            eof = len(more) == 0
+            continue
+        pos = end
+        if skip:
+            skip -= 1
+        else:
+            count += 1
+            yield record
+
+# returns the end of the json object or array starting at pos, or -1 if it
+# is not complete in buf.
+def _skip_value(buf, pos):
+    depth = 0
+    in_string = False
+    while True:
+        if in_string:
+            match = _string_tokens.search(buf, pos)
+            if not match:
+                return -1
+            pos = match.end()
+            if match.group() == '\\':
+                pos += 1
+            else:
+                in_string = False
+        else:
+            match = _json_tokens.search(buf, pos)
+            if not match:
+                return -1
+            pos = match.end()
+            token = match.group()
+            if token == '"':
+                in_string = True
+            elif token == '{' or token == '[':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return pos
+
+# the yaml loader, the libyaml (C) one if it is available. yaml is only
+# imported when it is needed, to keep startup fast.
+def _yaml_loader():
+    import yaml
+    return getattr(yaml, 'CFullLoader', yaml.FullLoader)
+
+def load_yaml(file_name):
+    """
+    Reads a yaml file (eg a job definition), using libyaml if available.
+    """
+    import yaml
+    with open(file_name) as f:
+        return yaml.load(f, Loader=_yaml_loader())
+
+def load_yaml_all(file_name):
+    """
+    Reads all the documents of a multi-document yaml file, using libyaml
+    if available. Returns a list of the documents.
+    """
+    import yaml
+    with open(file_name) as f:
+        return list(yaml.load_all(f, Loader=_yaml_loader()))
+
+def resolve_input(file_name, yaml_dir):
+    """
+    Returns the path of an input file named in a job yaml (or manifest):
+    relative names are of files in the directory of the yaml file if they
+    are there, or else in the current directory.
+    """
+    if os.path.isabs(file_name):
+        return file_name
+    in_yaml_dir = os.path.join(yaml_dir, file_name)
+    if os.path.exists(in_yaml_dir):
+        return in_yaml_dir
+    return os.path.abspath(file_name)